@@ -4,6 +4,11 @@ Flask application factory for the MVP.
 - Creates the Flask app
 - Initializes the database (via db.py)
 - Registers blueprints (routes)
+- Registers CLI commands (commands.py)
+- Times each setup step (`flask startup-report`, see services/startup.py)
+
+Production servers should load `wsgi.py`, which also warms the app before
+workers fork.
 """
 
 from flask import Flask, jsonify
@@ -20,6 +25,16 @@ from routes.pages import bp as pages_bp
 from routes.botiquines import bp as botiquines_bp
 from routes.hardware import bp as hardware_bp
 from routes.companies import bp as companies_bp
+from routes.exports import bp as exports_bp
+from routes.events import bp as events_bp
+from routes.metrics import bp as metrics_bp, prometheus_bp
+from commands import register_commands
+from services.rollups import register_rollup_events
+from services.fragment_cache import FragmentCacheExtension
+from services.metrics import register_request_metrics
+from services.profiling import register_request_profiling
+from services.session_cache import load_principal
+from services.startup import app_timer
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMPLATES_DIR = os.path.join(BASE_DIR, "..", "frontend", "templates")
@@ -34,35 +49,51 @@ def create_app():
     Application factory: builds and configures the Flask app.
     """
     app = Flask(__name__, template_folder=TEMPLATES_DIR)
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    timer = app_timer(app)
+    # Before any other hook, so session/auth time counts in the latency metrics
+    register_request_metrics(app)
 
     # 1) Database setup
-    init_db(app)
+    with timer.phase("create_app: database"):
+        init_db(app)
+        register_rollup_events()
+        # After the SQL hooks: a profiled request's SQL is attached to its profile
+        register_request_profiling(app)
     app.secret_key = os.getenv("SECRET_KEY", "fallback-secret")
 
     # 2) Authentication setup
     login_manager.init_app(app)
 
-    from models.models import User
-
     @login_manager.user_loader
     def load_user(user_id: str):
+        # Served from the short-TTL principal cache; see services/session_cache.py
         if user_id is None:
             return None
         try:
-            return User.query.get(int(user_id))
+            return load_principal(int(user_id))
         except (TypeError, ValueError):
             return None
 
     # 3) Register blueprints
-    app.register_blueprint(medicines_bp, url_prefix="/api/medicines")
-    app.register_blueprint(users_bp)
-    app.register_blueprint(pages_bp)
-    app.register_blueprint(botiquines_bp, url_prefix="/api/botiquines")
-    app.register_blueprint(hardware_bp, url_prefix="/api/hardware")
-    app.register_blueprint(companies_bp, url_prefix="/api/comapnies")
-
-
-    # 4) Health check route (simple MVP check)
+    with timer.phase("create_app: blueprints"):
+        app.register_blueprint(medicines_bp, url_prefix="/api/medicines")
+        app.register_blueprint(users_bp)
+        app.register_blueprint(pages_bp)
+        app.register_blueprint(botiquines_bp, url_prefix="/api/botiquines")
+        app.register_blueprint(hardware_bp, url_prefix="/api/hardware")
+        app.register_blueprint(companies_bp, url_prefix="/api/comapnies")
+        app.register_blueprint(exports_bp, url_prefix="/api/export")
+        app.register_blueprint(events_bp, url_prefix="/api/events")
+        app.register_blueprint(metrics_bp, url_prefix="/api/metrics")
+        app.register_blueprint(prometheus_bp)
+
+    # 4) CLI commands (flask export ...)
+    with timer.phase("create_app: commands"):
+        register_commands(app)
+
+
+    # 5) Health check route (simple MVP check)
     @app.route("/health")
     def health():
         return jsonify({
@@ -0,0 +1,141 @@
+"""
+Concurrent sensor ingest benchmark.
+
+Starts the app on a local threaded server (SQLite database unless
+DATABASE_URL is set), adds --kits botiquines with 4 medicines each, then
+fires --payloads sensor posts from --concurrency threads and reports:
+
+- ingest throughput and latency percentiles
+- response statuses (409 = version conflicts that ran out of retries)
+- group committer counters (groups, average group size, commit time)
+
+Run from backend/ with and without group commit:
+
+    python benchmarks/ingest_group_commit.py
+    INGEST_GROUP_COMMIT=true python benchmarks/ingest_group_commit.py
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+os.environ.setdefault("HARDWARE_AUTH", "off")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+from werkzeug.serving import make_server  # noqa: E402
+
+import seed  # noqa: E402
+from app import app  # noqa: E402
+from db import db  # noqa: E402
+from models.models import Botiquin, Medicine  # noqa: E402
+from services.group_commit import committer  # noqa: E402
+
+
+def _percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]  # noqa: E731
+    return {
+        "p50_ms": round(pick(0.50) * 1000, 1),
+        "p95_ms": round(pick(0.95) * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 1),
+    }
+
+
+def _add_kits(count):
+    with app.app_context():
+        hardware_ids = []
+        for k in range(count):
+            kit = Botiquin(hardware_id=f"BENCH_{k:04d}", name=f"Bench {k}", company_id=1, total_compartments=4)
+            db.session.add(kit)
+            db.session.flush()
+            for compartment in range(1, 5):
+                db.session.add(Medicine(
+                    botiquin_id=kit.id, compartment_number=compartment, trade_name=f"Med {compartment}",
+                    generic_name="Generic", strength="500 mg", unit_weight=0.5, current_weight=10.0,
+                    quantity=20, reorder_level=5, expiry_date=date.today() + timedelta(days=365),
+                ))
+            hardware_ids.append(kit.hardware_id)
+        db.session.commit()
+        return hardware_ids
+
+
+def _post(base_url, hardware_id, rng):
+    body = json.dumps({
+        "hardware_id": hardware_id,
+        "sensor_type": "weight",
+        "compartments": [{"compartment": c, "weight": round(rng.uniform(0, 15), 1)} for c in range(1, 5)],
+    }).encode()
+    request = urllib.request.Request(
+        f"{base_url}/api/hardware/sensor_data", data=body,
+        headers={"Content-Type": "application/json"}, method="POST",
+    )
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - start
+
+
+def run(payloads, concurrency, kits):
+    seed.init_db()
+    hardware_ids = _add_kits(kits)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    rng = random.Random(7)
+    targets = [rng.choice(hardware_ids) for _ in range(payloads)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda hardware_id: _post(base_url, hardware_id, rng), targets))
+    duration = time.perf_counter() - start
+    server.shutdown()
+
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    ok = [elapsed for status, elapsed in results if status == 200]
+
+    return {
+        "payloads": payloads,
+        "concurrency": concurrency,
+        "kits": kits,
+        "statuses": statuses,
+        "ingest_throughput_per_s": round(len(ok) / duration, 1),
+        "ingest_latency": _percentiles(ok),
+        "group_commit": committer.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--payloads", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--kits", type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps(run(args.payloads, args.concurrency, args.kits), indent=2))
+
+
+if __name__ == "__main__":
+    main()
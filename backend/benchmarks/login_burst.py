@@ -0,0 +1,138 @@
+"""
+Login burst benchmark.
+
+Starts the app on a local threaded server (SQLite database), then fires a
+burst of concurrent logins while one client keeps polling a light API
+endpoint, and reports:
+
+- login throughput and latency percentiles
+- polling latency during the burst, compared with an idle baseline
+- password pool counters (completed / rejected / timed out)
+
+Run from backend/ and compare pool sizes, e.g.:
+
+    PASSWORD_POOL_WORKERS=0 python benchmarks/login_burst.py   # inline hashing
+    PASSWORD_POOL_WORKERS=2 python benchmarks/login_burst.py
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+os.environ.setdefault("HARDWARE_AUTH", "off")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+from werkzeug.serving import make_server  # noqa: E402
+
+import seed  # noqa: E402
+from app import app  # noqa: E402
+from services.passwords import pool  # noqa: E402
+
+
+def _percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]  # noqa: E731
+    return {
+        "p50_ms": round(pick(0.50) * 1000, 1),
+        "p95_ms": round(pick(0.95) * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 1),
+    }
+
+
+def _timed(request):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - start
+
+
+def _login(base_url):
+    body = json.dumps({"username": "demo_admin", "password": "password123"}).encode()
+    request = urllib.request.Request(
+        f"{base_url}/login", data=body, headers={"Content-Type": "application/json"}, method="POST"
+    )
+    return _timed(request)
+
+
+def _poll(base_url, stop, samples):
+    while not stop.is_set():
+        _, elapsed = _timed(urllib.request.Request(f"{base_url}/health"))
+        samples.append(elapsed)
+        time.sleep(0.01)
+
+
+def run(logins, concurrency, baseline_seconds):
+    seed.init_db()
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # Idle polling baseline
+    stop, idle = threading.Event(), []
+    poller = threading.Thread(target=_poll, args=(base_url, stop, idle))
+    poller.start()
+    time.sleep(baseline_seconds)
+    stop.set()
+    poller.join()
+
+    # Polling during the burst
+    stop, busy = threading.Event(), []
+    poller = threading.Thread(target=_poll, args=(base_url, stop, busy))
+    poller.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda _: _login(base_url), range(logins)))
+    duration = time.perf_counter() - start
+    stop.set()
+    poller.join()
+    server.shutdown()
+
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    ok = [elapsed for status, elapsed in results if status == 200]
+
+    return {
+        "password_pool_workers": pool.workers,
+        "logins": logins,
+        "concurrency": concurrency,
+        "statuses": statuses,
+        "login_throughput_per_s": round(len(ok) / duration, 1),
+        "login_latency": _percentiles(ok),
+        "poll_latency_idle": _percentiles(idle),
+        "poll_latency_during_burst": _percentiles(busy),
+        "pool": pool.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--baseline-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+    print(json.dumps(run(args.logins, args.concurrency, args.baseline_seconds), indent=2))
+
+
+if __name__ == "__main__":
+    main()
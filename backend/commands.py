@@ -0,0 +1,223 @@
+"""
+Flask CLI commands for maintenance tasks.
+
+Registered on the app by `create_app()`, so they run with:
+    flask --app app.py <command> ...
+"""
+
+import sys
+import click
+
+from db import db
+from models.models import Botiquin, DeviceKey
+from services.device_auth import issue_device_key, revoke_device_key
+from services.export import FORMATS, RESOURCES, stream_export
+from services.index_check import HOT_QUERIES, missing_indexes
+from services.medicine_import import ImportFormatError, import_medicines, parse_rows
+from services.rollups import rebuild_all
+
+
+def register_commands(app):
+    """Attach all custom CLI commands to the Flask app."""
+
+    @app.cli.command("export")
+    @click.argument("resource", type=click.Choice(sorted(RESOURCES)))
+    @click.option("--format", "fmt", type=click.Choice(FORMATS), default="jsonl", show_default=True)
+    @click.option("--output", "-o", type=click.Path(dir_okay=False), help="File to write (default: stdout).")
+    @click.option("--gzip", "compress", is_flag=True, help="Gzip-compress the output.")
+    @click.option("--botiquin-id", type=int, help="Filter medicines/hardware_logs by botiquin.")
+    @click.option("--company-id", type=int, help="Filter botiquines by company.")
+    @click.option("--status", help="Filter medicines by status (EXPIRED, LOW_STOCK, ...).")
+    @click.option("--processed", type=click.Choice(["true", "false"]), help="Filter hardware_logs by processed flag.")
+    def export_command(resource, fmt, output, compress, botiquin_id, company_id, status, processed):
+        """Stream RESOURCE (medicines, botiquines, hardware_logs) as JSONL or CSV."""
+        filters = {
+            "medicines": {"botiquin_id": botiquin_id, "status": status},
+            "botiquines": {"company_id": company_id},
+            "hardware_logs": {"botiquin_id": botiquin_id, "processed": processed},
+        }[resource]
+
+        out = open(output, "wb") if output else sys.stdout.buffer
+        try:
+            for chunk in stream_export(resource, fmt=fmt, compress=compress, **filters):
+                out.write(chunk)
+        finally:
+            if output:
+                out.close()
+
+    @app.cli.command("rollups-rebuild")
+    def rollups_rebuild_command():
+        """Recompute botiquin_rollups and company_rollups from scratch."""
+        kits, companies = rebuild_all()
+        click.echo(f"Rebuilt rollups for {kits} botiquines and {companies} companies")
+
+    @app.cli.group("device-keys")
+    def device_keys_group():
+        """Manage per-botiquin hardware API keys."""
+
+    @device_keys_group.command("issue")
+    @click.argument("hardware_id")
+    def device_keys_issue(hardware_id):
+        """Create a new key for the kit with HARDWARE_ID and print its secret once."""
+        botiquin = Botiquin.query.filter_by(hardware_id=hardware_id).first()
+        if not botiquin:
+            raise click.ClickException(f"No botiquin with hardware_id '{hardware_id}'")
+        key, secret = issue_device_key(botiquin)
+        db.session.commit()
+        click.echo(f"key_id: {key.key_id}")
+        click.echo(f"secret: {secret}")
+
+    @device_keys_group.command("issue-missing")
+    def device_keys_issue_missing():
+        """Issue a key to every active kit without one; prints hardware_id,key_id,secret (CSV)."""
+        has_key = db.session.query(DeviceKey.botiquin_id).filter(DeviceKey.active.is_(True))
+        kits = Botiquin.query.filter(Botiquin.active.is_(True), ~Botiquin.id.in_(has_key)).order_by(Botiquin.id)
+        click.echo("hardware_id,key_id,secret")
+        for botiquin in kits.all():
+            key, secret = issue_device_key(botiquin)
+            click.echo(f"{botiquin.hardware_id},{key.key_id},{secret}")
+        db.session.commit()
+
+    @device_keys_group.command("revoke")
+    @click.argument("key_id")
+    def device_keys_revoke(key_id):
+        """Deactivate KEY_ID."""
+        key = DeviceKey.query.filter_by(key_id=key_id).first()
+        if not key:
+            raise click.ClickException(f"Unknown key '{key_id}'")
+        revoke_device_key(key)
+        db.session.commit()
+        click.echo(f"Revoked {key_id}")
+
+    @device_keys_group.command("list")
+    @click.option("--hardware-id", help="Only keys of this kit.")
+    def device_keys_list(hardware_id):
+        """List keys (secrets are never printed)."""
+        query = DeviceKey.query.join(Botiquin).add_columns(Botiquin.hardware_id)
+        if hardware_id:
+            query = query.filter(Botiquin.hardware_id == hardware_id)
+        for key, hw_id in query.order_by(DeviceKey.id.asc()):
+            state = "active" if key.active else f"revoked {key.revoked_at:%Y-%m-%d}"
+            click.echo(f"{key.key_id}  {hw_id}  {state}")
+
+    @app.cli.command("check-indexes")
+    def check_indexes_command():
+        """Verify the database has an index for every hot query."""
+        missing = missing_indexes(db.engine)
+        for table, columns, description in missing:
+            click.echo(f"MISSING {table}({', '.join(columns)}) - {description}")
+        if missing:
+            click.echo("Run `flask --app app.py db upgrade` to apply pending migrations.")
+            sys.exit(1)
+        click.echo(f"All {len(HOT_QUERIES)} hot queries are covered by an index")
+
+    @app.cli.command("medicines-import")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--format", "fmt", type=click.Choice(["csv", "json"]),
+                  help="Input format (default: from the file extension).")
+    def medicines_import_command(path, fmt):
+        """Create or update medicines from a CSV or JSON file (matched on botiquin + compartment)."""
+        fmt = fmt or ("csv" if path.lower().endswith(".csv") else "json")
+        with open(path, encoding="utf-8-sig") as f:
+            payload = f.read()
+        try:
+            rows = parse_rows(payload, fmt)
+        except (ImportFormatError, ValueError) as e:
+            raise click.ClickException(f"Could not read {path}: {e}")
+
+        result = import_medicines(rows)
+        for row in result["results"]:
+            if row["status"] == "error":
+                click.echo(f"row {row['row']}: {'; '.join(row['errors'])}")
+        click.echo(f"{result['created']} created, {result['updated']} updated, {result['failed']} failed")
+        if result["failed"]:
+            sys.exit(1)
+
+    @app.cli.command("ingest-serve")
+    @click.option("--host", default="0.0.0.0", show_default=True)
+    @click.option("--port", type=int, default=5002, show_default=True)
+    def ingest_serve_command(host, port):
+        """Serve the device endpoints (sensor_data, test_connection) on an asyncio loop."""
+        from services.async_ingest import INGEST_DB_WORKERS, run_ingest_server, shared_state_problems
+
+        problems = shared_state_problems()
+        if problems:
+            raise click.UsageError("\n".join(problems))
+
+        def ready(server):
+            for sock in server.sockets:
+                address = sock.getsockname()
+                click.echo(f"Device ingest listening on {address[0]}:{address[1]} ({INGEST_DB_WORKERS} DB workers)")
+
+        run_ingest_server(app, host, port, ready)
+
+    @app.cli.command("startup-report")
+    @click.option("--top", type=int, default=25, show_default=True, help="Modules to list.")
+    def startup_report_command(top):
+        """Show import cost per module and the time of each init / warm-up step."""
+        from services.startup import app_timer, import_costs, warm_up
+
+        click.echo("Imports (fresh interpreter, python -X importtime):")
+        click.echo(f"{'self ms':>9}  {'cumul. ms':>9}  module")
+        for name, self_s, cumulative_s in import_costs()[:top]:
+            click.echo(f"{self_s * 1000:9.1f}  {cumulative_s * 1000:9.1f}  {name}")
+
+        timer = app_timer(app)
+        warm_up(app, timer)
+        click.echo("\nInit and warm-up (this process):")
+        for line in timer.lines():
+            click.echo(line)
+        click.echo(f"{timer.total() * 1000:9.1f} ms  total")
+
+    @app.cli.command("generate-data")
+    @click.option("--profile", type=click.Choice(["tiny", "small", "medium", "large"]), default="small",
+                  show_default=True, help="Base sizes (large: 10k companies, 100k kits, 1M medicines, 100M logs).")
+    @click.option("--seed", type=int, default=42, show_default=True, help="Same seed and options, same rows.")
+    @click.option("--companies", type=int, help="Override the profile's company count.")
+    @click.option("--kits-per-company", type=int)
+    @click.option("--compartments", type=int, help="Compartments per kit.")
+    @click.option("--fill", type=float, help="Share of compartments holding a medicine (default 1.0).")
+    @click.option("--users-per-company", type=int, help="Company admins per company (default 1).")
+    @click.option("--logs-per-kit", type=int, help="Hardware log rows per kit.")
+    @click.option("--log-days", type=int, help="Days of log history (default 90).")
+    @click.option("--error-rate", type=float, help="Share of readings logged with an error (default 0.01).")
+    @click.option("--status-mix", help="Medicine status shares, e.g. 'expired=0.1,low_stock=0.2' (rest is OK).")
+    @click.option("--chunk-size", type=int, default=20000, show_default=True, help="Rows per insert batch.")
+    @click.option("--skip-rollups", is_flag=True, help="Do not rebuild the rollup tables afterwards.")
+    @click.option("--reset", is_flag=True, help="Drop everything and run seed.py first.")
+    @click.option("--yes", is_flag=True, help="Do not ask before --reset.")
+    def generate_data_command(profile, seed, companies, kits_per_company, compartments, fill, users_per_company,
+                              logs_per_kit, log_days, error_rate, status_mix, chunk_size, skip_rollups, reset, yes):
+        """Bulk-insert a deterministic synthetic dataset for performance testing."""
+        from services.synthetic_data import estimate_rows, generate, parse_status_mix, resolve_options
+
+        try:
+            options = resolve_options(
+                profile, companies=companies, kits_per_company=kits_per_company, compartments=compartments,
+                fill=fill, users_per_company=users_per_company, logs_per_kit=logs_per_kit, log_days=log_days,
+                error_rate=error_rate, status_mix=parse_status_mix(status_mix) if status_mix else None,
+            )
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+
+        if reset:
+            if not yes:
+                click.confirm(f"Drop every table in {db.engine.url.render_as_string()} and reseed?", abort=True)
+            from seed import init_db
+            init_db()
+
+        planned = estimate_rows(options)
+        click.echo("Generating " + ", ".join(f"{rows:,} {table}" for table, rows in planned.items())
+                   + f" (seed {seed})")
+        reported = {}
+
+        def progress(table, rows, seconds):
+            # About ten lines per table
+            step = max(chunk_size, planned.get(table, 0) // 10)
+            if table == "rollups" or rows - reported.get(table, 0) >= step or rows == planned.get(table):
+                reported[table] = rows
+                click.echo(f"  {table:<14} {rows:>13,} rows  {seconds:8.1f} s  {rows / max(seconds, 1e-9):>11,.0f}/s")
+
+        counts = generate(options, seed=seed, chunk_size=chunk_size, rollups=not skip_rollups, progress=progress)
+        seconds = counts.pop("seconds")
+        click.echo(f"Done in {seconds:.1f} s: " + ", ".join(f"{rows:,} {table}" for table, rows in counts.items()))
@@ -3,17 +3,46 @@ Database bootstrap for the MVP.
 - Exposes a single SQLAlchemy instance: `db`
 - Provides `init_db(app)` to configure the Flask app with the DB URL
 - Loads .env (if present) so DATABASE_URL works locally and in Docker
+- Sizes the connection pool from DB_POOL_* env vars and instruments it
+  (see services/pool_metrics.py)
+- Optionally registers DATABASE_READ_URL as a read replica; the session
+  routes reads there (see services/db_routing.py)
+- Supports an embedded SQLite profile (DB_PROFILE=sqlite or a sqlite://
+  DATABASE_URL), tuned through connection hooks (see services/sqlite_profile.py)
+- Counts statements and DB time per request, flags N+1 patterns and logs
+  slow queries (see services/sql_instrumentation.py)
+- Wires Flask-Migrate: schema changes live in backend/migrations
+  (`flask --app app.py db upgrade`)
+
+Pool settings:
+    DB_POOL_SIZE=5  DB_MAX_OVERFLOW=10  DB_POOL_TIMEOUT=30  DB_POOL_RECYCLE=280
+    DB_POOL_LIVENESS=pre_ping | recycle
+        pre_ping: test every checkout with a round trip (safest)
+        recycle:  no per-checkout ping; rely on recycling connections before
+                  the server's idle timeout, and hand out the most recently
+                  used connection first (LIFO) so idle extras age out
 """
 
 import os
 from dotenv import load_dotenv
+from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.engine import make_url
+
+from services.db_routing import REPLICA_BIND, RoutingSession, register_read_routing
+from services.pool_metrics import TimedQueuePool, instrument_engine
+from services.sql_instrumentation import instrument_sql, register_sql_instrumentation
+from services.sqlite_profile import apply_sqlite_profile, is_memory, is_sqlite
 
 # Load variables from a local .env when running outside Docker
 load_dotenv()
 
 # Single shared SQLAlchemy instance for the whole app
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+migrate = Migrate()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MIGRATIONS_DIR = os.path.join(BASE_DIR, "migrations")
 
 
 def get_database_uri() -> str:
@@ -21,29 +50,79 @@ def get_database_uri() -> str:
     Returns the SQLAlchemy connection string.
     Priority:
       1) DATABASE_URL env var (recommended)
-      2) Fallback to a sensible default for Docker Compose
+      2) DB_PROFILE=sqlite: a local file at SQLITE_PATH (default backend/instance/botiquines.db)
+      3) Fallback to a sensible default for Docker Compose
     Notes:
       - We use the PyMySQL driver (pure Python, easy to install)
       - In Docker Compose, the MySQL service is named 'db'
     """
-    return os.getenv(
-        "DATABASE_URL",
-        "mysql+pymysql://botuser:botpass@db:3306/botiquines",
-    )
+    if os.getenv("DATABASE_URL"):
+        return os.environ["DATABASE_URL"]
+    if os.getenv("DB_PROFILE", "").lower() == "sqlite":
+        path = os.getenv("SQLITE_PATH", os.path.join(BASE_DIR, "instance", "botiquines.db"))
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return f"sqlite:///{os.path.abspath(path)}"
+    return "mysql+pymysql://botuser:botpass@db:3306/botiquines"
+
+
+def get_read_database_uri():
+    """Optional read replica DSN (DATABASE_READ_URL); None when not configured."""
+    return os.getenv("DATABASE_READ_URL") or None
+
+
+def get_engine_options(uri: str) -> dict:
+    """
+    Pool options for `uri`, driven by the DB_POOL_* environment variables.
+    In-memory SQLite keeps SQLAlchemy's single-connection pool.
+    """
+    url = make_url(uri)
+    if is_sqlite(url) and is_memory(url):
+        return {}
+
+    liveness = os.getenv("DB_POOL_LIVENESS", "pre_ping").lower()
+    if liveness not in ("pre_ping", "recycle"):
+        raise ValueError(f"DB_POOL_LIVENESS must be 'pre_ping' or 'recycle', got '{liveness}'")
+
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        # Whole seconds: Flask-SQLAlchemy coerces this option to int
+        "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),
+        # Recycle before MySQL's wait_timeout closes idle connections (in seconds)
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "280")),
+        # Avoids 'MySQL server has gone away' on idle, at one round trip per checkout
+        # (a local SQLite file never drops connections)
+        "pool_pre_ping": liveness == "pre_ping" and not is_sqlite(url),
+        "pool_use_lifo": liveness == "recycle",
+    }
 
 
 def init_db(app) -> None:
     """
     Bind SQLAlchemy to the Flask app.
-    Keeps config minimal (MVP), but adds a couple of stable MySQL options.
+    Pool sizing and liveness come from the environment (see module docstring).
     """
     app.config["SQLALCHEMY_DATABASE_URI"] = get_database_uri()
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", get_engine_options(app.config["SQLALCHEMY_DATABASE_URI"]))
+
+    read_uri = get_read_database_uri()
+    if read_uri:
+        app.config.setdefault("SQLALCHEMY_BINDS", {})
+        app.config["SQLALCHEMY_BINDS"][REPLICA_BIND] = {"url": read_uri, **get_engine_options(read_uri)}
 
-    # Optional but good practice for MySQL connections:
-    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {
-        "pool_pre_ping": True,   # Avoids 'MySQL server has gone away' on idle
-        "pool_recycle": 280,     # Recycle connections regularly (in seconds)
-    })
+    db.init_app(app)
+    # Batch mode lets the same migrations run on SQLite (tests, local runs)
+    migrate.init_app(app, db, directory=MIGRATIONS_DIR, render_as_batch=True)
 
-    db.init_app(app)
\ No newline at end of file
+    with app.app_context():
+        apply_sqlite_profile(db.engine)
+        instrument_engine(db.engine, "primary")
+        instrument_sql(db.engine)
+        if read_uri:
+            apply_sqlite_profile(db.engines[REPLICA_BIND])
+            instrument_engine(db.engines[REPLICA_BIND], REPLICA_BIND)
+            instrument_sql(db.engines[REPLICA_BIND])
+    register_read_routing(app)
+    register_sql_instrumentation(app)
\ No newline at end of file
@@ -0,0 +1,45 @@
+"""
+Gunicorn settings for production (`gunicorn -c gunicorn.conf.py wsgi:app`).
+
+The app is loaded and warmed in the master (preload_app), so workers start
+with compiled templates and configured mappers and share those pages
+copy-on-write; each worker opens its own pool connections after the fork.
+
+    WEB_CONCURRENCY=4        worker processes (default: 2 x CPUs + 1)
+    GUNICORN_THREADS=8       threads per worker; an open event stream holds one,
+                             so streams are capped at half of them per worker
+                             (EVENTS_MAX_STREAMS, see services/events.py)
+    GUNICORN_BIND=0.0.0.0:5000
+    METRICS_MULTIPROC_DIR=/tmp/botiquines-metrics
+                             shared metrics snapshots, so /metrics covers
+                             every worker (see services/metrics.py)
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+
+
+def on_starting(server):
+    from services.metrics import clear_multiproc_dir
+
+    clear_multiproc_dir()
+
+
+def child_exit(server, worker):
+    from services.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    from services.startup import after_fork
+    from wsgi import app
+
+    after_fork(app)
@@ -0,0 +1,111 @@
+"""baseline schema
+
+Schema as created by `db.create_all()` before migrations were introduced
+(companies, users, botiquines, medicines, hardware_logs). Databases created
+that way should be marked as already at this revision, then upgraded:
+
+    flask --app app.py db stamp 0001
+    flask --app app.py db upgrade
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 02:25:45.455658
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('companies',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.Column('contact_email', sa.String(length=120), nullable=True),
+    sa.Column('contact_phone', sa.String(length=30), nullable=True),
+    sa.Column('active', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('contact_email'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('botiquines',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('hardware_id', sa.String(length=50), nullable=False),
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.Column('location', sa.String(length=120), nullable=True),
+    sa.Column('company_id', sa.Integer(), nullable=True),
+    sa.Column('total_compartments', sa.Integer(), nullable=False),
+    sa.Column('active', sa.Boolean(), nullable=True),
+    sa.Column('last_sync_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['company_id'], ['companies.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('hardware_id')
+    )
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=80), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=True),
+    sa.Column('password_hash', sa.String(length=255), nullable=False),
+    sa.Column('user_type', sa.String(length=20), nullable=False),
+    sa.Column('company_id', sa.Integer(), nullable=True),
+    sa.Column('active', sa.Boolean(), nullable=True),
+    sa.Column('last_login', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['company_id'], ['companies.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_table('hardware_logs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('botiquin_id', sa.Integer(), nullable=False),
+    sa.Column('compartment_number', sa.Integer(), nullable=True),
+    sa.Column('weight_reading', sa.Float(), nullable=True),
+    sa.Column('sensor_type', sa.String(length=30), nullable=True),
+    sa.Column('raw_data', sa.Text(), nullable=True),
+    sa.Column('processed', sa.Boolean(), nullable=True),
+    sa.Column('error_message', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['botiquin_id'], ['botiquines.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('medicines',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('botiquin_id', sa.Integer(), nullable=False),
+    sa.Column('compartment_number', sa.Integer(), nullable=True),
+    sa.Column('trade_name', sa.String(length=120), nullable=False),
+    sa.Column('generic_name', sa.String(length=120), nullable=False),
+    sa.Column('brand', sa.String(length=120), nullable=True),
+    sa.Column('strength', sa.String(length=80), nullable=True),
+    sa.Column('unit_weight', sa.Float(), nullable=True),
+    sa.Column('current_weight', sa.Float(), nullable=True),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('reorder_level', sa.Integer(), nullable=False),
+    sa.Column('max_capacity', sa.Integer(), nullable=True),
+    sa.Column('expiry_date', sa.Date(), nullable=True),
+    sa.Column('batch_number', sa.String(length=50), nullable=True),
+    sa.Column('last_scan_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['botiquin_id'], ['botiquines.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('medicines')
+    op.drop_table('hardware_logs')
+    op.drop_table('users')
+    op.drop_table('botiquines')
+    op.drop_table('companies')
@@ -0,0 +1,72 @@
+"""rollup tables
+
+Precomputed medicine counters per kit (botiquin_rollups, whose version is
+the fragment cache stamp) and per company (company_rollups); see
+services/rollups.py. Fill them with `flask --app app.py rollups-rebuild`.
+
+Revision ID: 0001a
+Revises: 0001
+Create Date: 2026-10-19 02:25:50.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001a'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('company_rollups',
+    sa.Column('company_id', sa.Integer(), nullable=False),
+    sa.Column('botiquin_count', sa.Integer(), nullable=False),
+    sa.Column('total_compartments', sa.Integer(), nullable=False),
+    sa.Column('medicine_count', sa.Integer(), nullable=False),
+    sa.Column('expired', sa.Integer(), nullable=False),
+    sa.Column('expires_soon', sa.Integer(), nullable=False),
+    sa.Column('expires_30', sa.Integer(), nullable=False),
+    sa.Column('out_of_stock', sa.Integer(), nullable=False),
+    sa.Column('low_stock', sa.Integer(), nullable=False),
+    sa.Column('ok', sa.Integer(), nullable=False),
+    sa.Column('compartments_used', sa.Integer(), nullable=False),
+    sa.Column('items_in_stock', sa.Integer(), nullable=False),
+    sa.Column('last_sync_at', sa.DateTime(), nullable=True),
+    sa.Column('computed_on', sa.Date(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['company_id'], ['companies.id'], ),
+    sa.PrimaryKeyConstraint('company_id')
+    )
+    op.create_table('botiquin_rollups',
+    sa.Column('botiquin_id', sa.Integer(), nullable=False),
+    sa.Column('company_id', sa.Integer(), nullable=True),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('medicine_count', sa.Integer(), nullable=False),
+    sa.Column('expired', sa.Integer(), nullable=False),
+    sa.Column('expires_soon', sa.Integer(), nullable=False),
+    sa.Column('expires_30', sa.Integer(), nullable=False),
+    sa.Column('out_of_stock', sa.Integer(), nullable=False),
+    sa.Column('low_stock', sa.Integer(), nullable=False),
+    sa.Column('ok', sa.Integer(), nullable=False),
+    sa.Column('compartments_used', sa.Integer(), nullable=False),
+    sa.Column('items_in_stock', sa.Integer(), nullable=False),
+    sa.Column('last_sync_at', sa.DateTime(), nullable=True),
+    sa.Column('computed_on', sa.Date(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['botiquin_id'], ['botiquines.id'], ),
+    sa.ForeignKeyConstraint(['company_id'], ['companies.id'], ),
+    sa.PrimaryKeyConstraint('botiquin_id')
+    )
+    with op.batch_alter_table('botiquin_rollups', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_botiquin_rollups_company_id'), ['company_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('botiquin_rollups', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_botiquin_rollups_company_id'))
+
+    op.drop_table('botiquin_rollups')
+    op.drop_table('company_rollups')
@@ -0,0 +1,43 @@
+"""device keys
+
+Per-kit HMAC keys for signed hardware requests (services/device_auth.py).
+Issue keys for existing kits with `flask --app app.py device-keys issue-missing`.
+
+Revision ID: 0001b
+Revises: 0001a
+Create Date: 2026-10-19 02:25:53.640917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001b'
+down_revision = '0001a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('device_keys',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('key_id', sa.String(length=40), nullable=False),
+    sa.Column('secret', sa.String(length=128), nullable=False),
+    sa.Column('botiquin_id', sa.Integer(), nullable=False),
+    sa.Column('active', sa.Boolean(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('revoked_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['botiquin_id'], ['botiquines.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('key_id')
+    )
+    with op.batch_alter_table('device_keys', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_device_keys_botiquin_id'), ['botiquin_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('device_keys', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_device_keys_botiquin_id'))
+
+    op.drop_table('device_keys')
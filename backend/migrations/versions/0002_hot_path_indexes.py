@@ -0,0 +1,81 @@
+"""hot path indexes
+
+Indexes for the queries that run on every request or ingest:
+- medicines: one medicine per (botiquin_id, compartment_number), which is also
+  the index the sensor ingest lookup probes; expiry_date for alert filters
+- hardware_logs: (botiquin_id, created_at) for per-kit log history
+- users: company_id for company user lists
+- botiquines: (company_id, active) for company kit lists and dashboards
+
+Revision ID: 0002
+Revises: 0001b
+Create Date: 2026-10-19 02:25:58.865618
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001b'
+branch_labels = None
+depends_on = None
+
+
+def _check_no_duplicate_compartments():
+    duplicates = op.get_bind().execute(sa.text(
+        "SELECT botiquin_id, compartment_number, COUNT(*) FROM medicines "
+        "WHERE compartment_number IS NOT NULL "
+        "GROUP BY botiquin_id, compartment_number HAVING COUNT(*) > 1"
+    )).fetchall()
+    if duplicates:
+        listing = ", ".join(f"botiquin {b} compartment {c} ({n} medicines)" for b, c, n in duplicates)
+        raise RuntimeError(
+            "Cannot add uq_medicines_botiquin_compartment, some compartments hold several medicines: "
+            f"{listing}. Move or unassign the extra medicines and run the upgrade again."
+        )
+
+
+def upgrade():
+    _check_no_duplicate_compartments()
+
+    with op.batch_alter_table('botiquines', schema=None) as batch_op:
+        batch_op.create_index('ix_botiquines_company_active', ['company_id', 'active'], unique=False)
+
+    with op.batch_alter_table('hardware_logs', schema=None) as batch_op:
+        batch_op.create_index('ix_hardware_logs_botiquin_created', ['botiquin_id', 'created_at'], unique=False)
+
+    with op.batch_alter_table('medicines', schema=None) as batch_op:
+        batch_op.create_index('ix_medicines_expiry_date', ['expiry_date'], unique=False)
+        batch_op.create_unique_constraint('uq_medicines_botiquin_compartment', ['botiquin_id', 'compartment_number'])
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index('ix_users_company_id', ['company_id'], unique=False)
+
+
+def downgrade():
+    # MySQL may have dropped its implicit foreign key indexes in favour of the
+    # composite ones; keep a plain index on each foreign key before removing them
+    is_mysql = op.get_bind().dialect.name == 'mysql'
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        if is_mysql:
+            batch_op.create_index('ix_users_company_fk', ['company_id'], unique=False)
+        batch_op.drop_index('ix_users_company_id')
+
+    with op.batch_alter_table('medicines', schema=None) as batch_op:
+        if is_mysql:
+            batch_op.create_index('ix_medicines_botiquin_fk', ['botiquin_id'], unique=False)
+        batch_op.drop_constraint('uq_medicines_botiquin_compartment', type_='unique')
+        batch_op.drop_index('ix_medicines_expiry_date')
+
+    with op.batch_alter_table('hardware_logs', schema=None) as batch_op:
+        if is_mysql:
+            batch_op.create_index('ix_hardware_logs_botiquin_fk', ['botiquin_id'], unique=False)
+        batch_op.drop_index('ix_hardware_logs_botiquin_created')
+
+    with op.batch_alter_table('botiquines', schema=None) as batch_op:
+        if is_mysql:
+            batch_op.create_index('ix_botiquines_company_fk', ['company_id'], unique=False)
+        batch_op.drop_index('ix_botiquines_company_active')
@@ -0,0 +1,29 @@
+"""medicine version
+
+Adds medicines.version, the optimistic-concurrency counter used as the
+mapper's version_id_col. Existing rows start at 1.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 02:36:24.552570
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('medicines', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('medicines', schema=None) as batch_op:
+        batch_op.drop_column('version')
@@ -8,9 +8,9 @@ Updated structure includes:
 - Compartment assignments for visual representation
 """
 
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from db import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from services.passwords import hash_password, verify_password
 from flask_login import UserMixin
 
 class Company(db.Model):
@@ -32,14 +32,21 @@ class Company(db.Model):
     botiquines = db.relationship('Botiquin', backref='company', lazy=True, cascade='all, delete-orphan')
     users = db.relationship('User', backref='company', lazy=True)
     
-    def to_dict(self):
+    def to_dict(self, botiquines_count=None):
+        """
+        Serialize the company. Pass `botiquines_count` when it was already
+        computed in bulk (services/companies.py); otherwise a COUNT query is
+        issued instead of loading the whole collection.
+        """
+        if botiquines_count is None:
+            botiquines_count = Botiquin.query.filter_by(company_id=self.id).count()
         return {
             "id": self.id,
             "name": self.name,
             "contact_email": self.contact_email,
             "contact_phone": self.contact_phone,
             "active": self.active,
-            "botiquines_count": len(self.botiquines),
+            "botiquines_count": botiquines_count,
             "created_at": self.created_at.isoformat(),
             "updated_at": self.updated_at.isoformat() if self.updated_at else None
         }
@@ -50,6 +57,9 @@ class User(db.Model, UserMixin):
     Two levels: super_admin (manages all) and company_admin (manages their company).
     """
     __tablename__ = "users"
+    __table_args__ = (
+        db.Index("ix_users_company_id", "company_id"),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -72,12 +82,12 @@ class User(db.Model, UserMixin):
         return bool(self.active)
 
     def set_password(self, password: str):
-        """Hash and store a plain password"""
-        self.password_hash = generate_password_hash(password)
+        """Hash and store a plain password (runs in the password pool)"""
+        self.password_hash = hash_password(password)
         
     def check_password(self, password: str) -> bool:
-        """Verify a password against the stored hash."""
-        return check_password_hash(self.password_hash, password)
+        """Verify a password against the stored hash (runs in the password pool)."""
+        return verify_password(self.password_hash, password)
     
     def is_super_admin(self) -> bool:
         """Check if user is a super administrator"""
@@ -103,6 +113,10 @@ class Botiquin(db.Model):
     Each company can have multiple botiquines.
     """
     __tablename__ = "botiquines"
+    __table_args__ = (
+        # Company kit lists and dashboards filter on both
+        db.Index("ix_botiquines_company_active", "company_id", "active"),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     # Unique identifier for hardware communication
@@ -124,6 +138,8 @@ class Botiquin(db.Model):
     
     # Relationships
     medicines = db.relationship('Medicine', backref='botiquin', lazy=True, cascade='all, delete-orphan')
+    rollup = db.relationship('BotiquinRollup', uselist=False, lazy=True, cascade='all, delete-orphan')
+    device_keys = db.relationship('DeviceKey', backref='botiquin', lazy=True, cascade='all, delete-orphan')
     
     def get_compartment_status(self):
         """Deprecated: compartment-level status is not used currently."""
@@ -152,6 +168,11 @@ class Medicine(db.Model):
     Enhanced with weight-based quantity calculation and compartment assignment.
     """
     __tablename__ = "medicines"
+    __table_args__ = (
+        # One medicine per compartment; also the index behind the ingest lookup
+        db.UniqueConstraint("botiquin_id", "compartment_number", name="uq_medicines_botiquin_compartment"),
+        db.Index("ix_medicines_expiry_date", "expiry_date"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     
@@ -182,6 +203,11 @@ class Medicine(db.Model):
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Optimistic concurrency: every UPDATE checks and bumps it, so a write based
+    # on a stale read fails with StaleDataError instead of overwriting silently
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+    __mapper_args__ = {"version_id_col": version}
     
     def calculate_quantity_from_weight(self):
         """
@@ -250,6 +276,22 @@ class Medicine(db.Model):
             return "LOW_STOCK"
 
         return "OK"
+
+    @classmethod
+    def status_expression(cls, today=None):
+        """
+        SQL equivalent of status() so queries can filter/group by status.
+        Date thresholds are computed in Python to stay portable across backends.
+        """
+        today = today or date.today()
+        return db.case(
+            (cls.quantity <= 0, "OUT_OF_STOCK"),
+            (cls.expiry_date < today, "EXPIRED"),
+            (cls.expiry_date <= today + timedelta(days=7), "EXPIRES_SOON"),
+            (cls.expiry_date <= today + timedelta(days=30), "EXPIRES_30"),
+            (cls.quantity <= cls.reorder_level, "LOW_STOCK"),
+            else_="OK",
+        )
     
     def get_status_color(self) -> str:
         """Returns Bootstrap color class based on status"""
@@ -288,6 +330,7 @@ class Medicine(db.Model):
             "status": self.status(),
             "status_color": self.get_status_color(),
             "days_to_expiry": self.days_to_expiry(),
+            "version": self.version,
             "created_at": self.created_at.isoformat(),
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
         }
@@ -298,6 +341,9 @@ class HardwareLog(db.Model):
     Stores raw data received from hardware.
     """
     __tablename__ = "hardware_logs"
+    __table_args__ = (
+        db.Index("ix_hardware_logs_botiquin_created", "botiquin_id", "created_at"),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     botiquin_id = db.Column(db.Integer, db.ForeignKey('botiquines.id'), nullable=False)
@@ -325,3 +371,90 @@ class HardwareLog(db.Model):
             "error_message": self.error_message,
             "created_at": self.created_at.isoformat()
         }
+
+
+class DeviceKey(db.Model):
+    """
+    API credential of one physical botiquin.
+    Hardware signs each request with HMAC-SHA256 using `secret`; `key_id` is sent in clear.
+    A kit may hold several keys so they can be rotated without downtime.
+    """
+    __tablename__ = "device_keys"
+
+    id = db.Column(db.Integer, primary_key=True)
+    key_id = db.Column(db.String(40), unique=True, nullable=False)
+    # Kept in clear: the server needs it to recompute signatures
+    secret = db.Column(db.String(128), nullable=False)
+    botiquin_id = db.Column(db.Integer, db.ForeignKey("botiquines.id"), nullable=False, index=True)
+
+    active = db.Column(db.Boolean, default=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    revoked_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        """Never includes the secret."""
+        return {
+            "id": self.id,
+            "key_id": self.key_id,
+            "botiquin_id": self.botiquin_id,
+            "active": self.active,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "revoked_at": self.revoked_at.isoformat() if self.revoked_at else None,
+        }
+
+
+class RollupCountsMixin:
+    """
+    Status counters shared by the kit and company rollup tables.
+    Critical/warning follow the dashboard definition.
+    """
+    medicine_count = db.Column(db.Integer, default=0, nullable=False)
+    expired = db.Column(db.Integer, default=0, nullable=False)
+    expires_soon = db.Column(db.Integer, default=0, nullable=False)
+    expires_30 = db.Column(db.Integer, default=0, nullable=False)
+    out_of_stock = db.Column(db.Integer, default=0, nullable=False)
+    low_stock = db.Column(db.Integer, default=0, nullable=False)
+    ok = db.Column(db.Integer, default=0, nullable=False)
+    compartments_used = db.Column(db.Integer, default=0, nullable=False)
+    items_in_stock = db.Column(db.Integer, default=0, nullable=False)
+    last_sync_at = db.Column(db.DateTime)
+
+    # Statuses depend on today's date, so a row computed on a previous day is stale
+    computed_on = db.Column(db.Date, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def critical(self) -> int:
+        return self.expired + self.out_of_stock
+
+    @property
+    def warning(self) -> int:
+        return self.expires_soon + self.low_stock
+
+    def is_stale(self, today=None) -> bool:
+        return self.computed_on != (today or date.today())
+
+
+class BotiquinRollup(RollupCountsMixin, db.Model):
+    """
+    Precomputed medicine counters for one botiquin.
+    Maintained by services/rollups.py whenever a kit or its medicines change.
+    """
+    __tablename__ = "botiquin_rollups"
+
+    botiquin_id = db.Column(db.Integer, db.ForeignKey("botiquines.id"), primary_key=True)
+    company_id = db.Column(db.Integer, db.ForeignKey("companies.id"), nullable=True, index=True)
+
+    # Bumped on every recompute; used as the version stamp for cached page fragments
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+
+class CompanyRollup(RollupCountsMixin, db.Model):
+    """
+    Precomputed counters for a company, summed over its active botiquines.
+    """
+    __tablename__ = "company_rollups"
+
+    company_id = db.Column(db.Integer, db.ForeignKey("companies.id"), primary_key=True)
+    botiquin_count = db.Column(db.Integer, default=0, nullable=False)
+    total_compartments = db.Column(db.Integer, default=0, nullable=False)
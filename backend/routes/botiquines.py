@@ -5,11 +5,21 @@ Handles CRUD operations and compartment visualization.
 
 from flask import Blueprint, request, jsonify
 from datetime import datetime
+from sqlalchemy.orm import joinedload, selectinload
 from db import db
 from models.models import Botiquin, Company, Medicine
+from services.rollups import botiquin_rollups
+from services.tenancy import api_auth_error, can_use_company, scoped, scoped_get
 
 bp = Blueprint("botiquines", __name__)
 
+
+@bp.before_request
+def require_login():
+    """All botiquin endpoints are tenant-scoped."""
+    return api_auth_error()
+
+
 # -------- Validation --------
 def validate_botiquin_payload(data, partial=False):
     errors = []
@@ -21,35 +31,24 @@ def validate_botiquin_payload(data, partial=False):
             if f not in data or data.get(f) in (None, ""):
                 errors.append(f"'{f}' is required")
     
-    # Validate company exists
+    # Validate company exists and the current user may use it
     if "company_id" in data and data.get("company_id"):
-        company = Company.query.get(data["company_id"])
-        if not company:
+        try:
+            company_id = int(data["company_id"])
+        except (TypeError, ValueError):
+            company_id = None
+        if company_id is None or not can_use_company(company_id):
+            errors.append(f"Company with id {data['company_id']} does not exist")
+        elif not Company.query.get(company_id):
             errors.append(f"Company with id {data['company_id']} does not exist")
     
-    # Validate compartment configuration
-    for field in ["total_compartments", "compartment_rows", "compartment_cols"]:
-        if field in data and data[field] is not None:
-            try:
-                v = int(data[field])
-                if field == "total_compartments":
-                    if v < 4:
-                        errors.append("'total_compartments' must be at least 4")
-                elif v <= 0:
-                    errors.append(f"'{field}' must be > 0")
-            except (TypeError, ValueError):
-                errors.append(f"'{field}' must be an integer")
-    
-    # Validate rows * cols = total_compartments if all are provided
-    if all(f in data for f in ["total_compartments", "compartment_rows", "compartment_cols"]):
+    # Validate compartment configuration (the grid layout is derived from the total)
+    if "total_compartments" in data and data["total_compartments"] is not None:
         try:
-            total = int(data["total_compartments"])
-            rows = int(data["compartment_rows"])
-            cols = int(data["compartment_cols"])
-            if rows * cols != total:
-                errors.append(f"rows ({rows}) * cols ({cols}) must equal total_compartments ({total})")
+            if int(data["total_compartments"]) < 4:
+                errors.append("'total_compartments' must be at least 4")
         except (TypeError, ValueError):
-            pass
+            errors.append("'total_compartments' must be an integer")
     
     return (len(errors) == 0, errors)
 
@@ -60,7 +59,8 @@ def list_botiquines():
     """List all botiquines, optionally filtered by company"""
     company_id = request.args.get("company_id")
     
-    query = Botiquin.query
+    # to_dict() reads company and medicines; load them up front instead of per row
+    query = scoped(Botiquin).options(joinedload(Botiquin.company), selectinload(Botiquin.medicines))
     if company_id:
         query = query.filter_by(company_id=company_id)
     
@@ -87,8 +87,6 @@ def create_botiquin():
         location=data.get("location"),
         company_id=int(data.get("company_id")),
         total_compartments=int(data.get("total_compartments", 4)),
-        compartment_rows=int(data.get("compartment_rows", 2)),
-        compartment_cols=int(data.get("compartment_cols", 2)),
         active=data.get("active", True)
     )
     
@@ -101,7 +99,7 @@ def create_botiquin():
 @bp.get("/<int:botiquin_id>")
 def get_botiquin(botiquin_id):
     """Get a specific botiquin with its compartment status"""
-    botiquin = Botiquin.query.get(botiquin_id)
+    botiquin = scoped_get(Botiquin, botiquin_id)
     if not botiquin:
         return jsonify({"error": "Botiquin not found"}), 404
     
@@ -114,7 +112,7 @@ def get_compartments(botiquin_id):
     Get detailed compartment visualization data.
     Returns a grid representation of the botiquin.
     """
-    botiquin = Botiquin.query.get(botiquin_id)
+    botiquin = scoped_get(Botiquin, botiquin_id)
     if not botiquin:
         return jsonify({"error": "Botiquin not found"}), 404
     
@@ -135,11 +133,13 @@ def get_compartments(botiquin_id):
                 "days_to_expiry": medicine.days_to_expiry()
             }
     
-    # Build grid
+    # Build grid: 4 columns max, like the detail page
+    cols = min(botiquin.total_compartments, 4)
+    rows = -(-botiquin.total_compartments // cols)
     compartment_num = 1
-    for row in range(botiquin.compartment_rows):
+    for row in range(rows):
         grid_row = []
-        for col in range(botiquin.compartment_cols):
+        for col in range(cols):
             if compartment_num <= botiquin.total_compartments:
                 if compartment_num in compartment_map:
                     grid_row.append({
@@ -165,8 +165,8 @@ def get_compartments(botiquin_id):
     return jsonify({
         "botiquin_id": botiquin.id,
         "botiquin_name": botiquin.name,
-        "rows": botiquin.compartment_rows,
-        "cols": botiquin.compartment_cols,
+        "rows": rows,
+        "cols": cols,
         "total_compartments": botiquin.total_compartments,
         "grid": grid,
         "summary": {
@@ -181,7 +181,7 @@ def get_compartments(botiquin_id):
 @bp.put("/<int:botiquin_id>")
 def update_botiquin(botiquin_id):
     """Update botiquin information"""
-    botiquin = Botiquin.query.get(botiquin_id)
+    botiquin = scoped_get(Botiquin, botiquin_id)
     if not botiquin:
         return jsonify({"error": "Botiquin not found"}), 404
     
@@ -198,11 +198,11 @@ def update_botiquin(botiquin_id):
     
     # Update fields
     fields = ["hardware_id", "name", "location", "company_id", 
-              "total_compartments", "compartment_rows", "compartment_cols", "active"]
+              "total_compartments", "active"]
     
     for field in fields:
         if field in data:
-            if field in ["company_id", "total_compartments", "compartment_rows", "compartment_cols"]:
+            if field in ["company_id", "total_compartments"]:
                 setattr(botiquin, field, int(data[field]))
             else:
                 setattr(botiquin, field, data[field])
@@ -217,7 +217,7 @@ def delete_botiquin(botiquin_id):
     Delete a botiquin.
     Note: This will cascade delete all medicines in the botiquin.
     """
-    botiquin = Botiquin.query.get(botiquin_id)
+    botiquin = scoped_get(Botiquin, botiquin_id)
     if not botiquin:
         return jsonify({"error": "Botiquin not found"}), 404
     
@@ -239,7 +239,7 @@ def sync_botiquin(botiquin_id):
     Mark botiquin as synced with hardware.
     Updates last_sync_at timestamp.
     """
-    botiquin = Botiquin.query.get(botiquin_id)
+    botiquin = scoped_get(Botiquin, botiquin_id)
     if not botiquin:
         return jsonify({"error": "Botiquin not found"}), 404
     
@@ -255,28 +255,28 @@ def sync_botiquin(botiquin_id):
 @bp.get("/<int:botiquin_id>/stats")
 def get_botiquin_stats(botiquin_id):
     """Get statistics for a specific botiquin"""
-    botiquin = Botiquin.query.get(botiquin_id)
+    botiquin = scoped_get(Botiquin, botiquin_id)
     if not botiquin:
         return jsonify({"error": "Botiquin not found"}), 404
     
-    medicines = botiquin.medicines
+    rollup = botiquin_rollups([botiquin.id])[botiquin.id]
     
     stats = {
         "botiquin_id": botiquin.id,
         "botiquin_name": botiquin.name,
-        "total_medicines": len(medicines),
-        "compartments_used": sum(1 for m in medicines if m.compartment_number),
-        "compartments_available": botiquin.total_compartments - sum(1 for m in medicines if m.compartment_number),
+        "total_medicines": rollup.medicine_count,
+        "compartments_used": rollup.compartments_used,
+        "compartments_available": botiquin.total_compartments - rollup.compartments_used,
         "status_summary": {
-            "expired": sum(1 for m in medicines if m.status() == "EXPIRED"),
-            "expires_soon": sum(1 for m in medicines if m.status() == "EXPIRES_SOON"),
-            "expires_30": sum(1 for m in medicines if m.status() == "EXPIRES_30"),
-            "out_of_stock": sum(1 for m in medicines if m.status() == "OUT_OF_STOCK"),
-            "low_stock": sum(1 for m in medicines if m.status() == "LOW_STOCK"),
-            "ok": sum(1 for m in medicines if m.status() == "OK")
+            "expired": rollup.expired,
+            "expires_soon": rollup.expires_soon,
+            "expires_30": rollup.expires_30,
+            "out_of_stock": rollup.out_of_stock,
+            "low_stock": rollup.low_stock,
+            "ok": rollup.ok
         },
         "total_value": {
-            "items_in_stock": sum(m.quantity for m in medicines)
+            "items_in_stock": rollup.items_in_stock
         },
         "last_sync": botiquin.last_sync_at.isoformat() if botiquin.last_sync_at else None
     }
@@ -6,8 +6,13 @@ Essential for SaaS model - manages multiple companies with their botiquines.
 from flask import Blueprint, request, jsonify
 from flask_login import current_user
 from datetime import datetime
+from sqlalchemy.orm import joinedload, selectinload
 from db import db
 from models.models import Company, User, Botiquin, Medicine
+from services.rollups import botiquin_rollups, company_rollup
+from services.companies import company_summaries
+from services.session_cache import invalidate_company
+from services.tenancy import can_use_company, scoped
 
 bp = Blueprint("companies", __name__)
 
@@ -38,14 +43,14 @@ def list_companies():
 
     if user.is_super_admin():
         # Super admin sees all companies
-        companies = Company.query.all()
+        summaries = company_summaries()
     else:
         # Company admin sees only their company
         if not user.company_id:
             return jsonify({"error": "User not assigned to any company"}), 400
-        companies = [user.company]
+        summaries = company_summaries([user.company_id])
     
-    return jsonify([c.to_dict() for c in companies]), 200
+    return jsonify([c.to_dict(botiquines_count=bots) for c, bots, _ in summaries]), 200
 
 
 @bp.route("/", methods=["POST"])
@@ -95,14 +100,14 @@ def get_company(company_id):
     if not getattr(user, "active", False):
         return jsonify({"error": "User not found"}), 404
     
+    # Check permissions before touching the database
+    if not can_use_company(company_id, user):
+        return jsonify({"error": "Access denied"}), 403
+    
     company = Company.query.get(company_id)
     if not company:
         return jsonify({"error": "Company not found"}), 404
     
-    # Check permissions
-    if not user.is_super_admin() and user.company_id != company_id:
-        return jsonify({"error": "Access denied"}), 403
-    
     return jsonify(company.to_dict()), 200
 
 
@@ -138,6 +143,7 @@ def update_company(company_id):
         company.active = data["active"]
     
     db.session.commit()
+    invalidate_company(company.id)
     return jsonify(company.to_dict()), 200
 
 
@@ -172,6 +178,7 @@ def delete_company(company_id):
     # Soft delete (deactivate)
     company.active = False
     db.session.commit()
+    invalidate_company(company.id)
     
     return jsonify({"message": "Company deactivated successfully"}), 200
 
@@ -188,37 +195,19 @@ def get_company_stats(company_id):
     if not getattr(user, "active", False):
         return jsonify({"error": "User not found"}), 404
     
+    # Check permissions before touching the database
+    if not can_use_company(company_id, user):
+        return jsonify({"error": "Access denied"}), 403
+    
     company = Company.query.get(company_id)
     if not company:
         return jsonify({"error": "Company not found"}), 404
     
-    # Check permissions
-    if not user.is_super_admin() and user.company_id != company_id:
-        return jsonify({"error": "Access denied"}), 403
-    
-    # Gather statistics
+    # Gather statistics from the precomputed rollups
+    rollup = company_rollup(company_id)
     botiquines = Botiquin.query.filter_by(company_id=company_id, active=True).all()
-    users = User.query.filter_by(company_id=company_id, active=True).all()
-    
-    # Medicine statistics
-    total_medicines = 0
-    expired = 0
-    expires_soon = 0
-    low_stock = 0
-    out_of_stock = 0
-    
-    for bot in botiquines:
-        for med in bot.medicines:
-            total_medicines += 1
-            status = med.status()
-            if status == "EXPIRED":
-                expired += 1
-            elif status == "EXPIRES_SOON":
-                expires_soon += 1
-            elif status == "LOW_STOCK":
-                low_stock += 1
-            elif status == "OUT_OF_STOCK":
-                out_of_stock += 1
+    kit_rollups = botiquin_rollups([b.id for b in botiquines])
+    users_count = User.query.filter_by(company_id=company_id, active=True).count()
     
     stats = {
         "company": {
@@ -227,29 +216,26 @@ def get_company_stats(company_id):
             "active": company.active
         },
         "counts": {
-            "botiquines": len(botiquines),
-            "users": len(users),
-            "total_medicines": total_medicines,
-            "total_compartments": sum(b.total_compartments for b in botiquines),
-            "used_compartments": sum(
-                sum(1 for m in b.medicines if m.compartment_number) 
-                for b in botiquines
-            )
+            "botiquines": rollup.botiquin_count,
+            "users": users_count,
+            "total_medicines": rollup.medicine_count,
+            "total_compartments": rollup.total_compartments,
+            "used_compartments": rollup.compartments_used
         },
         "alerts": {
-            "critical": expired + out_of_stock,
-            "warning": expires_soon + low_stock,
-            "expired": expired,
-            "expires_soon": expires_soon,
-            "low_stock": low_stock,
-            "out_of_stock": out_of_stock
+            "critical": rollup.critical,
+            "warning": rollup.warning,
+            "expired": rollup.expired,
+            "expires_soon": rollup.expires_soon,
+            "low_stock": rollup.low_stock,
+            "out_of_stock": rollup.out_of_stock
         },
         "botiquines_summary": [
             {
                 "id": b.id,
                 "name": b.name,
                 "location": b.location,
-                "medicines_count": len(b.medicines),
+                "medicines_count": kit_rollups[b.id].medicine_count if b.id in kit_rollups else 0,
                 "last_sync": b.last_sync_at.isoformat() if b.last_sync_at else None
             }
             for b in botiquines
@@ -272,10 +258,15 @@ def get_company_botiquines(company_id):
         return jsonify({"error": "User not found"}), 404
     
     # Check permissions
-    if not user.is_super_admin() and user.company_id != company_id:
+    if not can_use_company(company_id, user):
         return jsonify({"error": "Access denied"}), 403
     
-    botiquines = Botiquin.query.filter_by(company_id=company_id).all()
+    botiquines = (
+        scoped(Botiquin, user)
+        .options(joinedload(Botiquin.company), selectinload(Botiquin.medicines))
+        .filter_by(company_id=company_id)
+        .all()
+    )
     return jsonify([b.to_dict() for b in botiquines]), 200
 
 
@@ -292,10 +283,10 @@ def get_company_users(company_id):
         return jsonify({"error": "User not found"}), 404
     
     # Check permissions
-    if not user.is_super_admin() and user.company_id != company_id:
+    if not can_use_company(company_id, user):
         return jsonify({"error": "Access denied"}), 403
     
-    users = User.query.filter_by(company_id=company_id).all()
+    users = scoped(User, user).filter_by(company_id=company_id).all()
     return jsonify([u.to_dict() for u in users]), 200
 
 
@@ -312,10 +303,14 @@ def get_company_alerts(company_id):
         return jsonify({"error": "User not found"}), 404
     
     # Check permissions
-    if not user.is_super_admin() and user.company_id != company_id:
+    if not can_use_company(company_id, user):
         return jsonify({"error": "Access denied"}), 403
     
-    botiquines = Botiquin.query.filter_by(company_id=company_id, active=True).all()
+    botiquines = (
+        Botiquin.query.options(selectinload(Botiquin.medicines))
+        .filter_by(company_id=company_id, active=True)
+        .all()
+    )
     
     alerts = {
         "critical": [],
@@ -0,0 +1,59 @@
+"""
+Server-Sent Events for live dashboard and botiquin detail updates.
+Clients keep one connection open; events come from services/events.py.
+
+Under gunicorn's gthread workers an open stream holds a thread, so each
+worker serves at most EVENTS_MAX_STREAMS of them and answers 503 with
+Retry-After above that; the pages retry later and keep working meanwhile.
+"""
+
+from flask import Blueprint, request, jsonify, Response
+from flask_login import current_user
+from models.models import Botiquin
+from services.events import EVENTS_MAX_STREAMS, broadcaster
+from services.tenancy import scoped_get
+
+bp = Blueprint("events", __name__)
+
+
+@bp.get("/stream")
+def stream():
+    """
+    Stream change events as text/event-stream.
+
+    Event types:
+      - compartment: {botiquin_id, company_id, compartment, quantity, status}
+      - kit:         {botiquin_id, company_id, medicines_count, critical, warning, ok, last_sync}
+
+    Company admins are always pinned to their own company channel.
+    Super admins may pass ?company_id= to narrow the channel.
+    Anyone may pass ?botiquin_id= to follow a single kit.
+    """
+    if not current_user.is_authenticated:
+        return jsonify({"error": "Not authenticated"}), 401
+
+    user = current_user
+    if not getattr(user, "active", False):
+        return jsonify({"error": "User not found"}), 404
+
+    botiquin_id = request.args.get("botiquin_id", type=int)
+
+    if user.is_super_admin():
+        company_id = request.args.get("company_id", type=int)
+    else:
+        if not user.company_id:
+            return jsonify({"error": "User not assigned to any company"}), 400
+        company_id = user.company_id
+
+    if botiquin_id is not None and not scoped_get(Botiquin, botiquin_id):
+        return jsonify({"error": "Botiquin not found"}), 404
+
+    if broadcaster.subscriber_count() >= EVENTS_MAX_STREAMS:
+        return jsonify({"error": "Too many live update streams, retry later"}), 503, {"Retry-After": "30"}
+
+    # Resolve everything above before streaming: the generator must not touch the DB
+    response = Response(broadcaster.stream(company_id=company_id, botiquin_id=botiquin_id),
+                        mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # Disable proxy buffering (nginx)
+    return response
@@ -0,0 +1,78 @@
+"""
+Routes for bulk exports.
+Streams medicines, botiquines and hardware logs as JSONL or CSV without
+building the whole result in memory.
+Rows are limited to the current user's company (super admins see everything).
+"""
+
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from flask_login import current_user
+from datetime import datetime
+from services.export import FORMATS, stream_export
+from services.tenancy import api_auth_error
+
+bp = Blueprint("exports", __name__)
+
+CONTENT_TYPES = {
+    "jsonl": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+@bp.before_request
+def require_login():
+    return api_auth_error()
+
+
+def _export_response(resource, **filters):
+    fmt = request.args.get("format", "jsonl").lower()
+    if fmt not in FORMATS:
+        return jsonify({"error": f"Invalid format '{fmt}'. Use one of: {', '.join(FORMATS)}"}), 400
+
+    # Compress only when the client advertises gzip in Accept-Encoding
+    compress = "gzip" in request.headers.get("Accept-Encoding", "")
+
+    # Resolve the principal now: the generator runs after the view returns
+    user = current_user._get_current_object()
+    body = stream_export(resource, fmt=fmt, compress=compress, user=user, **filters)
+    filename = f"{resource}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.{fmt}"
+
+    response = Response(stream_with_context(body), content_type=CONTENT_TYPES[fmt])
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    if compress:
+        response.headers["Content-Encoding"] = "gzip"
+        response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+@bp.get("/medicines")
+def export_medicines():
+    """
+    Stream all medicines.
+    Filters: botiquin_id, status (same as /api/medicines/filter).
+    Example: /api/export/medicines?format=csv&status=EXPIRED
+    """
+    return _export_response(
+        "medicines",
+        botiquin_id=request.args.get("botiquin_id"),
+        status=request.args.get("status"),
+    )
+
+
+@bp.get("/botiquines")
+def export_botiquines():
+    """Stream all botiquines. Filters: company_id."""
+    return _export_response(
+        "botiquines",
+        company_id=request.args.get("company_id"),
+    )
+
+
+@bp.get("/hardware_logs")
+def export_hardware_logs():
+    """Stream the full hardware log history. Filters: botiquin_id, processed."""
+    return _export_response(
+        "hardware_logs",
+        botiquin_id=request.args.get("botiquin_id"),
+        processed=request.args.get("processed"),
+    )
@@ -3,82 +3,75 @@ Routes for the Medicine resource.
 Updated to support botiquines and weight-based calculations.
 """
 
-from flask import Blueprint, request, jsonify
-from datetime import datetime, date
+from flask import Blueprint, g, request, jsonify
+from flask_login import current_user
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.orm import joinedload
 from db import db
 from models.models import Medicine, Botiquin
+from services.device_auth import HEADER_KEY, DeviceAuthError, verify_request
+from services.events import publish_botiquin_changes
+from services.ingest import commit_with_retry
+from services.medicine_import import (
+    IMPORT_MAX_ROWS, ImportFormatError, import_medicines, parse_date, parse_rows, validate_fields,
+)
+from services.tenancy import api_auth_error, scoped, scoped_get
 
 bp = Blueprint("medicines", __name__)
 
-# -------- Helpers --------
-def parse_date(value):
-    if isinstance(value, date):
-        return value
-    if not value:
+
+@bp.before_request
+def require_login():
+    """
+    Medicine endpoints are tenant-scoped. The hardware weight hook also accepts
+    a signed device request (services/device_auth.py), limited to its own kit.
+    """
+    g.device = None
+    if request.endpoint == "medicines.update_medicine_weight" and request.headers.get(HEADER_KEY):
+        try:
+            g.device = verify_request(request)
+        except DeviceAuthError as e:
+            return jsonify({"error": f"Device authentication failed: {e}"}), 401
         return None
+    return api_auth_error()
+
+
+# -------- Helpers --------
+def compartment_conflict(med):
+    """
+    Commit, or roll back and return a 409 when the compartment is already taken
+    or the medicine was changed by someone else meanwhile (with its current state).
+    """
+    # Read before committing: a rollback expires the object
+    message = f"Compartment {med.compartment_number} of botiquin {med.botiquin_id} already holds a medicine"
+    med_id = med.id
     try:
-        return datetime.strptime(value, "%Y-%m-%d").date()
-    except ValueError:
-        return None
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": message}), 409
+    except StaleDataError:
+        db.session.rollback()
+        return version_conflict(db.session.get(Medicine, med_id))
+    return None
+
+def version_conflict(current):
+    """409 for a write based on an outdated version; the client should merge and retry."""
+    return jsonify({
+        "error": "Medicine was modified by another request",
+        "current": current.to_dict() if current else None,
+    }), 409
 
 def validate_payload(data, *, partial=False):
-    errors = []
+    errors = validate_fields(data, partial=partial)
     
-    # Updated required fields to include botiquin_id
-    required = ["botiquin_id", "trade_name", "generic_name", "strength", "expiry_date", "quantity", "reorder_level"]
-    
-    if not partial:
-        for f in required:
-            if f not in data or data.get(f) in (None, ""):
-                if f == "botiquin_id":
-                    errors.append("'botiquin_id' is required (must assign to a botiquin)")
-                elif f == "reorder_level":
-                    errors.append("'reorder_level' is required (minimum stock threshold)")
-                elif f == "quantity":
-                    errors.append("'quantity' is required (stock count)")
-                else:
-                    errors.append(f"'{f}' is required")
-    
-    # Validate botiquin exists
-    if "botiquin_id" in data and data.get("botiquin_id"):
-        bot = Botiquin.query.get(data["botiquin_id"])
+    # Validate botiquin exists (and belongs to the current tenant)
+    if data.get("botiquin_id") and "'botiquin_id' must be an integer" not in errors:
+        bot = scoped_get(Botiquin, data["botiquin_id"])
         if not bot:
             errors.append(f"Botiquin with id {data['botiquin_id']} does not exist")
-    
-    # Validate numeric fields
-    for num_field in ["quantity", "reorder_level", "compartment_number", "max_capacity"]:
-        if num_field in data and data[num_field] is not None:
-            try:
-                v = int(data[num_field])
-                if v < 0:
-                    errors.append(f"'{num_field}' must be >= 0")
-            except (TypeError, ValueError):
-                errors.append(f"'{num_field}' must be an integer")
-    
-    # Validate float fields
-    weight_key = "average_weight" if "average_weight" in data else ("unit_weight" if "unit_weight" in data else None)
-    if weight_key and data[weight_key] is not None:
-        try:
-            unit_w = float(data[weight_key])
-            if unit_w <= 0:
-                errors.append("'average_weight' must be greater than 0")
-        except (TypeError, ValueError):
-            errors.append("'average_weight' must be a number")
-
-    if "current_weight" in data and data["current_weight"] is not None:
-        try:
-            curr_w = float(data["current_weight"])
-            if curr_w < 0:
-                errors.append("'current_weight' must be >= 0")
-        except (TypeError, ValueError):
-            errors.append("'current_weight' must be a number")
-    
-    # Validate expiry date
-    if "expiry_date" in data and data.get("expiry_date"):
-        exp = parse_date(data["expiry_date"])
-        if exp is None:
-            errors.append("'expiry_date' must be YYYY-MM-DD")
-        # Note: We allow past dates for already expired medicines in inventory
 
     return (len(errors) == 0, errors)
 
@@ -89,7 +82,7 @@ def list_medicines():
     """List all medicines, optionally filtered by botiquin"""
     botiquin_id = request.args.get("botiquin_id")
     
-    query = Medicine.query
+    query = scoped(Medicine).options(joinedload(Medicine.botiquin))  # to_dict() reads botiquin.name
     if botiquin_id:
         query = query.filter_by(botiquin_id=botiquin_id)
     
@@ -100,7 +93,7 @@ def list_medicines():
 @bp.get("/botiquin/<int:botiquin_id>")
 def list_medicines_by_botiquin(botiquin_id):
     """List all medicines in a specific botiquin"""
-    botiquin = Botiquin.query.get(botiquin_id)
+    botiquin = scoped_get(Botiquin, botiquin_id)
     if not botiquin:
         return jsonify({"error": "Botiquin not found"}), 404
     
@@ -121,7 +114,7 @@ def filter_medicines():
     status = request.args.get("status")
     botiquin_id = request.args.get("botiquin_id")
     
-    query = Medicine.query
+    query = scoped(Medicine).options(joinedload(Medicine.botiquin))
     if botiquin_id:
         query = query.filter_by(botiquin_id=botiquin_id)
     
@@ -143,7 +136,7 @@ def get_alerts():
     """
     botiquin_id = request.args.get("botiquin_id")
     
-    query = Medicine.query
+    query = scoped(Medicine).options(joinedload(Medicine.botiquin))
     if botiquin_id:
         query = query.filter_by(botiquin_id=botiquin_id)
     
@@ -200,13 +193,39 @@ def create_medicine():
         med.calculate_quantity_from_weight()
     
     db.session.add(med)
-    db.session.commit()
+    conflict = compartment_conflict(med)
+    if conflict:
+        return conflict
     return jsonify(med.to_dict()), 201
 
 
+@bp.post("/bulk")
+def bulk_import_medicines():
+    """
+    Create or update many medicines at once.
+    Body: a JSON array (or {"medicines": [...]}) of medicine objects, or CSV
+    (Content-Type: text/csv) with the same field names as columns.
+    Rows are matched on (botiquin_id, compartment_number); see services/medicine_import.py.
+    Returns per-row results; invalid rows do not stop the rest of the batch.
+    """
+    fmt = "csv" if request.mimetype in ("text/csv", "application/csv") else "json"
+    try:
+        rows = parse_rows(request.get_data(as_text=True), fmt)
+    except (ImportFormatError, ValueError) as e:
+        return jsonify({"error": str(e) if isinstance(e, ImportFormatError) else "Invalid JSON"}), 400
+
+    if not rows:
+        return jsonify({"error": "No rows provided"}), 400
+    if len(rows) > IMPORT_MAX_ROWS:
+        return jsonify({"error": f"At most {IMPORT_MAX_ROWS} rows per request"}), 413
+
+    result = import_medicines(rows, user=current_user._get_current_object())
+    return jsonify(result), 200
+
+
 @bp.get("/<int:med_id>")
 def get_medicine(med_id):
-    med = Medicine.query.get(med_id)
+    med = scoped_get(Medicine, med_id)
     if not med:
         return jsonify({"error": "Medicine not found"}), 404
     return jsonify(med.to_dict()), 200
@@ -214,7 +233,7 @@ def get_medicine(med_id):
 
 @bp.put("/<int:med_id>")
 def update_medicine(med_id):
-    med = Medicine.query.get(med_id)
+    med = scoped_get(Medicine, med_id)
     if not med:
         return jsonify({"error": "Medicine not found"}), 404
 
@@ -223,6 +242,15 @@ def update_medicine(med_id):
     if not ok:
         return jsonify({"errors": errors}), 400
 
+    # Optional optimistic check: "version" is the one the client last read
+    if data.get("version") is not None:
+        try:
+            expected = int(data["version"])
+        except (TypeError, ValueError):
+            return jsonify({"errors": ["'version' must be an integer"]}), 400
+        if expected != med.version:
+            return version_conflict(med)
+
     # List of fields that can be updated
     fields = [
         "botiquin_id", "compartment_number", "trade_name", "generic_name", 
@@ -259,13 +287,15 @@ def update_medicine(med_id):
         if med.unit_weight and med.current_weight:
             med.calculate_quantity_from_weight()
 
-    db.session.commit()
+    conflict = compartment_conflict(med)
+    if conflict:
+        return conflict
     return jsonify(med.to_dict()), 200
 
 
 @bp.delete("/<int:med_id>")
 def delete_medicine(med_id):
-    med = Medicine.query.get(med_id)
+    med = scoped_get(Medicine, med_id)
     if not med:
         return jsonify({"error": "Medicine not found"}), 404
 
@@ -279,11 +309,8 @@ def update_medicine_weight(med_id):
     """
     Special endpoint to update medicine weight from hardware.
     Automatically calculates new quantity.
+    Callers: a signed device (medicines of its own kit) or a logged-in user (their tenant).
     """
-    med = Medicine.query.get(med_id)
-    if not med:
-        return jsonify({"error": "Medicine not found"}), 404
-    
     data = request.get_json() or {}
     weight = data.get("weight")
     
@@ -296,12 +323,28 @@ def update_medicine_weight(med_id):
             return jsonify({"error": "Weight must be >= 0"}), 400
     except (TypeError, ValueError):
         return jsonify({"error": "Weight must be a number"}), 400
-    
-    # Update weight and calculate new quantity
-    old_quantity = med.quantity
-    new_quantity = med.update_from_sensor(weight)
-    
-    db.session.commit()
+
+    def apply():
+        if g.device is not None:
+            med = Medicine.query.filter_by(id=med_id, botiquin_id=g.device.botiquin_id).first()
+        else:
+            med = scoped_get(Medicine, med_id)
+        if not med:
+            return None, None, None
+        # Update weight and calculate new quantity
+        old_quantity = med.quantity
+        return med, old_quantity, med.update_from_sensor(weight)
+
+    # Replayed on a fresh row if a concurrent write bumped its version
+    try:
+        med, old_quantity, new_quantity = commit_with_retry(apply)
+    except StaleDataError:
+        return jsonify({"error": "Medicine is being updated concurrently, retry later"}), 409, {"Retry-After": "1"}
+    if not med:
+        return jsonify({"error": "Medicine not found"}), 404
+
+    if med.compartment_number is not None:
+        publish_botiquin_changes(med.botiquin, [(med.compartment_number, new_quantity, med.status())])
     
     return jsonify({
         "medicine": med.to_dict(),
@@ -0,0 +1,80 @@
+"""
+Operational metrics. Numbers are per worker process.
+
+- /api/metrics/*: JSON views for super admins, including the request
+  profiles captured with ?_profile=1 (see services/profiling.py)
+- /metrics: Prometheus text format for scrapers, summed over all processes
+  with METRICS_MULTIPROC_DIR. With METRICS_TOKEN set it requires
+  `Authorization: Bearer <token>`; without it, only logged-in super admins
+  and, in debug or testing, local requests may read it (behind a reverse
+  proxy every request looks local, so production needs the token)
+"""
+
+from flask import Blueprint, Response, current_app, jsonify, request
+from flask_login import current_user
+from services.metrics import METRICS_TOKEN, PROMETHEUS_CONTENT_TYPE, render_metrics, token_matches
+from services.pool_metrics import pool_stats
+from services.profiling import profile_store
+from services.tenancy import api_auth_error
+
+LOCAL_ADDRESSES = {"127.0.0.1", "::1"}
+
+bp = Blueprint("metrics", __name__)
+prometheus_bp = Blueprint("prometheus", __name__)
+
+
+@bp.before_request
+def require_super_admin():
+    auth_error = api_auth_error()
+    if auth_error:
+        return auth_error
+    if not current_user.is_super_admin():
+        return jsonify({"error": "Access denied"}), 403
+    return None
+
+
+@bp.get("/pool")
+def get_pool_metrics():
+    """
+    Database connection pools: size, checked out, overflow, checkout
+    timeouts and a histogram of how long checkouts waited.
+    """
+    return jsonify(pool_stats()), 200
+
+
+@bp.get("/profiles")
+def list_profiles():
+    """Most recent request profiles first (all workers on this host)."""
+    return jsonify(profile_store.summaries()), 200
+
+
+@bp.get("/profiles/<profile_id>")
+def get_profile(profile_id):
+    """One profile: folded stacks (or top functions) and the request's SQL."""
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        return jsonify({"error": "Profile not found (it may have been rotated out)"}), 404
+    return jsonify(profile), 200
+
+
+@bp.get("/profiles/<profile_id>/folded")
+def get_profile_folded(profile_id):
+    """Folded stacks as text, for flamegraph.pl or speedscope."""
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        return jsonify({"error": "Profile not found"}), 404
+    lines = [f"{stack} {count}" for stack, count in sorted(profile["folded"].items())]
+    return Response("\n".join(lines) + "\n", mimetype="text/plain")
+
+
+@prometheus_bp.get("/metrics")
+def scrape():
+    """Latency histograms, ingest counters, pool gauges and cache ratios for Prometheus."""
+    if METRICS_TOKEN:
+        if not token_matches(request.headers.get("Authorization")):
+            return jsonify({"error": "Invalid metrics token"}), 401
+    elif not (current_user.is_authenticated and current_user.is_super_admin()) and not (
+        (current_app.debug or current_app.testing) and request.remote_addr in LOCAL_ADDRESSES
+    ):
+        return jsonify({"error": "Access denied (set METRICS_TOKEN for scrapers)"}), 403
+    return Response(render_metrics(), mimetype=PROMETHEUS_CONTENT_TYPE)
@@ -6,8 +6,11 @@ Handles dashboard views for multiple first aid kits.
 from flask import Blueprint, render_template, request, redirect, url_for, jsonify, flash
 from flask_login import current_user, login_required, logout_user
 from models.models import Medicine, Botiquin, Company, User
-from datetime import datetime
 from db import db
+from services.inventory import build_inventory, DEFAULT_PER_PAGE
+from services.rollups import botiquin_rollups
+from services.companies import company_summaries
+from services.tenancy import scoped_get
 
 bp = Blueprint("pages", __name__)
 
@@ -43,38 +46,42 @@ def dashboard():
         return redirect(url_for("users.login"))
 
     # Get botiquines based on user type
+    query = (
+        db.session.query(Botiquin, Company.name)
+        .outerjoin(Company, Botiquin.company_id == Company.id)
+        .filter(Botiquin.active.is_(True))
+    )
     if user.is_super_admin():
         # Super admin sees all
-        botiquines = Botiquin.query.filter_by(active=True).all()
-        companies = Company.query.filter_by(active=True).all()
+        companies_count = Company.query.filter_by(active=True).count()
         show_company = True
     else:
         # Company admin sees only their company's botiquines
         if not user.company_id:
             return "User not assigned to any company", 403
-        botiquines = Botiquin.query.filter_by(
-            company_id=user.company_id, 
-            active=True
-        ).all()
-        companies = [user.company] if user.company else []
+        query = query.filter(Botiquin.company_id == user.company_id)
+        companies_count = None
         show_company = False
-    
-    # Collect statistics
+
+    botiquines = query.order_by(Botiquin.id.asc()).all()
+
+    # Counters come from the precomputed rollup rows, not from the medicines
+    rollups = botiquin_rollups([bot.id for bot, _ in botiquines])
+
     total_medicines = 0
     critical_count = 0
     warning_count = 0
-    
+
     botiquines_data = []
-    for bot in botiquines:
-        medicines = bot.medicines
-        bot_critical = sum(1 for m in medicines if m.status() in ["EXPIRED", "OUT_OF_STOCK"])
-        bot_warning = sum(1 for m in medicines if m.status() in ["EXPIRES_SOON", "LOW_STOCK"])
-        
-        total_medicines += len(medicines)
+    for bot, company_name in botiquines:
+        rollup = rollups.get(bot.id)
+        medicines_count = rollup.medicine_count if rollup else 0
+        bot_critical = rollup.critical if rollup else 0
+        bot_warning = rollup.warning if rollup else 0
+
+        total_medicines += medicines_count
         critical_count += bot_critical
         warning_count += bot_warning
-        
-        company_name = bot.company.name if bot.company else None
 
         botiquines_data.append({
             "id": bot.id,
@@ -82,11 +89,12 @@ def dashboard():
             "location": bot.location,
             "company_name": company_name,
             "is_assigned": company_name is not None,
-            "medicines_count": len(medicines),
+            "medicines_count": medicines_count,
             "critical": bot_critical,
             "warning": bot_warning,
             "compartments_total": bot.total_compartments,
-            "last_sync": bot.last_sync_at.strftime("%Y-%m-%d %H:%M:%S") if bot.last_sync_at else "Never"
+            "last_sync": bot.last_sync_at.strftime("%Y-%m-%d %H:%M:%S") if bot.last_sync_at else "Never",
+            "version": rollup.version if rollup else None
         })
     
     summary = {
@@ -94,7 +102,7 @@ def dashboard():
         "total_medicines": total_medicines,
         "critical": critical_count,
         "warning": warning_count,
-        "companies": len(companies) if show_company else None
+        "companies": companies_count
     }
     
     return render_template(
@@ -115,27 +123,24 @@ def botiquin_detail(botiquin_id):
         flash("Tu cuenta está inactiva", "danger")
         return redirect(url_for("users.login"))
     
-    botiquin = Botiquin.query.get(botiquin_id)
+    # Kits of other companies are simply not found
+    botiquin = scoped_get(Botiquin, botiquin_id)
     if not botiquin:
         return "Botiquin not found", 404
     
-    # Check access permissions
-    if not user.is_super_admin() and botiquin.company_id != user.company_id:
-        return "Access denied", 403
-    
     # Get filter parameters
     status_filter = request.args.get("status")
     
     # Build comp_map: list of dicts with keys: number, medicine_name, status, quantity
-    comp_status = botiquin.get_compartment_status()
     comp_map = {}
-    for number, data in comp_status.items():
-        comp_map[number] = {
-            "number": number,
-            "medicine_name": data.get("medicine") if data else None,
-            "status": data.get("status") if data else None,
-            "quantity": data.get("quantity") if data else None,
-        }
+    for med in botiquin.medicines:
+        if med.compartment_number and med.compartment_number not in comp_map:
+            comp_map[med.compartment_number] = {
+                "number": med.compartment_number,
+                "medicine_name": med.trade_name,
+                "status": med.status(),
+                "quantity": med.quantity,
+            }
     
     # Get medicines list
     medicines = botiquin.medicines
@@ -153,13 +158,16 @@ def botiquin_detail(botiquin_id):
         "last_sync": botiquin.last_sync_at.strftime("%Y-%m-%d %H:%M:%S") if botiquin.last_sync_at else "Never"
     }
     
+    rollup = botiquin_rollups([botiquin.id]).get(botiquin.id)
+
     return render_template(
         "botiquin_detail.html",
         botiquin=botiquin,
+        version=rollup.version if rollup else None,
         summary=summary,
         current_status=status_filter,
         comp_map=comp_map,
-        grid_cols=botiquin.compartment_cols
+        grid_cols=min(botiquin.total_compartments, 4)
     )
 
 
@@ -173,36 +181,30 @@ def botiquin_inventory(botiquin_id):
         flash("Tu cuenta está inactiva", "danger")
         return redirect(url_for("users.login"))
     
-    botiquin = Botiquin.query.get(botiquin_id)
+    # Kits of other companies are simply not found
+    botiquin = scoped_get(Botiquin, botiquin_id)
     if not botiquin:
         return "Botiquin not found", 404
     
-    # Check access permissions
-    if not user.is_super_admin() and botiquin.company_id != user.company_id:
-        return "Access denied", 403
-    
     status_filter = request.args.get("status")
     
-    medicines = botiquin.medicines
-    if status_filter:
-        medicines = [m for m in medicines if m.status() == status_filter]
-    
-    grouped_data = {botiquin.name: [med.to_dict() for med in medicines]}
-    
-    all_medicines = botiquin.medicines
-    summary = {
-        "total": len(all_medicines),
-        "critical": sum(1 for m in all_medicines if m.status() in ["EXPIRED", "OUT_OF_STOCK"]),
-        "low_stock": sum(1 for m in all_medicines if m.status() == "LOW_STOCK"),
-        "last_update": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
+    # Same view-model as /inventory, limited to this kit
+    view = build_inventory(
+        company_id=botiquin.company_id,
+        botiquin_id=botiquin.id,
+        status_filter=status_filter,
+        per_page=1,
+        include_inactive=True,
+    )
     
     return render_template(
         "inventory.html",
-        grouped_data=grouped_data,
-        summary=summary,
+        grouped_data=view["grouped_data"],
+        summary=view["summary"],
         current_status=status_filter,
-        show_company=False
+        show_company=False,
+        display_count=view["display_count"],
+        pagination=view["pagination"]
     )
 
 
@@ -217,112 +219,35 @@ def inventory():
         return redirect(url_for("users.login"))
 
     status_filter = request.args.get("status")
+    page = request.args.get("page", 1, type=int)
+    per_page = request.args.get("per_page", DEFAULT_PER_PAGE, type=int)
 
     # Determine scope based on role
     if user.is_super_admin():
-        botiquines = Botiquin.query.filter_by(active=True).all()
+        company_id = None
         show_company = True
     else:
         if not user.company_id:
             return "User not assigned to any company", 403
-        botiquines = Botiquin.query.filter_by(company_id=user.company_id, active=True).all()
+        company_id = user.company_id
         show_company = False
 
-    grouped_data = {}
-
-    total_medicines = 0
-    total_critical = 0
-    total_warning = 0
-    latest_sync = None
-    display_count = 0
-
-    for bot in botiquines:
-        medicines = bot.medicines
-        med_total = len(medicines)
-
-        total_medicines += med_total
-        total_critical += sum(1 for m in medicines if m.status() in ["EXPIRED", "OUT_OF_STOCK"])
-        total_warning += sum(1 for m in medicines if m.status() in ["EXPIRES_SOON", "EXPIRES_30", "LOW_STOCK"])
-
-        if bot.last_sync_at and (latest_sync is None or bot.last_sync_at > latest_sync):
-            latest_sync = bot.last_sync_at
-
-        section_key = bot.name
-        if show_company:
-            company_label = bot.company.name if bot.company else "Sin asignar"
-            section_key = f"{bot.name} · {company_label}"
-
-        rows = []
-        for compartment_number in range(1, bot.total_compartments + 1):
-            med = next((m for m in medicines if m.compartment_number == compartment_number), None)
-
-            if med is None and status_filter:
-                continue
-
-            status = med.status() if med else "EMPTY"
-            if status_filter:
-                if med is None:
-                    continue
-                if status_filter == "OK":
-                    if status != "OK":
-                        continue
-                elif status != status_filter:
-                    continue
-
-            row = {
-                "bot_id": bot.id,
-                "bot_name": bot.name,
-                "company_name": bot.company.name if bot.company else None,
-                "location": bot.location,
-                "compartment": compartment_number,
-                "has_medicine": med is not None,
-                "trade_name": med.trade_name if med else None,
-                "generic_name": med.generic_name if med else None,
-                "brand": med.brand if med else None,
-                "strength": med.strength if med else None,
-                "average_weight": med.unit_weight if med else None,
-                "current_weight": med.current_weight if med else None,
-                "quantity": med.quantity if med else 0,
-                "reorder_level": med.reorder_level if med else None,
-                "max_capacity": med.max_capacity if med else None,
-                "expiry_date": med.expiry_date.isoformat() if med and med.expiry_date else None,
-                "days_to_expiry": med.days_to_expiry() if med else None,
-                "status": status,
-                "last_scan": med.last_scan_at.strftime("%Y-%m-%d %H:%M:%S") if med and med.last_scan_at else None,
-            }
-
-            rows.append(row)
-            display_count += 1
-
-        if not rows:
-            continue
-
-        grouped_data[section_key] = {
-            "bot": {
-                "id": bot.id,
-                "name": bot.name,
-                "company_name": bot.company.name if bot.company else None,
-                "location": bot.location,
-                "last_sync": bot.last_sync_at.strftime("%Y-%m-%d %H:%M:%S") if bot.last_sync_at else "Never",
-            },
-            "rows": rows
-        }
-
-    summary = {
-        "total_botiquines": len(botiquines),
-        "total_medicines": total_medicines,
-        "critical_alerts": total_critical,
-        "warning_alerts": total_warning,
-        "last_update": latest_sync.strftime("%Y-%m-%d %H:%M:%S") if latest_sync else "Nunca"
-    }
+    view = build_inventory(
+        company_id=company_id,
+        status_filter=status_filter,
+        page=page,
+        per_page=per_page,
+        show_company=show_company,
+    )
 
     return render_template(
         "inventory.html",
-        grouped_data=grouped_data,
-        summary=summary,
+        grouped_data=view["grouped_data"],
+        summary=view["summary"],
         current_status=status_filter,
         show_company=show_company,
-        display_count=display_count
+        display_count=view["display_count"],
+        pagination=view["pagination"]
     )
 
 
@@ -339,18 +264,18 @@ def companies():
     if not user.is_super_admin():
         return "Access denied", 403
     
-    companies = Company.query.all()
+    companies = company_summaries()
     companies_data = []
     
-    for company in companies:
+    for company, botiquines_count, users_count in companies:
         companies_data.append({
             "id": company.id,
             "name": company.name,
             "email": company.contact_email,
             "phone": company.contact_phone,
             "active": company.active,
-            "botiquines_count": len(company.botiquines),
-            "users_count": len(company.users),
+            "botiquines_count": botiquines_count,
+            "users_count": users_count,
             "created": company.created_at.strftime("%Y-%m-%d")
         })
     
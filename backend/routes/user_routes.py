@@ -4,15 +4,23 @@ Updated to support super_admin and company_admin roles.
 """
 
 from flask import Blueprint, request, jsonify, redirect, url_for, render_template, flash
-from flask_login import login_user, logout_user, current_user, login_required
-from werkzeug.security import check_password_hash, generate_password_hash
+from flask_login import login_user, logout_user, current_user
 from datetime import datetime
+from sqlalchemy.orm import joinedload
 from db import db
 from models.models import User, Company
+from services.session_cache import invalidate_user
+from services.passwords import PasswordPoolBusy, PasswordPoolTimeout, check_user_password
+from services.tenancy import scoped, scoped_get
 
 bp = Blueprint("users", __name__)
 
 
+def password_service_busy():
+    """503 for a hash/verify the password pool could not take (PasswordPoolBusy / Timeout)."""
+    return jsonify({"error": "Password service busy, please retry"}), 503, {"Retry-After": "2"}
+
+
 @bp.route("/login", methods=["GET", "POST"])
 def login():
     """Handle user login - FIXED to handle both form and JSON data"""
@@ -43,11 +51,24 @@ def login():
         # Query user
         user = User.query.filter_by(username=username, active=True).first()
 
-        if user and user.check_password(password):
+        try:
+            # Hashing runs in a bounded pool; outdated hashes are upgraded here
+            valid = bool(user) and check_user_password(user, password)
+        except (PasswordPoolBusy, PasswordPoolTimeout):
+            error_msg = "Too many login attempts right now, please retry in a moment"
+            if request.content_type and 'application/json' in request.content_type:
+                response = jsonify({"error": error_msg})
+            else:
+                response = render_template("login.html", error=error_msg)
+            return response, 503, {"Retry-After": "2"}
+
+        if valid:
             # Update last login
             user.last_login = datetime.utcnow()
             db.session.commit()
             
+            # Start the new session from fresh principal data
+            invalidate_user(user.id)
             login_user(user)
             
             # Redirect based on request type
@@ -93,12 +114,8 @@ def list_users():
     if not getattr(current_user, "active", False):
         return jsonify({"error": "User not found"}), 404
 
-    if current_user.is_super_admin():
-        # Super admin sees all
-        users = User.query.all()
-    else:
-        # Company admin sees only their company
-        users = User.query.filter_by(company_id=current_user.company_id).all()
+    # Super admin sees all, company admin sees only their company
+    users = scoped(User).options(joinedload(User.company)).all()
     
     return jsonify([u.to_dict() for u in users]), 200
 
@@ -148,7 +165,10 @@ def create_user():
         company_id=data.get("company_id") if data["user_type"] == "company_admin" else None,
         active=data.get("active", True)
     )
-    user.set_password(data["password"])
+    try:
+        user.set_password(data["password"])
+    except (PasswordPoolBusy, PasswordPoolTimeout):
+        return password_service_busy()
     
     db.session.add(user)
     db.session.commit()
@@ -165,15 +185,11 @@ def get_user(user_id):
     if not getattr(current_user, "active", False):
         return jsonify({"error": "Current user not found"}), 404
     
-    user = User.query.get(user_id)
+    # Users of other companies are simply not found
+    user = scoped_get(User, user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
     
-    # Check permissions
-    if not current_user.is_super_admin():
-        if user.company_id != current_user.company_id:
-            return jsonify({"error": "Access denied"}), 403
-    
     return jsonify(user.to_dict()), 200
 
 
@@ -189,14 +205,13 @@ def update_user(user_id):
     if not getattr(current_user, "active", False):
         return jsonify({"error": "Current user not found"}), 404
     
-    user = User.query.get(user_id)
+    # Users of other companies are simply not found
+    user = scoped_get(User, user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
     
     # Check permissions
     if not current_user.is_super_admin():
-        if user.company_id != current_user.company_id:
-            return jsonify({"error": "Access denied"}), 403
         # Company admin cannot change user_type or company_id
         data = request.get_json() or {}
         if "user_type" in data or "company_id" in data:
@@ -209,7 +224,11 @@ def update_user(user_id):
         user.email = data["email"]
     
     if "password" in data and data["password"]:
-        user.set_password(data["password"])
+        try:
+            user.set_password(data["password"])
+        except (PasswordPoolBusy, PasswordPoolTimeout):
+            db.session.rollback()
+            return password_service_busy()
     
     if "active" in data:
         user.active = data["active"]
@@ -229,6 +248,7 @@ def update_user(user_id):
             user.company_id = data["company_id"]
     
     db.session.commit()
+    invalidate_user(user.id)
     return jsonify(user.to_dict()), 200
 
 
@@ -255,6 +275,7 @@ def delete_user(user_id):
     # Soft delete (deactivate)
     user.active = False
     db.session.commit()
+    invalidate_user(user.id)
     
     return jsonify({"message": "User deactivated successfully"}), 200
 
@@ -288,12 +309,20 @@ def change_password():
         return jsonify({"error": "Current and new password required"}), 400
     
     # Verify current password
-    if not user.check_password(data["current_password"]):
+    try:
+        valid = user.check_password(data["current_password"])
+    except (PasswordPoolBusy, PasswordPoolTimeout):
+        return password_service_busy()
+    if not valid:
         return jsonify({"error": "Current password is incorrect"}), 401
     
     # Update password
-    user.set_password(data["new_password"])
+    try:
+        user.set_password(data["new_password"])
+    except (PasswordPoolBusy, PasswordPoolTimeout):
+        return password_service_busy()
     db.session.commit()
+    invalidate_user(user.id)
     
     return jsonify({"message": "Password updated successfully"}), 200
 
@@ -311,6 +340,6 @@ def check_auth():
             "id": user.id,
             "username": user.username,
             "user_type": user.user_type,
-            "company": user.company.name if user.company else None
+            "company": user.company_name
         }
     }), 200
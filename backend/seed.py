@@ -1,14 +1,19 @@
 # seed.py
 from datetime import date, datetime, timedelta
 
+from flask_migrate import upgrade
+
 from app import app, db
+from db import MIGRATIONS_DIR
 from models import User, Company, Botiquin, Medicine
 
 def init_db():
     with app.app_context():
-        # Drop and recreate all tables
+        # Drop everything (including the migration stamp) and rebuild through the migrations
         db.drop_all()
-        db.create_all()
+        db.session.execute(db.text("DROP TABLE IF EXISTS alembic_version"))
+        db.session.commit()
+        upgrade(directory=MIGRATIONS_DIR)
 
         # Seed superadmin user
         superadmin = User(
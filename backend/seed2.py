@@ -1,13 +1,16 @@
 from datetime import datetime, timedelta
-from db import db
+from flask_migrate import upgrade
+from db import db, MIGRATIONS_DIR
 from models.models import User, Medicine
 from app import app
 
 # Run all DB work inside the Flask app context
 with app.app_context():
-    # Reset schema for a clean seed
+    # Reset schema for a clean seed (rebuilt through the migrations)
     db.drop_all()
-    db.create_all()
+    db.session.execute(db.text("DROP TABLE IF EXISTS alembic_version"))
+    db.session.commit()
+    upgrade(directory=MIGRATIONS_DIR)
 
     # --- Single demo user ---
     demo_user = User(username='demo')
@@ -0,0 +1,319 @@
+"""
+Asyncio front end for the device endpoints.
+
+The Flask app ties up a worker thread per connection, so slow or flaky kits
+on cellular links can exhaust the pool while their bodies trickle in. This
+server accepts the device traffic on an event loop instead:
+
+- Only POST /api/hardware/sensor_data and /api/hardware/test_connection (plus
+  GET /health and GET /metrics) are served; the Flask app keeps serving the
+  UI and admin API
+- GET /metrics is this process's Prometheus exposition (its ingest counters
+  included) and needs `Authorization: Bearer <METRICS_TOKEN>`. With a
+  METRICS_MULTIPROC_DIR shared with gunicorn it is the same sum as the Flask
+  /metrics, so scrape one of them
+- Reading headers and bodies happens on the loop, so an idle or slow
+  connection costs a coroutine and a socket, not a thread
+- Once a request is complete, the same code as the Flask routes runs in a
+  small thread pool (INGEST_DB_WORKERS) inside an app context: HMAC auth, rate
+  limits and services/ingest.py (group commit included when enabled)
+- At most INGEST_MAX_PENDING requests wait for that pool; above that devices
+  get a 503 with Retry-After instead of piling up
+- INGEST_READ_TIMEOUT bounds each header/body read, INGEST_IDLE_TIMEOUT a
+  keep-alive connection between requests, INGEST_MAX_BODY the body size
+
+This server is a separate process, so anything the Flask workers keep in
+memory is not shared with it. It refuses to start unless live updates go
+through a shared relay (EVENTS_STORE, see services/events.py) and, when rate
+limiting is on, the buckets through a shared store (RATE_LIMIT_STORE).
+
+Bodies must carry a Content-Length (no chunked uploads), which is what the
+kit firmware sends. For tens of thousands of connections per process, raise
+the open-file limit (`ulimit -n`).
+
+Run from backend/:
+
+    flask --app app.py ingest-serve --host 0.0.0.0 --port 5002
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from werkzeug.datastructures import Headers
+
+from services.events import broadcaster
+from services.metrics import METRICS_TOKEN, PROMETHEUS_CONTENT_TYPE, render_metrics, token_matches
+from services.ingest import (
+    IngestOutcome, authenticate_device_request, connection_status, ingest, rate_limit_device_request,
+)
+from services.rate_limit import RATE_LIMIT_ENABLED, MemoryBucketStore, limiter
+
+INGEST_DB_WORKERS = int(os.getenv("INGEST_DB_WORKERS", "8"))
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "1000"))
+INGEST_READ_TIMEOUT = float(os.getenv("INGEST_READ_TIMEOUT", "30"))
+INGEST_IDLE_TIMEOUT = float(os.getenv("INGEST_IDLE_TIMEOUT", "75"))
+INGEST_MAX_BODY = int(os.getenv("INGEST_MAX_BODY", str(256 * 1024)))
+MAX_HEADER_BYTES = 16 * 1024
+
+METRICS_PATH = "/metrics"
+SENSOR_PATH = "/api/hardware/sensor_data"
+CONNECTION_PATH = "/api/hardware/test_connection"
+
+log = logging.getLogger("ingest.async")
+
+
+class DeviceRequest:
+    """
+    The parts of a Flask request that the device checks use
+    (method, path, headers, get_data, get_json, remote_addr).
+    """
+
+    def __init__(self, method, path, headers, body, remote_addr):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.remote_addr = remote_addr
+        self._body = body
+        self._json = None
+        self._parsed = False
+
+    def get_data(self, cache=True):
+        return self._body
+
+    def get_json(self, silent=False):
+        if not self._parsed:
+            self._parsed = True
+            try:
+                self._json = json.loads(self._body) if self._body else None
+            except ValueError:
+                if not silent:
+                    raise
+        return self._json
+
+
+class HttpError(Exception):
+    """Malformed request: answer with `status` and close the connection."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def shared_state_problems():
+    """Settings under which this process would drift apart from the Flask workers (empty when fine)."""
+    problems = []
+    if broadcaster.relay is None:
+        problems.append("EVENTS_STORE is 'memory': payloads ingested here would never reach "
+                        "/api/events/stream. Set it to a SQLite path shared with the Flask workers.")
+    if RATE_LIMIT_ENABLED and isinstance(limiter.store, MemoryBucketStore):
+        problems.append("RATE_LIMIT_STORE is 'memory': this server would keep its own buckets. "
+                        "Set it to a SQLite path shared with the Flask workers.")
+    return problems
+
+
+# -------- Request handling (thread pool, inside an app context) --------
+def handle_device_request(req):
+    """Run one device request through the same checks and services as the Flask routes."""
+    device, error = authenticate_device_request(req)
+    if error:
+        return error
+    error = rate_limit_device_request(req, device)
+    if error:
+        return error
+
+    try:
+        data = req.get_json()
+    except ValueError:
+        return IngestOutcome(400, {"error": "Body is not valid JSON"})
+    if req.path == CONNECTION_PATH:
+        return connection_status(data if isinstance(data, dict) else {})
+    if not data:
+        return IngestOutcome(400, {"error": "No data provided"})
+    if not isinstance(data, dict):
+        return IngestOutcome(400, {"error": "Expected a JSON object"})
+    return ingest(data)
+
+
+class IngestServer:
+    def __init__(self, app, workers=INGEST_DB_WORKERS, max_pending=INGEST_MAX_PENDING):
+        self.app = app
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest-db")
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.connections = 0
+        self.requests = 0
+        self.rejected = 0
+        self.statuses = {}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "connections": self.connections,
+                "pending": self.pending,
+                "requests": self.requests,
+                "rejected": self.rejected,
+                "statuses": dict(self.statuses),
+            }
+
+    def _run(self, req):
+        with self.app.app_context():
+            try:
+                return handle_device_request(req)
+            except Exception:
+                log.exception("Device request failed: %s %s", req.method, req.path)
+                return IngestOutcome(500, {"error": "Internal error"})
+
+    async def dispatch(self, req):
+        if req.method == "GET" and req.path == "/health":
+            return IngestOutcome(200, {"status": "ok", **self.stats()})
+        if req.method == "GET" and req.path == METRICS_PATH:
+            return await self._metrics(req)
+        if req.path not in (SENSOR_PATH, CONNECTION_PATH):
+            return IngestOutcome(404, {"error": "Not found"})
+        if req.method != "POST":
+            return IngestOutcome(405, {"error": "Method not allowed"}, headers={"Allow": "POST"})
+
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                return IngestOutcome(503, {"error": "Ingest is backed up, retry later"}, headers={"Retry-After": "1"})
+            self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._run, req)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    @staticmethod
+    async def _metrics(req):
+        # No sessions here: the token is the only way in
+        if not METRICS_TOKEN:
+            return IngestOutcome(403, {"error": "Set METRICS_TOKEN to scrape this server"})
+        if not token_matches(req.headers.get("Authorization")):
+            return IngestOutcome(401, {"error": "Invalid metrics token"})
+        text = await asyncio.get_running_loop().run_in_executor(None, render_metrics)
+        return IngestOutcome(200, text, headers={"Content-Type": PROMETHEUS_CONTENT_TYPE})
+
+    # -------- HTTP/1.1 --------
+    async def _read_request(self, reader, writer, first):
+        timeout = INGEST_IDLE_TIMEOUT if not first else INGEST_READ_TIMEOUT
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                raise HttpError(400, "Incomplete request head")
+            return None
+        except asyncio.LimitOverrunError:
+            raise HttpError(431, "Request head too large")
+
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ", 2)
+        except ValueError:
+            raise HttpError(400, "Malformed request line")
+        headers = Headers()
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, sep, value = line.partition(":")
+            if not sep:
+                raise HttpError(400, "Malformed header")
+            headers.add(name.strip(), value.strip())
+
+        if "chunked" in headers.get("Transfer-Encoding", "").lower():
+            raise HttpError(411, "Content-Length required")
+        try:
+            length = int(headers.get("Content-Length", "0"))
+        except ValueError:
+            raise HttpError(400, "Invalid Content-Length")
+        if length < 0 or length > INGEST_MAX_BODY:
+            raise HttpError(413, "Body too large")
+
+        if length and headers.get("Expect", "").lower() == "100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            await writer.drain()
+        try:
+            body = await asyncio.wait_for(reader.readexactly(length), INGEST_READ_TIMEOUT) if length else b""
+        except asyncio.IncompleteReadError:
+            return None
+
+        connection = headers.get("Connection", "").lower()
+        keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+        peer = writer.get_extra_info("peername")
+        req = DeviceRequest(method.upper(), target.split("?", 1)[0], headers, body, peer[0] if peer else None)
+        return req, keep_alive
+
+    @staticmethod
+    def _write_response(writer, outcome, keep_alive):
+        # Text bodies (the metrics exposition) go out as they are
+        if isinstance(outcome.body, str):
+            body = outcome.body.encode("utf-8")
+        else:
+            body = json.dumps(outcome.body).encode("utf-8")
+        headers = {"Content-Type": "application/json", **(outcome.headers or {})}
+        status = HTTPStatus(outcome.status)
+        head = [
+            f"HTTP/1.1 {status.value} {status.phrase}",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        head.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+
+    async def handle_connection(self, reader, writer):
+        with self._lock:
+            self.connections += 1
+        first = True
+        try:
+            while True:
+                try:
+                    parsed = await self._read_request(reader, writer, first)
+                except HttpError as e:
+                    self._write_response(writer, IngestOutcome(e.status, {"error": str(e)}), False)
+                    await writer.drain()
+                    break
+                except asyncio.TimeoutError:
+                    break
+                if parsed is None:
+                    break
+                req, keep_alive = parsed
+                first = False
+
+                outcome = await self.dispatch(req)
+                with self._lock:
+                    self.requests += 1
+                    self.statuses[outcome.status] = self.statuses.get(outcome.status, 0) + 1
+                self._write_response(writer, outcome, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            with self._lock:
+                self.connections -= 1
+            writer.close()
+
+    async def serve(self, host, port, ready=None):
+        server = await asyncio.start_server(
+            self.handle_connection, host, port, limit=MAX_HEADER_BYTES, backlog=4096,
+        )
+        if ready is not None:
+            ready(server)
+        async with server:
+            await server.serve_forever()
+
+
+def run_ingest_server(app, host="0.0.0.0", port=5002, ready=None):
+    """Serve the device endpoints until interrupted; `ready(server)` runs once listening."""
+    try:
+        asyncio.run(IngestServer(app).serve(host, port, ready))
+    except KeyboardInterrupt:
+        pass
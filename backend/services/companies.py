@@ -0,0 +1,45 @@
+"""
+Company summary queries.
+
+Botiquin and user counts per company come from grouped subqueries joined
+in a single statement, instead of loading each company's collections just
+to call len() on them.
+"""
+
+from db import db
+from models.models import Botiquin, Company, User
+
+
+def company_summary_query():
+    """
+    Query yielding (Company, botiquines_count, users_count) rows.
+    Counts include inactive kits/users, like len(company.botiquines) did.
+    Callers can add filters/ordering on Company before executing.
+    """
+    bot_counts = (
+        db.session.query(Botiquin.company_id.label("company_id"), db.func.count(Botiquin.id).label("total"))
+        .group_by(Botiquin.company_id)
+        .subquery()
+    )
+    user_counts = (
+        db.session.query(User.company_id.label("company_id"), db.func.count(User.id).label("total"))
+        .group_by(User.company_id)
+        .subquery()
+    )
+    return (
+        db.session.query(
+            Company,
+            db.func.coalesce(bot_counts.c.total, 0),
+            db.func.coalesce(user_counts.c.total, 0),
+        )
+        .outerjoin(bot_counts, bot_counts.c.company_id == Company.id)
+        .outerjoin(user_counts, user_counts.c.company_id == Company.id)
+    )
+
+
+def company_summaries(company_ids=None):
+    """Return [(Company, botiquines_count, users_count)], optionally for some ids only."""
+    query = company_summary_query()
+    if company_ids is not None:
+        query = query.filter(Company.id.in_(company_ids))
+    return query.order_by(Company.id.asc()).all()
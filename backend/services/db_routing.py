@@ -0,0 +1,112 @@
+"""
+Read-replica routing for the SQLAlchemy session.
+
+When DATABASE_READ_URL is set, it is registered as the "replica" bind and
+`RoutingSession` sends reads there while everything else stays on the primary:
+
+- GET/HEAD requests read from the replica
+- Flushes, INSERT/UPDATE/DELETE and SELECT ... FOR UPDATE always use the primary
+- Once a session has written, its later reads use the primary too
+  (read-after-write within the same request), and so do the logged-in
+  user's next requests for DB_READ_PRIMARY_AFTER_WRITE seconds (covers
+  POST -> redirect -> GET while the replica catches up)
+- `force_primary()` / `@primary` pin the rest of a request to the primary
+- `reads_from("primary" | "replica")` overrides routing for a block, e.g. a
+  report builder run from the CLI, or a refresh that must read what it writes
+
+Without DATABASE_READ_URL everything goes to the primary, as before.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request, session as flask_session
+from flask_sqlalchemy.session import Session
+
+REPLICA_BIND = "replica"
+READ_METHODS = ("GET", "HEAD")
+READ_PRIMARY_AFTER_WRITE = float(os.getenv("DB_READ_PRIMARY_AFTER_WRITE", "5"))
+
+_override = ContextVar("db_read_override", default=None)
+
+
+@contextmanager
+def reads_from(target):
+    """Route reads inside the block to "primary" or "replica"."""
+    if target not in ("primary", "replica"):
+        raise ValueError(f"Unknown read target: {target}")
+    token = _override.set(target)
+    try:
+        yield
+    finally:
+        _override.reset(token)
+
+
+def force_primary():
+    """Send every remaining query of the current request to the primary."""
+    g._db_force_primary = True
+
+
+def primary(view):
+    """Decorator for GET views whose reads must see the latest writes."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        force_primary()
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _wants_replica(session):
+    if session.info.get("wrote"):
+        return False
+    override = _override.get()
+    if override is not None:
+        return override == "replica"
+    if has_request_context():
+        if request.method not in READ_METHODS or g.get("_db_force_primary", False):
+            return False
+        return flask_session.get("_db_primary_until", 0) < time.time()
+    return False
+
+
+def register_read_routing(app):
+    """Remember recent writers so their next reads skip the replica."""
+    if REPLICA_BIND not in app.config.get("SQLALCHEMY_BINDS", {}):
+        return
+
+    @app.after_request
+    def _stick_to_primary_after_write(response):
+        db_session = current_app.extensions["sqlalchemy"].session
+        if db_session.info.get("wrote") and "_user_id" in flask_session:
+            flask_session["_db_primary_until"] = time.time() + READ_PRIMARY_AFTER_WRITE
+        return response
+
+
+def _is_write(clause):
+    if clause is None:
+        return False
+    if getattr(clause, "is_dml", False):
+        return True
+    return getattr(clause, "_for_update_arg", None) is not None
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends eligible reads to the replica bind."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None:
+            return engine
+
+        engines = self._db.engines
+        replica = engines.get(REPLICA_BIND)
+        if replica is None or engine is not engines.get(None):
+            return engine
+
+        if self._flushing or _is_write(clause):
+            self.info["wrote"] = True
+            return engine
+        return replica if _wants_replica(self) else engine
@@ -0,0 +1,228 @@
+"""
+Per-device HMAC authentication for the hardware endpoints.
+
+Each botiquin holds one or more `DeviceKey`s. The hardware signs every request:
+
+    X-Device-Key:        dk_3f9a...           (key_id, sent in clear)
+    X-Device-Timestamp:  1760000000           (unix seconds)
+    X-Device-Nonce:      9b1c...              (random, unique per request)
+    X-Device-Signature:  hex(HMAC-SHA256(secret, "<ts>\\n<nonce>\\n<METHOD>\\n<path>\\n" + body))
+
+Verification never touches the database on the hot path:
+- Active keys are held in an in-memory table, reloaded every DEVICE_KEY_TTL
+  seconds (and at most every DEVICE_KEY_MISS_RELOAD seconds on an unknown key)
+- Signatures are compared in constant time (`hmac.compare_digest`)
+- Timestamps must be within DEVICE_AUTH_MAX_SKEW seconds of server time
+- Nonces are remembered in time buckets covering that window, so a captured
+  request cannot be replayed; old buckets are dropped wholesale
+
+The nonce set is per process: with several workers, a replay could still hit
+a different worker inside the skew window.
+
+HARDWARE_AUTH selects the mode: "optional" (default: unsigned requests pass,
+signed ones must verify), "required" or "off". Switch to "required" once
+every kit in the field has a key (`flask device-keys issue-missing`) and
+signing firmware.
+"""
+
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from db import db
+from models.models import Botiquin, DeviceKey
+
+HARDWARE_AUTH = os.getenv("HARDWARE_AUTH", "optional").lower()
+DEVICE_KEY_TTL = float(os.getenv("DEVICE_KEY_TTL", "60"))
+DEVICE_KEY_MISS_RELOAD = float(os.getenv("DEVICE_KEY_MISS_RELOAD", "5"))
+DEVICE_AUTH_MAX_SKEW = int(os.getenv("DEVICE_AUTH_MAX_SKEW", "300"))
+NONCE_BUCKET_SECONDS = 60
+
+HEADER_KEY = "X-Device-Key"
+HEADER_TIMESTAMP = "X-Device-Timestamp"
+HEADER_NONCE = "X-Device-Nonce"
+HEADER_SIGNATURE = "X-Device-Signature"
+
+DeviceCredential = namedtuple("DeviceCredential", "key_id secret botiquin_id hardware_id company_id")
+
+
+class DeviceAuthError(Exception):
+    """Raised when a request carries missing, stale or invalid device credentials."""
+
+
+# -------- Signing --------
+def signing_payload(timestamp, nonce, method, path, body):
+    """Bytes covered by the signature (shared by server and hardware clients)."""
+    head = f"{timestamp}\n{nonce}\n{method.upper()}\n{path}\n".encode("utf-8")
+    return head + (body or b"")
+
+
+def compute_signature(secret, timestamp, nonce, method, path, body):
+    secret_bytes = secret.encode("utf-8") if isinstance(secret, str) else secret
+    message = signing_payload(timestamp, nonce, method, path, body)
+    return hmac.new(secret_bytes, message, hashlib.sha256).hexdigest()
+
+
+def sign_request(key_id, secret, method, path, body=b"", timestamp=None, nonce=None):
+    """
+    Build the auth headers for one request.
+    Meant for simulators, firmware reference code and tests.
+    """
+    timestamp = str(int(timestamp if timestamp is not None else time.time()))
+    nonce = nonce or secrets.token_hex(12)
+    return {
+        HEADER_KEY: key_id,
+        HEADER_TIMESTAMP: timestamp,
+        HEADER_NONCE: nonce,
+        HEADER_SIGNATURE: compute_signature(secret, timestamp, nonce, method, path, body),
+    }
+
+
+# -------- Key table --------
+class DeviceKeyCache:
+    """In-memory map key_id -> DeviceCredential for active keys of active kits."""
+
+    def __init__(self, ttl=DEVICE_KEY_TTL, miss_reload=DEVICE_KEY_MISS_RELOAD):
+        self.ttl = ttl
+        self.miss_reload = miss_reload
+        self._keys = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        rows = (
+            db.session.query(
+                DeviceKey.key_id, DeviceKey.secret, DeviceKey.botiquin_id, Botiquin.hardware_id, Botiquin.company_id
+            )
+            .join(Botiquin, DeviceKey.botiquin_id == Botiquin.id)
+            .filter(DeviceKey.active.is_(True), Botiquin.active.is_(True))
+            .all()
+        )
+        keys = {
+            key_id: DeviceCredential(key_id, secret.encode("utf-8"), botiquin_id, hardware_id, company_id)
+            for key_id, secret, botiquin_id, hardware_id, company_id in rows
+        }
+        with self._lock:
+            self._keys = keys
+            self._loaded_at = time.monotonic()
+
+    def get(self, key_id):
+        now = time.monotonic()
+        if self._loaded_at is None or now - self._loaded_at > self.ttl:
+            self._load()
+        credential = self._keys.get(key_id)
+        if credential is None and now - self._loaded_at > self.miss_reload:
+            # Possibly issued by another worker since our last load
+            self._load()
+            credential = self._keys.get(key_id)
+        return credential
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+
+# -------- Replay protection --------
+class NonceCache:
+    """
+    Remembers (key_id, nonce) pairs for the skew window.
+    Entries live in per-minute buckets keyed on the signed timestamp.
+    """
+
+    def __init__(self, window=DEVICE_AUTH_MAX_SKEW, bucket_seconds=NONCE_BUCKET_SECONDS):
+        self.window = window
+        self.bucket_seconds = bucket_seconds
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def check_and_add(self, key_id, nonce, timestamp, now=None):
+        """Return True if the nonce is new (and record it), False on replay."""
+        now = now if now is not None else time.time()
+        bucket = int(timestamp) // self.bucket_seconds
+        oldest = int(now - self.window) // self.bucket_seconds - 1
+        entry = (key_id, nonce)
+        with self._lock:
+            for stale in [b for b in self._buckets if b < oldest]:
+                del self._buckets[stale]
+            seen = self._buckets.setdefault(bucket, set())
+            if entry in seen:
+                return False
+            seen.add(entry)
+            return True
+
+    def __len__(self):
+        return sum(len(s) for s in self._buckets.values())
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+key_cache = DeviceKeyCache()
+nonce_cache = NonceCache()
+
+
+def verify_request(request, now=None):
+    """
+    Authenticate a Flask request. Returns the DeviceCredential, or None when
+    the request is unsigned. Raises DeviceAuthError on any invalid credential.
+    """
+    key_id = request.headers.get(HEADER_KEY)
+    if not key_id:
+        return None
+
+    timestamp = request.headers.get(HEADER_TIMESTAMP, "")
+    nonce = request.headers.get(HEADER_NONCE, "")
+    signature = request.headers.get(HEADER_SIGNATURE, "")
+    if not (timestamp and nonce and signature):
+        raise DeviceAuthError("Incomplete device credentials")
+    if len(nonce) > 64:
+        raise DeviceAuthError("Nonce too long")
+
+    try:
+        ts = int(timestamp)
+    except ValueError:
+        raise DeviceAuthError("Invalid timestamp")
+    now = now if now is not None else time.time()
+    if abs(now - ts) > DEVICE_AUTH_MAX_SKEW:
+        raise DeviceAuthError("Timestamp outside the allowed window")
+
+    credential = key_cache.get(key_id)
+    if credential is None:
+        raise DeviceAuthError("Unknown device key")
+
+    expected = compute_signature(
+        credential.secret, timestamp, nonce, request.method, request.path, request.get_data(cache=True)
+    )
+    if not hmac.compare_digest(expected, signature.lower()):
+        raise DeviceAuthError("Invalid signature")
+
+    if not nonce_cache.check_and_add(key_id, nonce, ts, now):
+        raise DeviceAuthError("Replayed request")
+
+    return credential
+
+
+# -------- Key management --------
+def issue_device_key(botiquin):
+    """
+    Create a new key for `botiquin` and return (DeviceKey, secret).
+    The secret is only shown at creation time. Caller commits.
+    """
+    secret = secrets.token_hex(32)
+    key = DeviceKey(key_id=f"dk_{secrets.token_hex(8)}", secret=secret, botiquin_id=botiquin.id)
+    db.session.add(key)
+    key_cache.invalidate()
+    return key, secret
+
+
+def revoke_device_key(key):
+    """Deactivate a key. Caller commits."""
+    key.active = False
+    key.revoked_at = datetime.utcnow()
+    key_cache.invalidate()
@@ -0,0 +1,290 @@
+"""
+Broadcaster for live inventory change events.
+
+- The ingest path publishes compact events after its commit succeeds
+- Each connected browser holds one bounded queue; publishing never blocks,
+  a subscriber that falls behind simply loses its oldest events
+- Subscribers filter by company (tenant channel) and optionally by kit
+- Consumed by the Server-Sent Events route in routes/events.py, at most
+  EVENTS_MAX_STREAMS open streams per worker process
+
+Events reach the subscribers of other processes only through a shared relay:
+- In-process (EVENTS_STORE=memory, default): publisher and browsers must be
+  in the same worker, e.g. the Flask dev server
+- SQLite file (EVENTS_STORE=/path/to/events.db): every process of the host
+  (gunicorn workers, `flask ingest-serve`) appends to one short-lived log, and
+  each process with subscribers tails it from one thread every
+  EVENTS_POLL_MS. Required by `flask ingest-serve`
+
+If the relay fails (locked, unreadable...) events are dropped and counted as
+`errors`; live updates are best effort, the pages reload from the DB anyway.
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+EVENTS_STORE = os.getenv("EVENTS_STORE", "memory")
+EVENTS_POLL_INTERVAL = float(os.getenv("EVENTS_POLL_MS", "250")) / 1000
+
+# Events buffered per connection before old ones are dropped
+SUBSCRIBER_QUEUE_SIZE = 256
+
+# Idle connections get a comment line this often so proxies keep them open
+KEEPALIVE_SECONDS = 15
+
+# Open streams per worker process. Each one holds a gthread thread for its
+# whole life, so by default they may take half of the worker's threads and
+# the UI/API keep the rest; above the cap the stream route answers 503.
+EVENTS_MAX_STREAMS = int(os.getenv(
+    "EVENTS_MAX_STREAMS", str(max(1, int(os.getenv("GUNICORN_THREADS", "8")) // 2))
+))
+
+# Relayed events older than this are deleted (every RELAY_PRUNE_EVERY appends)
+RELAY_RETENTION_SECONDS = 60
+RELAY_PRUNE_EVERY = 500
+RELAY_BATCH = 1000
+
+
+def _serialize(event):
+    return json.dumps(event, separators=(",", ":"), default=str)
+
+
+class Subscription:
+    """One connected client: a bounded queue plus its channel filter."""
+
+    def __init__(self, company_id=None, botiquin_id=None):
+        self.company_id = company_id
+        self.botiquin_id = botiquin_id
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def wants(self, event):
+        if self.company_id is not None and event.get("company_id") != self.company_id:
+            return False
+        if self.botiquin_id is not None and event.get("botiquin_id") != self.botiquin_id:
+            return False
+        return True
+
+    def offer(self, name, payload):
+        item = (name, payload)
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # Drop the oldest event rather than blocking the publisher
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                pass
+
+
+class SQLiteEventRelay:
+    """
+    Event log in a small SQLite file shared by all processes of a host.
+    `append` is one short insert; `follow` starts the thread that tails the
+    log for this process.
+    """
+
+    def __init__(self, path, poll_interval=EVENTS_POLL_INTERVAL):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.errors = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._appended = 0
+        self._follower = None
+        # Not kept: the app may be preloaded and forked after import
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, created REAL NOT NULL, "
+            "name TEXT NOT NULL, payload TEXT NOT NULL, company_id INTEGER, botiquin_id INTEGER)"
+        )
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        return conn
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _error(self):
+        with self._lock:
+            self.errors += 1
+
+    def append(self, name, payload, event):
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT INTO events (created, name, payload, company_id, botiquin_id) VALUES (?, ?, ?, ?, ?)",
+                (now, name, payload, event.get("company_id"), event.get("botiquin_id")),
+            )
+            with self._lock:
+                self._appended += 1
+                prune = self._appended % RELAY_PRUNE_EVERY == 0
+            if prune:
+                conn.execute("DELETE FROM events WHERE created < ?", (now - RELAY_RETENTION_SECONDS,))
+        except sqlite3.Error:
+            self._error()
+
+    def follow(self, deliver):
+        """Tail the log from now on, handing every event to `deliver(name, payload, event)`."""
+        with self._lock:
+            if self._follower is not None and self._follower.is_alive():
+                return
+            try:
+                cursor = self._conn().execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+            except sqlite3.Error:
+                self.errors += 1
+                return
+            self._follower = threading.Thread(target=self._tail, args=(deliver, cursor), name="events-relay",
+                                              daemon=True)
+            self._follower.start()
+
+    def _tail(self, deliver, cursor):
+        while True:
+            try:
+                rows = self._conn().execute(
+                    "SELECT id, name, payload, company_id, botiquin_id FROM events WHERE id > ? ORDER BY id LIMIT ?",
+                    (cursor, RELAY_BATCH),
+                ).fetchall()
+            except sqlite3.Error:
+                self._error()
+                rows = []
+            for event_id, name, payload, company_id, botiquin_id in rows:
+                cursor = event_id
+                deliver(name, payload, {"company_id": company_id, "botiquin_id": botiquin_id})
+            if len(rows) < RELAY_BATCH:
+                time.sleep(self.poll_interval)
+
+
+class Broadcaster:
+    """Fan-out of events to every matching subscription, through `relay` when set."""
+
+    def __init__(self, relay=None):
+        self.relay = relay
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+
+    def subscribe(self, company_id=None, botiquin_id=None):
+        sub = Subscription(company_id=company_id, botiquin_id=botiquin_id)
+        with self._lock:
+            self._subscriptions.add(sub)
+        if self.relay is not None:
+            self.relay.follow(self._deliver)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscriptions.discard(sub)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscriptions)
+
+    def has_listeners(self):
+        """False only when nobody, in any process, can receive an event."""
+        return self.relay is not None or self.subscriber_count() > 0
+
+    def publish(self, name, event):
+        """
+        Send one event to all interested subscribers. Never blocks.
+        Returns the number of local subscribers reached (0 when relayed).
+        """
+        if self.relay is not None:
+            self.relay.append(name, _serialize(event), event)
+            return 0
+        with self._lock:
+            targets = [s for s in self._subscriptions if s.wants(event)]
+        if not targets:
+            return 0
+        # Serialize once, share the string between all subscribers
+        payload = _serialize(event)
+        for sub in targets:
+            sub.offer(name, payload)
+        return len(targets)
+
+    def _deliver(self, name, payload, event):
+        """Hand a relayed (already serialized) event to the local subscribers."""
+        with self._lock:
+            targets = [s for s in self._subscriptions if s.wants(event)]
+        for sub in targets:
+            sub.offer(name, payload)
+
+    def stream(self, company_id=None, botiquin_id=None):
+        """
+        Generator of SSE-formatted strings for one client.
+        Subscribes on the first iteration, so a response that is never sent
+        holds no subscription, and always unsubscribes when the client goes away.
+        """
+        sub = self.subscribe(company_id=company_id, botiquin_id=botiquin_id)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    name, payload = sub.queue.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield f": keepalive {int(time.time())}\n\n"
+                    continue
+                yield f"event: {name}\ndata: {payload}\n\n"
+        finally:
+            self.unsubscribe(sub)
+
+
+def _build_relay(setting):
+    if setting == "memory":
+        return None
+    return SQLiteEventRelay(setting)
+
+
+# Single broadcaster shared by the whole worker process
+broadcaster = Broadcaster(_build_relay(EVENTS_STORE))
+
+
+def publish_compartment_update(botiquin_id, company_id, compartment, quantity, status):
+    """A compartment's quantity/status changed (sensor reading applied)."""
+    return broadcaster.publish("compartment", {
+        "botiquin_id": botiquin_id,
+        "company_id": company_id,
+        "compartment": compartment,
+        "quantity": quantity,
+        "status": status,
+    })
+
+
+def publish_kit_update(botiquin_id, company_id, rollup, last_sync_at):
+    """A kit's totals changed; `rollup` is its fresh BotiquinRollup row."""
+    return broadcaster.publish("kit", {
+        "botiquin_id": botiquin_id,
+        "company_id": company_id,
+        "medicines_count": rollup.medicine_count if rollup else 0,
+        "critical": rollup.critical if rollup else 0,
+        "warning": rollup.warning if rollup else 0,
+        "ok": rollup.ok if rollup else 0,
+        "last_sync": last_sync_at.strftime("%Y-%m-%d %H:%M:%S") if last_sync_at else None,
+    })
+
+
+def publish_botiquin_changes(botiquin, changes):
+    """
+    Publish the result of a committed ingest for one kit.
+    `changes` is a list of (compartment, quantity, status) tuples.
+    Skips all work (including the rollup read) when nobody is listening.
+    """
+    if not broadcaster.has_listeners():
+        return
+    for compartment, quantity, status in changes:
+        publish_compartment_update(botiquin.id, botiquin.company_id, compartment, quantity, status)
+    publish_kit_update(botiquin.id, botiquin.company_id, botiquin.rollup, botiquin.last_sync_at)
@@ -0,0 +1,199 @@
+"""
+Streaming bulk export of inventory and hardware logs.
+
+- Rows are read with server-side cursors (`yield_per`) so memory stays flat
+- Each resource is serialized row by row as JSONL or CSV
+- Output can be gzip-compressed on the fly, chunk by chunk
+- Used by the `/api/export/*` routes and the `flask export` CLI command
+- Passing `user` limits rows to that user's tenant (the CLI exports everything)
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+
+from db import db
+from models.models import Botiquin, Company, Medicine, HardwareLog
+from services.tenancy import scope_query
+
+# Rows fetched per round-trip from the server-side cursor
+YIELD_PER = 1000
+
+# Flush the text buffer (and the compressor) once it grows past this size
+CHUNK_SIZE = 64 * 1024
+
+FORMATS = ("jsonl", "csv")
+
+MEDICINE_FIELDS = [
+    "id", "botiquin_id", "botiquin_name", "compartment_number", "trade_name",
+    "generic_name", "brand", "strength", "average_weight", "current_weight",
+    "quantity", "reorder_level", "max_capacity", "expiry_date", "batch_number",
+    "last_scan_at", "status", "days_to_expiry", "created_at", "updated_at",
+]
+
+BOTIQUIN_FIELDS = [
+    "id", "hardware_id", "name", "location", "company_id", "company_name",
+    "total_compartments", "active", "last_sync_at", "created_at", "updated_at",
+]
+
+HARDWARE_LOG_FIELDS = [
+    "id", "botiquin_id", "compartment_number", "weight_reading", "sensor_type",
+    "raw_data", "processed", "error_message", "created_at",
+]
+
+
+# -------- Row sources --------
+def _scope(query, model, user):
+    return query if user is None else scope_query(query, model, user)
+
+
+def iter_medicines(botiquin_id=None, status=None, user=None):
+    """
+    Yield medicine rows (same filters as /api/medicines and /api/medicines/filter).
+    The botiquin name comes from an outer join instead of a lazy load per row.
+    """
+    query = (
+        db.session.query(Medicine, Botiquin.name)
+        .outerjoin(Botiquin, Medicine.botiquin_id == Botiquin.id)
+    )
+    query = _scope(query, Medicine, user)
+    if botiquin_id:
+        query = query.filter(Medicine.botiquin_id == botiquin_id)
+
+    for med, botiquin_name in query.order_by(Medicine.id.asc()).yield_per(YIELD_PER):
+        med_status = med.status()
+        if status and med_status != status:
+            continue
+        yield {
+            "id": med.id,
+            "botiquin_id": med.botiquin_id,
+            "botiquin_name": botiquin_name,
+            "compartment_number": med.compartment_number,
+            "trade_name": med.trade_name,
+            "generic_name": med.generic_name,
+            "brand": med.brand,
+            "strength": med.strength,
+            "average_weight": med.unit_weight,
+            "current_weight": med.current_weight,
+            "quantity": med.quantity,
+            "reorder_level": med.reorder_level,
+            "max_capacity": med.max_capacity,
+            "expiry_date": med.expiry_date,
+            "batch_number": med.batch_number,
+            "last_scan_at": med.last_scan_at,
+            "status": med_status,
+            "days_to_expiry": med.days_to_expiry(),
+            "created_at": med.created_at,
+            "updated_at": med.updated_at,
+        }
+
+
+def iter_botiquines(company_id=None, user=None):
+    """Yield botiquin rows (same filters as /api/botiquines)."""
+    query = (
+        db.session.query(Botiquin, Company.name)
+        .outerjoin(Company, Botiquin.company_id == Company.id)
+    )
+    query = _scope(query, Botiquin, user)
+    if company_id:
+        query = query.filter(Botiquin.company_id == company_id)
+
+    for bot, company_name in query.order_by(Botiquin.id.asc()).yield_per(YIELD_PER):
+        yield {
+            "id": bot.id,
+            "hardware_id": bot.hardware_id,
+            "name": bot.name,
+            "location": bot.location,
+            "company_id": bot.company_id,
+            "company_name": company_name,
+            "total_compartments": bot.total_compartments,
+            "active": bot.active,
+            "last_sync_at": bot.last_sync_at,
+            "created_at": bot.created_at,
+            "updated_at": bot.updated_at,
+        }
+
+
+def iter_hardware_logs(botiquin_id=None, processed=None, user=None):
+    """
+    Yield hardware log rows (same filters as /api/hardware/logs, without the limit).
+    `processed` is the raw query-string value ("true"/"false") or None.
+    """
+    query = _scope(HardwareLog.query, HardwareLog, user)
+    if botiquin_id:
+        query = query.filter_by(botiquin_id=botiquin_id)
+    if processed is not None:
+        query = query.filter_by(processed=processed.lower() == "true")
+
+    for log in query.order_by(HardwareLog.created_at.desc()).yield_per(YIELD_PER):
+        yield {field: getattr(log, field) for field in HARDWARE_LOG_FIELDS}
+
+
+RESOURCES = {
+    "medicines": (iter_medicines, MEDICINE_FIELDS),
+    "botiquines": (iter_botiquines, BOTIQUIN_FIELDS),
+    "hardware_logs": (iter_hardware_logs, HARDWARE_LOG_FIELDS),
+}
+
+
+# -------- Encoders --------
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def encode_rows(rows, fields, fmt):
+    """Yield text chunks of roughly CHUNK_SIZE for the given rows."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    buffer = io.StringIO()
+    writer = None
+    if fmt == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+
+    for row in rows:
+        if writer:
+            writer.writerow(["" if row[f] is None else _plain(row[f]) for f in fields])
+        else:
+            buffer.write(json.dumps({f: _plain(row[f]) for f in fields}, ensure_ascii=False))
+            buffer.write("\n")
+
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks):
+    """Compress an iterable of text chunks into a gzip byte stream."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(resource, fmt="jsonl", compress=False, **filters):
+    """
+    Return a generator of bytes for the given resource.
+    Nothing is read from the database until the generator is iterated.
+    """
+    if resource not in RESOURCES:
+        raise ValueError(f"Unknown export resource: {resource}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    source, fields = RESOURCES[resource]
+    chunks = encode_rows(source(**filters), fields, fmt)
+    if compress:
+        return gzip_chunks(chunks)
+    return (chunk.encode("utf-8") for chunk in chunks)
@@ -0,0 +1,107 @@
+"""
+Fragment cache for rendered template sections.
+
+Templates wrap a per-kit block in a `{% cache %}` tag whose key includes the
+kit id and its version stamp (`BotiquinRollup.version`):
+
+    {% cache "dashboard-card", bot.id, bot.version, show_company %}
+        ... expensive markup ...
+    {% endcache %}
+
+- Any change to a kit's medicines or sync time bumps its version, so the old
+  entry is never hit again and ages out of the LRU
+- Unchanged kits are served from memory without re-rendering
+- The cache is per process and bounded (FRAGMENT_CACHE_SIZE entries)
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("FRAGMENT_CACHE_SIZE", "5000"))
+
+
+class LRUCache:
+    """Small thread-safe LRU mapping with hit/miss counters."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+        }
+
+
+# Shared by every template rendered in this process
+fragment_cache = LRUCache()
+
+
+class FragmentCacheExtension(Extension):
+    """Adds the `{% cache key, ... %}...{% endcache %}` tag to Jinja."""
+
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=fragment_cache)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+
+        key_parts = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            key_parts.append(parser.parse_expression())
+
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_render_cached", [nodes.Const(parser.name), nodes.List(key_parts)]),
+            [], [], body,
+        ).set_lineno(lineno)
+
+    def _render_cached(self, template_name, key_parts, caller):
+        key = (template_name, *key_parts)
+        cache = self.environment.fragment_cache
+        rendered = cache.get(key)
+        if rendered is None:
+            rendered = caller()
+            cache.set(key, rendered)
+        return rendered
+
@@ -0,0 +1,163 @@
+"""
+Group commit for sensor ingest (optional, INGEST_GROUP_COMMIT=true).
+
+With many kits reporting at once, each request paying for its own commit
+(and fsync on the database side) dominates ingest time. In group-commit
+mode the request threads of a worker process hand their payloads to a
+single committer thread instead:
+
+- The committer collects payloads for up to INGEST_GROUP_COMMIT_MS, or until
+  INGEST_GROUP_COMMIT_MAX are waiting, and stages each one in a savepoint of
+  one shared transaction
+- One commit then covers the whole group; only after it succeeded are the
+  requests acknowledged and the live updates published
+- A payload whose savepoint failed (e.g. a version conflict), or every payload
+  of a group whose commit failed, is re-run on its own through the normal
+  commit-with-retry path, so one bad payload never fails its neighbours
+- A request waits at most INGEST_GROUP_COMMIT_TIMEOUT seconds and gets a 503
+  after that; readings are absolute weights, so the device resending is safe
+
+The committer thread is started lazily in each process (after a fork, the
+child starts its own). `committer.stats()` reports group sizes and commit times.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from flask import current_app
+
+from db import db
+from services.ingest import RETRY_SOON, IngestOutcome, ingest_now, publish_outcome, stage_payload
+
+GROUP_COMMIT_ENABLED = os.getenv("INGEST_GROUP_COMMIT", "false").lower() in ("1", "true", "yes")
+GROUP_COMMIT_MS = float(os.getenv("INGEST_GROUP_COMMIT_MS", "5"))
+GROUP_COMMIT_MAX = int(os.getenv("INGEST_GROUP_COMMIT_MAX", "64"))
+GROUP_COMMIT_TIMEOUT = float(os.getenv("INGEST_GROUP_COMMIT_TIMEOUT", "10"))
+
+
+class GroupCommitter:
+    """Single committer thread per process, fed by a queue of (payload, Future)."""
+
+    def __init__(self, window_ms=GROUP_COMMIT_MS, max_batch=GROUP_COMMIT_MAX, timeout=GROUP_COMMIT_TIMEOUT):
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.groups = 0
+        self.payloads = 0
+        self.replayed = 0
+        self.failed_commits = 0
+        self.timed_out = 0
+        self.largest_group = 0
+        self.commit_time = 0.0
+
+    def submit(self, data):
+        """Queue one payload and wait until its group is committed. Returns an IngestOutcome."""
+        self._ensure_thread(current_app._get_current_object())
+        future = Future()
+        self._queue.put((data, future))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            with self._lock:
+                self.timed_out += 1
+            return IngestOutcome(503, {"error": "Ingest is backed up, retry later"}, headers=RETRY_SOON)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": GROUP_COMMIT_ENABLED,
+                "window_ms": self.window * 1000,
+                "max_group": self.max_batch,
+                "groups": self.groups,
+                "payloads": self.payloads,
+                "avg_group": round(self.payloads / self.groups, 2) if self.groups else 0,
+                "largest_group": self.largest_group,
+                "replayed": self.replayed,
+                "failed_commits": self.failed_commits,
+                "timed_out": self.timed_out,
+                "avg_commit_ms": round(self.commit_time / self.groups * 1000, 2) if self.groups else 0,
+                "queued": self._queue.qsize(),
+            }
+
+    # -------- Committer thread --------
+    def _ensure_thread(self, app):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # Forked child: the parent's queue and thread are not ours
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, args=(app,), name="ingest-group-commit", daemon=True)
+            self._thread.start()
+
+    def _next_group(self):
+        group = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(group) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                group.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return group
+
+    def _run(self, app):
+        while True:
+            group = self._next_group()
+            with app.app_context():
+                try:
+                    self._commit_group(group)
+                except Exception as e:
+                    for _, future in group:
+                        if not future.done():
+                            future.set_exception(e)
+
+    def _commit_group(self, group):
+        staged, replay = [], []
+        for data, future in group:
+            try:
+                with db.session.begin_nested():
+                    outcome = stage_payload(data)
+                staged.append((data, future, outcome))
+            except Exception:
+                replay.append((data, future))
+
+        started = time.perf_counter()
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                self.failed_commits += 1
+            replay = [(data, future) for data, future, _ in staged] + replay
+            staged = []
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self.groups += 1
+            self.payloads += len(group)
+            self.replayed += len(replay)
+            self.largest_group = max(self.largest_group, len(group))
+            self.commit_time += elapsed
+
+        for _, future, outcome in staged:
+            publish_outcome(outcome)
+            future.set_result(outcome)
+
+        for data, future in replay:
+            future.set_result(ingest_now(data))
+
+
+committer = GroupCommitter()
@@ -0,0 +1,52 @@
+"""
+Checks the live database against the indexes our hot queries need.
+
+Each entry of HOT_QUERIES names the columns a query filters/sorts on, in
+index order. A query is covered when some index, unique constraint or
+primary key starts with exactly those columns.
+
+Run with `flask --app app.py check-indexes` (exit code 1 if anything is missing).
+"""
+
+from sqlalchemy import inspect
+
+HOT_QUERIES = [
+    ("medicines", ("botiquin_id", "compartment_number"), "sensor ingest: medicine in a kit compartment"),
+    ("medicines", ("expiry_date",), "alerts and expiry filters"),
+    ("hardware_logs", ("botiquin_id", "created_at"), "hardware log history per kit"),
+    ("users", ("company_id",), "company user lists"),
+    ("botiquines", ("company_id", "active"), "company kit lists, dashboards and inventory"),
+    ("botiquines", ("hardware_id",), "kit lookup by hardware id"),
+    ("device_keys", ("botiquin_id",), "device keys per kit"),
+    ("botiquin_rollups", ("company_id",), "company dashboard rollups"),
+]
+
+
+def _index_prefixes(inspector, table):
+    """Column tuples of every index-like structure on `table`."""
+    columns = []
+    pk = inspector.get_pk_constraint(table).get("constrained_columns") or []
+    if pk:
+        columns.append(tuple(pk))
+    for index in inspector.get_indexes(table):
+        columns.append(tuple(index["column_names"]))
+    for constraint in inspector.get_unique_constraints(table):
+        columns.append(tuple(constraint["column_names"]))
+    return columns
+
+
+def missing_indexes(engine, hot_queries=HOT_QUERIES):
+    """Return [(table, columns, description)] for hot queries without a usable index."""
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    missing = []
+    cache = {}
+    for table, wanted, description in hot_queries:
+        if table not in tables:
+            missing.append((table, wanted, f"{description} (table does not exist)"))
+            continue
+        if table not in cache:
+            cache[table] = _index_prefixes(inspector, table)
+        if not any(existing[:len(wanted)] == wanted for existing in cache[table]):
+            missing.append((table, wanted, description))
+    return missing
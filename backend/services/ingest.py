@@ -0,0 +1,411 @@
+"""
+Sensor ingest: applying hardware readings to a kit's medicines.
+
+- `ingest(data)` is the entry point used by POST /api/hardware/sensor_data
+  (Flask route and the asyncio server in services/async_ingest.py); it
+  returns an IngestOutcome (HTTP status + JSON body + extra headers)
+- `authenticate_device_request` / `rate_limit_device_request` /
+  `connection_status` are the device checks and the ping reply shared by both
+- `stage_payload(data)` validates one payload, applies it and stages its
+  HardwareLog rows in the current session (no commit)
+- `apply_readings(botiquin, data)` updates the medicines of one payload and
+  stages a HardwareLog per compartment (no commit)
+- `commit_with_retry(apply)` commits the work of `apply()`; Medicine rows are
+  versioned (version_id_col), so when another writer changed one of them
+  since it was read, the transaction is rolled back and `apply()` runs again
+  on fresh rows, up to SENSOR_UPDATE_RETRIES attempts. That covers conflicts
+  raised inside apply() too (its queries autoflush earlier updates). Readings
+  are absolute weights, so replaying them is safe, and ingest workers never
+  take row locks.
+- With INGEST_GROUP_COMMIT=true, payloads are handed to the process's group
+  committer instead of committing one by one (see services/group_commit.py)
+"""
+
+import json
+import os
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy.orm.exc import StaleDataError
+
+from db import db
+from models.models import Botiquin, HardwareLog, Medicine
+from services.device_auth import HARDWARE_AUTH, DeviceAuthError, verify_request
+from services.events import publish_botiquin_changes
+from services.metrics import incr
+from services.rate_limit import RATE_LIMIT_ENABLED, limiter, retry_after_header
+
+SENSOR_UPDATE_RETRIES = int(os.getenv("SENSOR_UPDATE_RETRIES", "5"))
+
+# status/body/headers: the HTTP response; botiquin_id/changes: what to publish once committed
+IngestOutcome = namedtuple("IngestOutcome", "status body botiquin_id changes headers", defaults=(None, (), None))
+
+RETRY_SOON = {"Retry-After": "1"}
+
+
+# -------- Device checks --------
+def _payload_hardware_id(req):
+    data = req.get_json(silent=True)
+    return data.get("hardware_id") if isinstance(data, dict) else None
+
+
+def _is_known_kit(hardware_id):
+    return db.session.query(Botiquin.id).filter_by(hardware_id=hardware_id).first() is not None
+
+
+def authenticate_device_request(req):
+    """
+    Verify the HMAC signature of a device request (see services/device_auth.py).
+    The signing key must belong to the kit named in the payload.
+    Returns (DeviceCredential or None, IngestOutcome error or None).
+    """
+    if HARDWARE_AUTH == "off":
+        return None, None
+
+    try:
+        device = verify_request(req)
+    except DeviceAuthError as e:
+        return None, IngestOutcome(401, {"error": f"Device authentication failed: {e}"})
+
+    if device is None:
+        if HARDWARE_AUTH == "required":
+            return None, IngestOutcome(401, {"error": "Device authentication required"})
+        return None, None
+
+    hardware_id = _payload_hardware_id(req)
+    if hardware_id is not None and hardware_id != device.hardware_id:
+        return device, IngestOutcome(403, {"error": "Device key does not belong to this hardware_id"})
+    return device, None
+
+
+def rate_limit_device_request(req, device):
+    """
+    Token buckets per kit and per company (after authentication).
+    Unsigned requests are keyed by client address: per kit and address when
+    the payload names an existing kit, per address otherwise.
+    Returns an IngestOutcome (429) or None.
+    """
+    if not RATE_LIMIT_ENABLED:
+        return None
+
+    if device is not None:
+        checks = [("device", device.hardware_id)]
+        if device.company_id is not None:
+            checks.append(("company", device.company_id))
+    else:
+        hardware_id = _payload_hardware_id(req)
+        if isinstance(hardware_id, str) and _is_known_kit(hardware_id):
+            checks = [("device", f"{hardware_id}@{req.remote_addr}")]
+        else:
+            checks = [("device", req.remote_addr)]
+
+    for scope, key in checks:
+        retry_after = limiter.check(scope, key)
+        if retry_after is not None:
+            return IngestOutcome(
+                429,
+                {"error": f"Rate limit exceeded for {scope}", "retry_after": round(retry_after, 2)},
+                headers={"Retry-After": retry_after_header(retry_after)},
+            )
+    return None
+
+
+def connection_status(data):
+    """Reply to a device ping (POST /api/hardware/test_connection)."""
+    hardware_id = data.get("hardware_id", "unknown")
+
+    # Check if botiquin exists
+    botiquin = None
+    if hardware_id != "unknown":
+        botiquin = Botiquin.query.filter_by(hardware_id=hardware_id).first()
+
+    return IngestOutcome(200, {
+        "status": "connected",
+        "timestamp": datetime.utcnow().isoformat(),
+        "hardware_id": hardware_id,
+        "botiquin_found": botiquin is not None,
+        "botiquin_name": botiquin.name if botiquin else None,
+        "message": "Hardware connection successful"
+    })
+
+
+# -------- Sensor payloads --------
+
+
+def commit_with_retry(apply, retries=None):
+    """
+    Run apply() and commit, replaying it after a version conflict.
+    Returns apply()'s result; raises StaleDataError once the retries are used up.
+    """
+    attempts = max(1, retries or SENSOR_UPDATE_RETRIES)
+    for attempt in range(1, attempts + 1):
+        try:
+            # apply() itself can hit the conflict: its queries autoflush earlier updates
+            result = apply()
+            db.session.commit()
+            return result
+        except StaleDataError:
+            # Rollback expires every loaded row, so the next apply() reads fresh versions
+            db.session.rollback()
+            if attempt == attempts:
+                raise
+
+
+def _payload_average_weight(data, errors):
+    payload_section = data.get("unit_payload", {})
+    payload_avg_weight = payload_section.get("average_weight", payload_section.get("unit_weight"))
+    if payload_avg_weight is not None:
+        try:
+            payload_avg_weight = float(payload_avg_weight)
+            if payload_avg_weight <= 0:
+                errors.append({"warning": "Payload average_weight must be greater than zero"})
+                payload_avg_weight = None
+        except (TypeError, ValueError):
+            errors.append({"warning": "Payload average_weight is not a valid number"})
+            payload_avg_weight = None
+    return payload_avg_weight
+
+
+def apply_readings(botiquin, data):
+    """
+    Apply the compartment readings of one sensor payload to `botiquin`.
+    Returns (results, errors); the caller commits.
+    """
+    results = []
+    errors = []
+    payload_avg_weight = _payload_average_weight(data, errors)
+
+    # Iterate through compartments
+    for comp in data["compartments"]:
+        compartment_number = comp.get("compartment")
+        weight = comp.get("weight")
+        avg_weight_override = comp.get("average_weight", comp.get("unit_weight"))
+
+        # Create individual log entries per compartment
+        comp_log = HardwareLog(
+            botiquin_id=botiquin.id,
+            compartment_number=compartment_number,
+            weight_reading=weight,
+            sensor_type=data.get("sensor_type", "unknown"),
+            raw_data=json.dumps(comp),
+            created_at=datetime.utcnow()
+        )
+
+        if compartment_number is None or weight is None:
+            comp_log.error_message = "Missing compartment or weight data"
+            comp_log.processed = False
+            db.session.add(comp_log)
+            errors.append({
+                "compartment": compartment_number,
+                "error": "Missing compartment or weight data"
+            })
+            continue
+
+        # Find medicine in the compartment
+        medicine = Medicine.query.filter_by(
+            botiquin_id=botiquin.id,
+            compartment_number=compartment_number
+        ).first()
+
+        if not medicine:
+            comp_log.error_message = f"No medicine found in compartment {compartment_number}"
+            comp_log.processed = False
+            db.session.add(comp_log)
+            errors.append({
+                "compartment": compartment_number,
+                "warning": f"No medicine assigned to compartment {compartment_number}"
+            })
+            results.append({
+                "compartment": compartment_number,
+                "status": "empty",
+                "weight": weight
+            })
+            continue
+
+        # Determine unit weight to use for this update
+        avg_weight_to_apply = None
+        if avg_weight_override is not None:
+            try:
+                avg_weight_to_apply = float(avg_weight_override)
+            except (TypeError, ValueError):
+                avg_weight_to_apply = None
+                errors.append({
+                    "compartment": compartment_number,
+                    "warning": f"Invalid average_weight override provided ({avg_weight_override})"
+                })
+
+        if avg_weight_to_apply is None and payload_avg_weight is not None:
+            avg_weight_to_apply = payload_avg_weight
+
+        # Update medicine weight and unit weight if provided
+        if avg_weight_to_apply is not None and avg_weight_to_apply > 0:
+            medicine.unit_weight = avg_weight_to_apply
+
+        old_quantity = medicine.quantity
+        old_weight = medicine.current_weight
+
+        # Update from sensor (uses internal logic to update quantity based on current unit_weight)
+        new_quantity = medicine.update_from_sensor(weight)
+
+        # Mark compartment log as processed
+        comp_log.processed = True
+        db.session.add(comp_log)
+
+        results.append({
+            "compartment": compartment_number,
+            "medicine": medicine.trade_name,
+            "old_weight": old_weight,
+            "new_weight": medicine.current_weight,
+            "old_quantity": old_quantity,
+            "new_quantity": new_quantity,
+            "quantity_change": new_quantity - old_quantity,
+            "status": medicine.status(),
+            "average_weight": medicine.unit_weight
+        })
+
+    # Update botiquin sync timestamp
+    botiquin.last_sync_at = datetime.utcnow()
+    return results, errors
+
+
+def _alerts(results):
+    # Add alerts if any medicine has critical or warning status
+    alerts = []
+    for res in results:
+        status = res.get("status")
+        if status in ["OUT_OF_STOCK", "EXPIRED"]:
+            alerts.append({
+                "type": "critical",
+                "message": f"{res.get('medicine')} is {status}"
+            })
+        elif status in ["LOW_STOCK", "EXPIRES_SOON"]:
+            alerts.append({
+                "type": "warning",
+                "message": f"{res.get('medicine')} is {status}"
+            })
+    return alerts
+
+
+def _log_entry(data, error_message=None):
+    return HardwareLog(
+        raw_data=json.dumps(data),
+        sensor_type=data.get("sensor_type", "unknown"),
+        error_message=error_message,
+        processed=False if error_message else None,
+        created_at=datetime.utcnow()
+    )
+
+
+def _stage_log(log_entry):
+    # hardware_logs.botiquin_id is NOT NULL: payloads for unknown kits only get their HTTP error
+    if log_entry.botiquin_id is not None:
+        db.session.add(log_entry)
+
+
+def stage_payload(data):
+    """
+    Validate and apply one sensor payload in the current session, logging it
+    as a HardwareLog. Returns an IngestOutcome; the caller commits.
+    """
+    # Log raw data for debugging
+    log_entry = _log_entry(data)
+
+    # Validate required fields
+    required = ["hardware_id", "compartments"]
+    missing = [f for f in required if f not in data]
+    if missing:
+        log_entry.error_message = f"Missing fields: {missing}"
+        _stage_log(log_entry)
+        return IngestOutcome(400, {"error": f"Missing required fields: {missing}"})
+
+    # Find botiquin by hardware_id
+    botiquin = Botiquin.query.filter_by(hardware_id=data["hardware_id"]).first()
+    if not botiquin:
+        log_entry.error_message = f"Botiquin with hardware_id '{data['hardware_id']}' not found"
+        _stage_log(log_entry)
+        return IngestOutcome(404, {"error": f"Botiquin not found for hardware_id: {data['hardware_id']}"})
+
+    log_entry.botiquin_id = botiquin.id
+    results, errors = apply_readings(botiquin, data)
+
+    # Mark main log as processed
+    log_entry.processed = True
+    db.session.add(log_entry)
+
+    # Prepare response
+    response = {
+        "success": len(errors) == 0,
+        "botiquin": {
+            "id": botiquin.id,
+            "name": botiquin.name,
+            "hardware_id": botiquin.hardware_id
+        },
+        "results": results,
+        "errors": errors if errors else None,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+    alerts = _alerts(results)
+    if alerts:
+        response["alerts"] = alerts
+
+    changes = [(res["compartment"], res["new_quantity"], res["status"]) for res in results if "new_quantity" in res]
+    return IngestOutcome(200, response, botiquin.id, changes)
+
+
+def failure_outcome(data, error):
+    """Log a payload that could not be processed (after a rollback) and describe the error."""
+    if isinstance(error, StaleDataError):
+        message = "Concurrent updates to the same medicines, retries exhausted"
+        outcome = IngestOutcome(409, {"error": "Medicines are being updated concurrently, retry later"}, headers=RETRY_SOON)
+    else:
+        message = str(error)
+        outcome = IngestOutcome(500, {"error": f"Processing error: {message}"})
+    log_entry = _log_entry(data, message)
+    if isinstance(data.get("hardware_id"), str):
+        kit = Botiquin.query.filter_by(hardware_id=data["hardware_id"]).first()
+        log_entry.botiquin_id = kit.id if kit else None
+    _stage_log(log_entry)
+    return outcome
+
+
+def publish_outcome(outcome):
+    """Push live updates to open dashboards / detail pages (after the commit)."""
+    if outcome.botiquin_id is None:
+        return
+    botiquin = db.session.get(Botiquin, outcome.botiquin_id)
+    if botiquin is not None:
+        publish_botiquin_changes(botiquin, outcome.changes)
+
+
+def ingest_now(data):
+    """Stage, commit (replaying after version conflicts) and publish one payload."""
+    try:
+        outcome = commit_with_retry(lambda: stage_payload(data))
+    except Exception as e:
+        db.session.rollback()
+        outcome = failure_outcome(data, e)
+        db.session.commit()
+        return outcome
+    publish_outcome(outcome)
+    return outcome
+
+
+def _count(outcome):
+    incr("ingest_payloads_total", (("status", str(outcome.status)),))
+    if outcome.status != 200:
+        return
+    for res in outcome.body["results"]:
+        result = "updated" if "new_quantity" in res else "no_medicine"
+        incr("ingest_compartments_total", (("result", result),))
+    invalid = sum(1 for err in outcome.body["errors"] or () if "error" in err)
+    if invalid:
+        incr("ingest_compartments_total", (("result", "invalid"),), invalid)
+
+
+def ingest(data):
+    """Process one sensor payload, through the group committer when it is enabled."""
+    from services.group_commit import GROUP_COMMIT_ENABLED, committer
+
+    outcome = committer.submit(data) if GROUP_COMMIT_ENABLED else ingest_now(data)
+    _count(outcome)
+    return outcome
@@ -0,0 +1,195 @@
+"""
+View-model builder for the /inventory page.
+
+- Summary counters come from one aggregate query over the whole scope
+- Only the kits on the requested page are loaded, with their medicines and
+  companies fetched in one batch each
+- Medicines are indexed by compartment once and each status is computed once
+"""
+
+from collections import defaultdict
+from datetime import date
+
+from db import db
+from models.models import Botiquin, Company, Medicine
+from services.rollups import botiquin_rollups
+
+CRITICAL_STATUSES = ("EXPIRED", "OUT_OF_STOCK")
+WARNING_STATUSES = ("EXPIRES_SOON", "EXPIRES_30", "LOW_STOCK")
+
+DEFAULT_PER_PAGE = 25
+MAX_PER_PAGE = 200
+
+
+def _fmt(dt):
+    return dt.strftime("%Y-%m-%d %H:%M:%S") if dt else None
+
+
+def _scoped_botiquines(company_id=None, botiquin_id=None, include_inactive=False):
+    """Active botiquines, optionally limited to one company and/or one kit (None = all)."""
+    query = Botiquin.query
+    if not include_inactive:
+        query = query.filter(Botiquin.active.is_(True))
+    if company_id is not None:
+        query = query.filter(Botiquin.company_id == company_id)
+    if botiquin_id is not None:
+        query = query.filter(Botiquin.id == botiquin_id)
+    return query
+
+
+def build_summary(company_id=None, today=None, botiquin_id=None, include_inactive=False):
+    """
+    Aggregate counters for every kit in scope, without loading any rows.
+    Returns the same keys the inventory template already uses.
+    """
+    today = today or date.today()
+    status_col = Medicine.status_expression(today).label("status")
+
+    scope = _scoped_botiquines(company_id, botiquin_id, include_inactive)
+    kit_count, latest_sync = scope.with_entities(
+        db.func.count(Botiquin.id), db.func.max(Botiquin.last_sync_at)
+    ).one()
+
+    status_counts = dict(
+        db.session.query(status_col, db.func.count(Medicine.id))
+        .join(Botiquin, Medicine.botiquin_id == Botiquin.id)
+        .filter(Botiquin.id.in_(scope.with_entities(Botiquin.id)))
+        .group_by(status_col)
+        .all()
+    )
+
+    return {
+        "total_botiquines": kit_count,
+        "total_medicines": sum(status_counts.values()),
+        "critical_alerts": sum(status_counts.get(s, 0) for s in CRITICAL_STATUSES),
+        "warning_alerts": sum(status_counts.get(s, 0) for s in WARNING_STATUSES),
+        "last_update": _fmt(latest_sync) or "Nunca",
+    }
+
+
+def _build_rows(bot, company_name, medicines_by_compartment, status_filter, today):
+    rows = []
+    for compartment_number in range(1, bot.total_compartments + 1):
+        med = medicines_by_compartment.get(compartment_number)
+
+        if med is None:
+            if status_filter:
+                continue
+            status = "EMPTY"
+        else:
+            status = med.status()
+            if status_filter and status != status_filter:
+                continue
+
+        days_to_expiry = (med.expiry_date - today).days if med and med.expiry_date else None
+
+        rows.append({
+            "bot_id": bot.id,
+            "bot_name": bot.name,
+            "company_name": company_name,
+            "location": bot.location,
+            "compartment": compartment_number,
+            "has_medicine": med is not None,
+            "trade_name": med.trade_name if med else None,
+            "generic_name": med.generic_name if med else None,
+            "brand": med.brand if med else None,
+            "strength": med.strength if med else None,
+            "average_weight": med.unit_weight if med else None,
+            "current_weight": med.current_weight if med else None,
+            "quantity": med.quantity if med else 0,
+            "reorder_level": med.reorder_level if med else None,
+            "max_capacity": med.max_capacity if med else None,
+            "expiry_date": med.expiry_date.isoformat() if med and med.expiry_date else None,
+            "days_to_expiry": days_to_expiry,
+            "status": status,
+            "last_scan": _fmt(med.last_scan_at) if med else None,
+        })
+    return rows
+
+
+def build_inventory(company_id=None, status_filter=None, page=1, per_page=DEFAULT_PER_PAGE, show_company=False,
+                    botiquin_id=None, include_inactive=False):
+    """
+    Build everything inventory.html needs for one page of kits.
+
+    - company_id: restrict to one company (None = all companies, super admin)
+    - botiquin_id: restrict to a single kit (the per-kit inventory page)
+    - include_inactive: also list deactivated kits (the per-kit page shows its kit either way)
+    - status_filter: only kits/compartments whose medicine has this status
+    - page/per_page: server-side pagination over kits
+    """
+    today = date.today()
+    per_page = max(1, min(per_page or DEFAULT_PER_PAGE, MAX_PER_PAGE))
+
+    kits_query = _scoped_botiquines(company_id, botiquin_id, include_inactive)
+    if status_filter:
+        # Only paginate over kits that will actually render rows
+        matching = (
+            db.session.query(Medicine.botiquin_id)
+            .filter(Medicine.status_expression(today) == status_filter)
+            .filter(Medicine.compartment_number.isnot(None))
+        )
+        kits_query = kits_query.filter(Botiquin.id.in_(matching))
+
+    pagination = kits_query.order_by(Botiquin.id.asc()).paginate(
+        page=page, per_page=per_page, error_out=False
+    )
+    bots = pagination.items
+    bot_ids = [b.id for b in bots]
+
+    # One query for every medicine on the page, indexed by (kit, compartment)
+    medicines_index = defaultdict(dict)
+    if bot_ids:
+        for med in Medicine.query.filter(Medicine.botiquin_id.in_(bot_ids)).order_by(Medicine.id.asc()):
+            if med.compartment_number is not None:
+                medicines_index[med.botiquin_id].setdefault(med.compartment_number, med)
+
+    # One query for every company on the page
+    company_ids = {b.company_id for b in bots if b.company_id}
+    company_names = {}
+    if company_ids:
+        company_names = dict(
+            db.session.query(Company.id, Company.name).filter(Company.id.in_(company_ids)).all()
+        )
+
+    # Version stamps for the per-kit fragment cache in inventory.html
+    rollups = botiquin_rollups(bot_ids)
+
+    grouped_data = {}
+    display_count = 0
+    for bot in bots:
+        company_name = company_names.get(bot.company_id)
+        rows = _build_rows(bot, company_name, medicines_index.get(bot.id, {}), status_filter, today)
+        if not rows:
+            continue
+
+        section_key = bot.name
+        if show_company:
+            section_key = f"{bot.name} · {company_name or 'Sin asignar'}"
+
+        grouped_data[section_key] = {
+            "bot": {
+                "id": bot.id,
+                "name": bot.name,
+                "company_name": company_name,
+                "location": bot.location,
+                "last_sync": _fmt(bot.last_sync_at) or "Never",
+                "version": rollups[bot.id].version if bot.id in rollups else None,
+            },
+            "rows": rows,
+        }
+        display_count += len(rows)
+
+    return {
+        "grouped_data": grouped_data,
+        "summary": build_summary(company_id, today, botiquin_id, include_inactive),
+        "display_count": display_count,
+        "pagination": {
+            "page": pagination.page,
+            "per_page": pagination.per_page,
+            "pages": pagination.pages,
+            "total": pagination.total,
+            "has_prev": pagination.has_prev,
+            "has_next": pagination.has_next,
+        },
+    }
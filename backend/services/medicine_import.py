@@ -0,0 +1,328 @@
+"""
+Bulk import / upsert of medicines (CSV or JSON arrays).
+
+- Every row is validated up front; a bad row gets its errors in the result
+  and the rest of the batch still goes through
+- Referenced botiquines are resolved in one query (tenant-scoped for API calls)
+- Rows are matched on (botiquin_id, compartment_number): an existing medicine
+  is updated with the fields given, otherwise a new one is inserted; rows
+  without a compartment are always inserted
+- Writes run as chunked executemany statements (MEDICINE_IMPORT_CHUNK rows),
+  each chunk in a savepoint; if a chunk fails its rows are retried one by one
+  so the failing rows can be reported
+- Updates carry the version read during planning (Medicine.version), so a row
+  changed by someone else in the meantime is reported instead of overwritten
+- Bulk statements bypass the ORM flush hooks, so rollups are refreshed
+  explicitly for the touched kits before the commit
+
+Used by `POST /api/medicines/bulk` and the `flask medicines-import` command.
+"""
+
+import csv
+import io
+import json
+import os
+from datetime import date, datetime
+
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+
+from db import db
+from models.models import Botiquin, Medicine
+from services.events import publish_botiquin_changes
+from services.rollups import propagate_botiquines
+from services.tenancy import scope_query
+
+IMPORT_CHUNK = int(os.getenv("MEDICINE_IMPORT_CHUNK", "500"))
+IMPORT_MAX_ROWS = int(os.getenv("MEDICINE_IMPORT_MAX_ROWS", "10000"))
+
+REQUIRED_FIELDS = ["botiquin_id", "trade_name", "generic_name", "strength", "expiry_date", "quantity", "reorder_level"]
+INT_FIELDS = ["quantity", "reorder_level", "compartment_number", "max_capacity"]
+TEXT_FIELDS = ["trade_name", "generic_name", "brand", "strength", "batch_number"]
+# Every insert carries the same keys so each chunk is a single executemany
+INSERT_COLUMNS = ["botiquin_id", "last_scan_at", "unit_weight", "current_weight", "expiry_date"] + TEXT_FIELDS + INT_FIELDS
+
+
+class ImportFormatError(ValueError):
+    """The payload could not be read as a list of rows."""
+
+
+# -------- Validation (shared with the single-row routes) --------
+def parse_date(value):
+    if isinstance(value, date):
+        return value
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def missing_fields(data):
+    errors = []
+    for f in REQUIRED_FIELDS:
+        if f not in data or data.get(f) in (None, ""):
+            if f == "botiquin_id":
+                errors.append("'botiquin_id' is required (must assign to a botiquin)")
+            elif f == "reorder_level":
+                errors.append("'reorder_level' is required (minimum stock threshold)")
+            elif f == "quantity":
+                errors.append("'quantity' is required (stock count)")
+            else:
+                errors.append(f"'{f}' is required")
+    return errors
+
+
+def validate_fields(data, *, partial=False):
+    """Field-level checks for a medicine payload (no database access)."""
+    errors = [] if partial else missing_fields(data)
+
+    if data.get("botiquin_id") not in (None, ""):
+        try:
+            int(data["botiquin_id"])
+        except (TypeError, ValueError):
+            errors.append("'botiquin_id' must be an integer")
+
+    # Validate numeric fields
+    for num_field in INT_FIELDS:
+        if num_field in data and data[num_field] is not None:
+            try:
+                v = int(data[num_field])
+                if v < 0:
+                    errors.append(f"'{num_field}' must be >= 0")
+            except (TypeError, ValueError):
+                errors.append(f"'{num_field}' must be an integer")
+
+    # Validate float fields
+    weight_key = "average_weight" if "average_weight" in data else ("unit_weight" if "unit_weight" in data else None)
+    if weight_key and data[weight_key] is not None:
+        try:
+            unit_w = float(data[weight_key])
+            if unit_w <= 0:
+                errors.append("'average_weight' must be greater than 0")
+        except (TypeError, ValueError):
+            errors.append("'average_weight' must be a number")
+
+    if "current_weight" in data and data["current_weight"] is not None:
+        try:
+            curr_w = float(data["current_weight"])
+            if curr_w < 0:
+                errors.append("'current_weight' must be >= 0")
+        except (TypeError, ValueError):
+            errors.append("'current_weight' must be a number")
+
+    # Validate expiry date
+    if "expiry_date" in data and data.get("expiry_date"):
+        exp = parse_date(data["expiry_date"])
+        if exp is None:
+            errors.append("'expiry_date' must be YYYY-MM-DD")
+        # Note: We allow past dates for already expired medicines in inventory
+
+    return errors
+
+
+# -------- Parsing --------
+def parse_rows(payload, fmt):
+    """
+    Turn a CSV text or a JSON array (or {"medicines": [...]}) into row dicts.
+    Empty CSV cells are left out, so an update only touches the filled-in columns.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(io.StringIO(payload))
+        if not reader.fieldnames:
+            raise ImportFormatError("CSV has no header row")
+        return [
+            {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+            for row in reader
+        ]
+
+    data = json.loads(payload) if isinstance(payload, (str, bytes)) else payload
+    if isinstance(data, dict):
+        data = data.get("medicines")
+    if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+        raise ImportFormatError("Expected a JSON array of medicine objects")
+    return data
+
+
+def _values(data):
+    """Column values for the fields present in a row."""
+    values = {}
+    for f in TEXT_FIELDS:
+        if f in data:
+            values[f] = data[f]
+    for f in INT_FIELDS:
+        if f in data:
+            values[f] = int(data[f]) if data[f] not in (None, "") else None
+    weight = data.get("average_weight", data.get("unit_weight"))
+    if "average_weight" in data or "unit_weight" in data:
+        values["unit_weight"] = float(weight) if weight not in (None, "") else None
+    if "current_weight" in data:
+        values["current_weight"] = float(data["current_weight"]) if data["current_weight"] not in (None, "") else None
+    if "expiry_date" in data:
+        values["expiry_date"] = parse_date(data["expiry_date"])
+    return values
+
+
+def _with_quantity_from_weight(values, existing=None):
+    """Same rule as Medicine.calculate_quantity_from_weight, on plain dicts."""
+    if "unit_weight" not in values and "current_weight" not in values:
+        return values
+    unit_weight = values.get("unit_weight", existing.get("unit_weight") if existing else None)
+    current_weight = values.get("current_weight", existing.get("current_weight") if existing else None)
+    if unit_weight and current_weight and unit_weight > 0:
+        values["quantity"] = int(current_weight / unit_weight)
+    return values
+
+
+# -------- Import --------
+def _resolve_botiquines(ids, user):
+    query = Botiquin.query.filter(Botiquin.id.in_(ids))
+    if user is not None:
+        query = scope_query(query, Botiquin, user)
+    return {bot.id: bot for bot in query}
+
+
+def _existing_medicines(botiquin_ids):
+    rows = db.session.query(
+        Medicine.id, Medicine.botiquin_id, Medicine.compartment_number, Medicine.unit_weight, Medicine.current_weight,
+        Medicine.version,
+    ).filter(Medicine.botiquin_id.in_(botiquin_ids), Medicine.compartment_number.isnot(None))
+    return {
+        (row.botiquin_id, row.compartment_number): {
+            "id": row.id, "unit_weight": row.unit_weight, "current_weight": row.current_weight,
+            "version": row.version,
+        }
+        for row in rows
+    }
+
+
+def _plan(rows, user):
+    """Validate every row and split the good ones into inserts and updates."""
+    results = [{"row": n, "status": None} for n in range(1, len(rows) + 1)]
+    errors = {n: validate_fields(row, partial=True) for n, row in enumerate(rows)}
+
+    kit_ids = set()
+    for n, row in enumerate(rows):
+        if row.get("botiquin_id") in (None, ""):
+            errors[n].append("'botiquin_id' is required (must assign to a botiquin)")
+        elif not errors[n]:
+            kit_ids.add(int(row["botiquin_id"]))
+    kits = _resolve_botiquines(kit_ids, user) if kit_ids else {}
+    existing = _existing_medicines(list(kits)) if kits else {}
+
+    inserts, updates, seen = [], [], {}
+    now = datetime.utcnow()
+    for n, row in enumerate(rows):
+        if errors[n]:
+            continue
+        kit_id = int(row["botiquin_id"])
+        if kit_id not in kits:
+            errors[n].append(f"Botiquin with id {kit_id} does not exist")
+            continue
+        values = _values(row)
+        key = (kit_id, values.get("compartment_number"))
+        if key[1] is not None:
+            if key in seen:
+                errors[n].append(f"Duplicate of row {seen[key] + 1} (same botiquin and compartment)")
+                continue
+            seen[key] = n
+
+        current = existing.get(key) if key[1] is not None else None
+        if current is not None:
+            values = _with_quantity_from_weight(values, current)
+            # The version read above: the UPDATE only applies if nobody changed the row since
+            values.update(id=current["id"], version=current["version"])
+            updates.append((n, values))
+            continue
+
+        missing = missing_fields(row)
+        if missing:
+            errors[n].extend(missing)
+            continue
+        values = _with_quantity_from_weight(values)
+        values.update(botiquin_id=kit_id, last_scan_at=now)
+        inserts.append((n, {f: values.get(f) for f in INSERT_COLUMNS}))
+
+    for n, row_errors in errors.items():
+        if row_errors:
+            results[n].update(status="error", errors=row_errors)
+    return results, inserts, updates, kits
+
+
+def _write(statement, batch):
+    """Run one executemany in a savepoint. Returns None, or the error it was rolled back for."""
+    try:
+        with db.session.begin_nested():
+            db.session.execute(statement, [values for _, values in batch])
+        return None
+    except (IntegrityError, StaleDataError) as e:
+        return e
+
+
+def _write_error(values, error):
+    # Version mismatches raise StaleDataError; everything else is a constraint
+    if isinstance(error, StaleDataError):
+        return "Medicine was modified while importing, retry the row"
+    # Inserts carry botiquin_id; updates carry id + version and the changed columns
+    if "version" not in values and values.get("botiquin_id") and values.get("compartment_number") is not None:
+        return (f"Compartment {values['compartment_number']} of botiquin {values['botiquin_id']} "
+                "already holds a medicine")
+    return "Row violates a database constraint"
+
+
+def _write_chunks(statement, items, results, status):
+    for start in range(0, len(items), IMPORT_CHUNK):
+        chunk = items[start:start + IMPORT_CHUNK]
+        if _write(statement, chunk) is None:
+            for n, values in chunk:
+                results[n].update(status=status, id=values.get("id"))
+            continue
+        # Pin down the offending rows
+        for n, values in chunk:
+            error = _write(statement, [(n, values)])
+            if error is None:
+                results[n].update(status=status, id=values.get("id"))
+            else:
+                results[n].update(status="error", errors=[_write_error(values, error)])
+
+
+def import_medicines(rows, user=None):
+    """
+    Validate and upsert `rows` (dicts shaped like the POST /api/medicines payload).
+    `user` limits the referenced botiquines to that user's tenant; None = no limit (CLI).
+    Commits and returns {"created", "updated", "failed", "results"}; created rows
+    without a compartment are not matched back, so their result has no id.
+    """
+    results, inserts, updates, kits = _plan(rows, user)
+
+    _write_chunks(insert(Medicine), inserts, results, "created")
+    _write_chunks(update(Medicine).execution_options(synchronize_session=False), updates, results, "updated")
+
+    # Ids of the inserted rows (executemany does not return them on every backend)
+    created_keys = {
+        (values["botiquin_id"], values["compartment_number"]): n
+        for n, values in inserts
+        if results[n]["status"] == "created" and values["compartment_number"] is not None
+    }
+    if created_keys:
+        for key, current in _existing_medicines({kit for kit, _ in created_keys}).items():
+            if key in created_keys:
+                results[created_keys[key]]["id"] = current["id"]
+
+    touched = {int(rows[r["row"] - 1]["botiquin_id"]) for r in results if r["status"] in ("created", "updated")}
+    if touched:
+        propagate_botiquines(touched)
+    db.session.commit()
+
+    for kit_id in touched:
+        publish_botiquin_changes(kits[kit_id], [])
+
+    summary = {status: sum(1 for r in results if r["status"] == status) for status in ("created", "updated", "error")}
+    return {
+        "created": summary["created"],
+        "updated": summary["updated"],
+        "failed": summary["error"],
+        "results": results,
+    }
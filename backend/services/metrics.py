@@ -0,0 +1,405 @@
+"""
+Prometheus metrics for `GET /metrics`.
+
+Hot-path recording is lock-free: each thread owns a shard (plain dicts it
+alone writes to), registered once per thread; a scrape sums the shards.
+Recording a request is a dict lookup, a bisect and three increments.
+
+Collected here:
+- `http_request_duration_seconds` histogram by blueprint, endpoint, method
+  and status (its `_count` is the request counter)
+- Ingest counters by HTTP status, and compartments updated / without a
+  medicine / rejected (recorded by services/ingest.py, so `flask ingest-serve`
+  counts them too and serves its own GET /metrics)
+
+Rendered from the existing stats at scrape time:
+- DB pools (`pool_stats()`), fragment and session caches, device rate limiter,
+  password hashing pool and ingest group committer
+
+Numbers are recorded per process. gunicorn answers each scrape from an
+arbitrary worker, so with several workers set METRICS_MULTIPROC_DIR (as with
+prometheus_client's multiprocess mode, wiped when the server starts):
+- Every process writes a snapshot of its metrics there every
+  METRICS_FLUSH_SECONDS (and on scrape)
+- A scrape sums the counters and histograms of every snapshot, including
+  those of exited workers, so totals never go back; gauges are listed per
+  live process with a `pid` label
+- Processes sharing the directory (gunicorn workers, `flask ingest-serve`)
+  are all covered by one scrape
+
+Scrapes need `Authorization: Bearer <METRICS_TOKEN>`. Without a token only
+super admins, and local requests in debug or testing, may read /metrics.
+"""
+
+import bisect
+import glob
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import request
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+log = logging.getLogger("metrics")
+
+# Upper bounds (seconds) of the request latency buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_shards = []
+_shards_lock = threading.Lock()
+_local = threading.local()
+
+
+class _Shard:
+    __slots__ = ("latency", "counters")
+
+    def __init__(self):
+        self.latency = {}   # labels -> [bucket counts..., +Inf count, sum]
+        self.counters = {}  # (name, labels) -> value
+
+
+def _shard():
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _local.shard = _Shard()
+        with _shards_lock:
+            _shards.append(shard)
+        if METRICS_MULTIPROC_DIR:
+            _start_flusher()
+    return shard
+
+
+# -------- Recording --------
+def observe_request(blueprint, endpoint, method, status, seconds):
+    labels = (blueprint or "", endpoint or "", method, str(status))
+    latency = _shard().latency
+    row = latency.get(labels)
+    if row is None:
+        row = latency[labels] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+    row[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    row[-1] += seconds
+
+
+def incr(name, labels=(), value=1):
+    """Add `value` to counter `name`; labels are (key, value) pairs."""
+    counters = _shard().counters
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + value
+
+
+def register_request_metrics(app):
+    """
+    Time every request up to its response. Register it before the other
+    hooks so the session and auth hooks are part of the measured time.
+    """
+
+    @app.before_request
+    def _start_request_timer():
+        request.environ["metrics_started"] = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = request.environ.pop("metrics_started", None)
+        if started is not None:
+            observe_request(request.blueprint, request.endpoint, request.method, response.status_code,
+                            time.perf_counter() - started)
+        return response
+
+    @app.teardown_request
+    def _record_failed_request(exc):
+        # Unhandled exceptions skip after_request
+        started = request.environ.pop("metrics_started", None)
+        if started is not None:
+            observe_request(request.blueprint, request.endpoint, request.method, 500,
+                            time.perf_counter() - started)
+
+
+# -------- Aggregation --------
+def _merged():
+    with _shards_lock:
+        shards = list(_shards)
+    latency, counters = {}, {}
+    for shard in shards:
+        # dict() copies under the GIL, so a writer cannot change it mid-copy
+        for labels, row in dict(shard.latency).items():
+            total = latency.setdefault(labels, [0] * len(row[:-1]) + [0.0])
+            for i, value in enumerate(list(row)):
+                total[i] += value
+        for key, value in dict(shard.counters).items():
+            counters[key] = counters.get(key, 0) + value
+    return latency, counters
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+class _Writer:
+    """
+    Collects samples per metric family, so each family is written as one block.
+    Histogram samples are [per-bucket counts..., +Inf count, sum].
+    """
+
+    def __init__(self):
+        self.families = {}  # name -> {"kind", "help", "bounds", "samples": {labels: value}}, first-seen order
+
+    def _family(self, name, kind, help_text, bounds=None):
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = {"kind": kind, "help": help_text, "bounds": bounds, "samples": {}}
+        return family
+
+    def sample(self, name, kind, help_text, value, labels=()):
+        if value is None:
+            return
+        samples = self._family(name, kind, help_text)["samples"]
+        labels = tuple(labels)
+        samples[labels] = samples.get(labels, 0) + value
+
+    def histogram(self, name, help_text, bounds, counts, total, labels=()):
+        """`counts` are per-bucket (not cumulative), the last one being +Inf."""
+        samples = self._family(name, "histogram", help_text, list(bounds))["samples"]
+        labels = tuple(labels)
+        row = samples.get(labels) or [0] * len(counts) + [0.0]
+        samples[labels] = [a + b for a, b in zip(row, list(counts) + [total])]
+
+    def text(self):
+        lines = []
+        for name, family in self.families.items():
+            lines += [f"# HELP {name} {family['help']}", f"# TYPE {name} {family['kind']}"]
+            for labels, value in family["samples"].items():
+                if family["kind"] != "histogram":
+                    value = f"{value:g}" if isinstance(value, float) else value
+                    lines.append(f"{name}{_labels(labels)} {value}")
+                    continue
+                running = 0
+                for bound, n in zip(family["bounds"] + ["+Inf"], value[:-1]):
+                    running += n
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {running}")
+                lines.append(f"{name}_sum{_labels(labels)} {value[-1]:.6f}")
+                lines.append(f"{name}_count{_labels(labels)} {running}")
+        return "\n".join(lines) + "\n"
+
+    # -------- Multiprocess snapshots --------
+    def snapshot(self):
+        return {
+            name: {**family, "samples": [[list(map(list, labels)), value] for labels, value in family["samples"].items()]}
+            for name, family in self.families.items()
+        }
+
+    def merge(self, snapshot, pid, live):
+        """Add another process's snapshot: counters and histograms sum, gauges keep a pid label (live only)."""
+        for name, family in snapshot.items():
+            kind = family["kind"]
+            if kind == "gauge" and not live:
+                continue
+            for labels, value in family["samples"]:
+                labels = tuple(map(tuple, labels))
+                if kind == "gauge":
+                    self.sample(name, kind, family["help"], value, labels + (("pid", pid),))
+                elif kind == "histogram":
+                    self.histogram(name, family["help"], family["bounds"], value[:-1], value[-1], labels)
+                else:
+                    self.sample(name, kind, family["help"], value, labels)
+
+
+COUNTER_HELP = {
+    "ingest_payloads_total": "Sensor payloads handled, by HTTP status.",
+    "ingest_compartments_total": "Compartment readings, by result (updated, no_medicine, invalid).",
+}
+
+
+def _request_metrics(out, latency):
+    for (blueprint, endpoint, method, status), row in sorted(latency.items()):
+        out.histogram(
+            "http_request_duration_seconds", "Request latency by endpoint and status.",
+            LATENCY_BUCKETS, row[:-1], row[-1],
+            (("blueprint", blueprint), ("endpoint", endpoint), ("method", method), ("status", status)),
+        )
+
+
+def _counter_metrics(out, counters):
+    for (name, labels), value in sorted(counters.items()):
+        out.sample(name, "counter", COUNTER_HELP.get(name, name), value, labels)
+
+
+def _pool_metrics(out):
+    from services.pool_metrics import pool_stats
+
+    gauges = [
+        ("size", "db_pool_size", "Configured pool size."),
+        ("checked_out", "db_pool_checked_out", "Connections currently in use."),
+        ("checked_in", "db_pool_checked_in", "Idle connections in the pool."),
+        ("overflow", "db_pool_overflow", "Connections beyond the pool size (negative: not yet opened)."),
+    ]
+    counters = [
+        ("connects", "db_pool_connects_total", "New DBAPI connections."),
+        ("checkouts", "db_pool_checkouts_total", "Connection checkouts."),
+        ("invalidations", "db_pool_invalidations_total", "Invalidated connections."),
+        ("timeouts", "db_pool_timeouts_total", "Checkouts that timed out."),
+    ]
+    for pool, stats in sorted(pool_stats().items()):
+        labels = (("pool", pool),)
+        for key, name, help_text in gauges:
+            out.sample(name, "gauge", help_text, stats.get(key), labels)
+        for key, name, help_text in counters:
+            out.sample(name, "counter", help_text, stats.get(key), labels)
+        wait = stats["wait_seconds"]
+        bounds = [b for b in wait["buckets"] if b != "+Inf"]
+        cumulative = [wait["buckets"][b] for b in bounds + ["+Inf"]]
+        per_bucket = [n - (cumulative[i - 1] if i else 0) for i, n in enumerate(cumulative)]
+        out.histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection.",
+                      bounds, per_bucket, wait["sum"], labels)
+
+
+def _cache_metrics(out):
+    from services import session_cache
+    from services.fragment_cache import fragment_cache
+
+    for cache, stats in (("fragment", fragment_cache.stats()), ("session", session_cache.stats())):
+        labels = (("cache", cache),)
+        out.sample("cache_hits_total", "counter", "Cache hits.", stats["hits"], labels)
+        out.sample("cache_misses_total", "counter", "Cache misses.", stats["misses"], labels)
+        out.sample("cache_entries", "gauge", "Entries currently cached.", stats["entries"], labels)
+        out.sample("cache_hit_ratio", "gauge", "Hits / lookups since start.", stats["hit_ratio"], labels)
+
+
+def _service_metrics(out):
+    from services.group_commit import committer
+    from services.passwords import pool
+    from services.rate_limit import limiter
+
+    limits = limiter.stats(top=0)
+    for scope, value in sorted(limits["allowed"].items()):
+        out.sample("rate_limit_allowed_total", "counter", "Device requests let through.", value, (("scope", scope),))
+    for scope, value in sorted(limits["throttled"].items()):
+        out.sample("rate_limit_throttled_total", "counter", "Device requests rejected with 429.", value,
+                   (("scope", scope),))
+    out.sample("rate_limit_store_errors_total", "counter", "Bucket store failures (requests let through).",
+               limits["store_errors"])
+
+    hashing = pool.stats()
+    for key in ("completed", "rejected", "timed_out"):
+        out.sample("password_pool_jobs_total", "counter", "Password hash/verify jobs by outcome.", hashing[key],
+                   (("outcome", key),))
+
+    group = committer.stats()
+    out.sample("ingest_group_commits_total", "counter", "Group commits run.", group["groups"])
+    out.sample("ingest_group_payloads_total", "counter", "Payloads committed in groups.", group["payloads"])
+    out.sample("ingest_group_replayed_total", "counter", "Payloads re-run on their own.", group["replayed"])
+    out.sample("ingest_group_failed_commits_total", "counter", "Group commits that failed.", group["failed_commits"])
+    out.sample("ingest_group_timeouts_total", "counter", "Requests that gave up waiting (503).", group["timed_out"])
+    out.sample("ingest_group_queued", "gauge", "Payloads waiting for the committer.", group["queued"])
+
+
+def _collect():
+    latency, counters = _merged()
+    out = _Writer()
+    _request_metrics(out, latency)
+    _counter_metrics(out, counters)
+    _pool_metrics(out)
+    _cache_metrics(out)
+    _service_metrics(out)
+    return out
+
+
+def render_metrics():
+    """The whole exposition, in Prometheus text format 0.0.4 (every process of METRICS_MULTIPROC_DIR)."""
+    if not METRICS_MULTIPROC_DIR:
+        return _collect().text()
+    write_snapshot()
+    out = _Writer()
+    for path in sorted(glob.glob(os.path.join(METRICS_MULTIPROC_DIR, "metrics_*.json"))):
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue  # Being replaced right now, or removed with the directory
+        out.merge(snapshot["families"], snapshot["pid"], snapshot.get("live", True))
+    return out.text()
+
+
+def token_matches(authorization):
+    """True when METRICS_TOKEN is set and `authorization` is `Bearer <METRICS_TOKEN>`."""
+    if not METRICS_TOKEN:
+        return False
+    supplied = (authorization or "").removeprefix("Bearer ").strip()
+    return hmac.compare_digest(supplied, METRICS_TOKEN)
+
+
+# -------- Multiprocess snapshots --------
+_flusher_pid = None
+
+
+def _snapshot_path(pid):
+    return os.path.join(METRICS_MULTIPROC_DIR, f"metrics_{pid}.json")
+
+
+def _write_json(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def write_snapshot():
+    """Write this process's metrics to METRICS_MULTIPROC_DIR."""
+    pid = os.getpid()
+    _write_json(_snapshot_path(pid), {"pid": pid, "live": True, "families": _collect().snapshot()})
+
+
+def mark_process_dead(pid):
+    """Keep an exited process's counters in the totals, drop its gauges (gunicorn child_exit hook)."""
+    if not METRICS_MULTIPROC_DIR:
+        return
+    path = _snapshot_path(pid)
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return
+    snapshot["live"] = False
+    _write_json(path, snapshot)
+
+
+def clear_multiproc_dir():
+    """Start from zero (gunicorn on_starting hook), like prometheus_client's multiprocess mode."""
+    if not METRICS_MULTIPROC_DIR:
+        return
+    os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+    for path in glob.glob(os.path.join(METRICS_MULTIPROC_DIR, "metrics_*.json*")):
+        os.remove(path)
+
+
+def _flush_forever():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        if not METRICS_MULTIPROC_DIR:
+            continue
+        try:
+            write_snapshot()
+        except Exception:
+            log.exception("Could not write the metrics snapshot")
+
+
+def _start_flusher():
+    """One flusher thread per process; a forked worker starts its own."""
+    global _flusher_pid
+    with _shards_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_forever, name="metrics-flush", daemon=True).start()
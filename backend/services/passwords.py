@@ -0,0 +1,114 @@
+"""
+Password hashing off the request threads.
+
+Hashing is deliberately slow (scrypt/PBKDF2), so a burst of logins can use
+every CPU and stall the API polling served by the same workers. All hash and
+verify calls go through a small bounded pool instead:
+
+- At most PASSWORD_POOL_WORKERS hashes run at once (hashlib releases the GIL)
+- At most PASSWORD_POOL_QUEUE more wait; beyond that callers get PasswordPoolBusy
+- A caller waits at most PASSWORD_POOL_TIMEOUT seconds (PasswordPoolTimeout)
+- PASSWORD_POOL_WORKERS=0 hashes inline in the calling thread
+
+On a successful login, hashes made with other parameters than
+PASSWORD_HASH_METHOD are transparently upgraded, unless the pool is busy (the
+next login retries).
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", "2"))
+PASSWORD_POOL_QUEUE = int(os.getenv("PASSWORD_POOL_QUEUE", "32"))
+PASSWORD_POOL_TIMEOUT = float(os.getenv("PASSWORD_POOL_TIMEOUT", "5"))
+
+
+class PasswordPoolBusy(Exception):
+    """Too many password operations are already queued."""
+
+
+class PasswordPoolTimeout(Exception):
+    """A password operation did not finish in time."""
+
+
+class HashingPool:
+    """ThreadPoolExecutor with a bounded backlog and a per-call timeout."""
+
+    def __init__(self, workers=PASSWORD_POOL_WORKERS, queue=PASSWORD_POOL_QUEUE, timeout=PASSWORD_POOL_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pwhash") if workers else None
+        # Running + waiting jobs
+        self._slots = threading.BoundedSemaphore(workers + queue) if workers else None
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def run(self, fn, *args):
+        if self._executor is None:
+            return fn(*args)
+
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordPoolBusy()
+
+        future = self._executor.submit(fn, *args)
+        # The slot is only freed when the job really ends, even after a timeout
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            with self._lock:
+                self.timed_out += 1
+            raise PasswordPoolTimeout()
+        with self._lock:
+            self.completed += 1
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
+
+
+pool = HashingPool()
+
+
+def hash_password(password):
+    return pool.run(generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+
+def verify_password(password_hash, password):
+    return pool.run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """True when the stored hash was made with other parameters than the current ones."""
+    return password_hash.split("$", 1)[0] != PASSWORD_HASH_METHOD
+
+
+def check_user_password(user, password):
+    """
+    Verify `user`'s password, upgrading an outdated hash on success when the
+    pool has room. The caller commits. The verify may raise PasswordPoolBusy /
+    PasswordPoolTimeout.
+    """
+    if not user.check_password(password):
+        return False
+    if needs_rehash(user.password_hash):
+        try:
+            user.set_password(password)
+        except (PasswordPoolBusy, PasswordPoolTimeout):
+            pass  # keep the old hash: a valid login must not fail on the upgrade
+    return True
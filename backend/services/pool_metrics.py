@@ -0,0 +1,149 @@
+"""
+Connection pool instrumentation.
+
+- `TimedQueuePool` times how long each checkout waits for a free connection
+- `instrument_engine(engine, name)` counts connects, checkouts, invalidations
+  and checkout timeouts through SQLAlchemy pool events
+- `pool_stats()` returns the live state (size, checked out, overflow) plus
+  those counters and a wait-time histogram for every instrumented engine
+
+All numbers are per process.
+"""
+
+import bisect
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+# Upper bounds (seconds) of the checkout wait histogram buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram (cumulative on export, Prometheus style)."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.total += value
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            count, total = self.count, self.total
+        cumulative, running = {}, 0
+        for bound, n in zip(list(self.buckets) + ["+Inf"], counts):
+            running += n
+            cumulative[str(bound)] = running
+        return {"buckets": cumulative, "count": count, "sum": round(total, 6)}
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.wait = Histogram(WAIT_BUCKETS)
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def incr(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait for a connection."""
+
+    # Set by instrument_engine(); carried over when the engine replaces its pool
+    metrics = None
+
+    def recreate(self):
+        # engine.dispose() (e.g. around a fork) swaps in a fresh pool
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        # _do_get is where QueuePool blocks when every connection is in use
+        if self.metrics is None:
+            return super()._do_get()
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.incr("timeouts")
+            raise
+        finally:
+            self.metrics.wait.observe(time.perf_counter() - start)
+
+
+_lock = threading.Lock()
+_engines = {}       # name -> engine
+_metrics = {}       # name -> PoolMetrics, kept across pool replacements
+
+
+def instrument_engine(engine, name):
+    """Attach counters to `engine`'s pool and list it in pool_stats()."""
+    with _lock:
+        if _engines.get(name) is engine:
+            return
+        _engines[name] = engine
+        metrics = _metrics[name] = PoolMetrics()
+    if isinstance(engine.pool, TimedQueuePool):
+        engine.pool.metrics = metrics
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        metrics.incr("connects")
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.incr("checkouts")
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.incr("invalidations")
+
+
+def _pool_state(pool):
+    state = {"class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        state.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "max_overflow": pool._max_overflow,
+            "timeout": pool.timeout(),
+        })
+    return state
+
+
+def pool_stats():
+    """Live pool state and counters for every instrumented engine."""
+    stats = {}
+    for name, engine in list(_engines.items()):
+        metrics = _metrics[name]
+        stats[name] = {
+            "url": engine.url.render_as_string(hide_password=True),
+            **_pool_state(engine.pool),
+            "connects": metrics.connects,
+            "checkouts": metrics.checkouts,
+            "invalidations": metrics.invalidations,
+            "timeouts": metrics.timeouts,
+            "wait_seconds": metrics.wait.snapshot(),
+        }
+    return stats
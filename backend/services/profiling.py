@@ -0,0 +1,314 @@
+"""
+On-demand profiling of single requests (super admins only).
+
+A super admin adds `?_profile=1` (or the header `X-Profile: 1`) to any
+request; for everyone else the flag is ignored. That one request then runs
+under a profiler:
+
+- "sample" (default): a helper thread snapshots the request thread's stack
+  every PROFILE_INTERVAL_MS and counts identical stacks, giving folded stacks
+  ("root;caller;callee N") that flamegraph.pl / speedscope read directly
+- "cprofile" (`?_profile=cprofile`): deterministic cProfile, reported as the
+  functions with the most cumulative time, plus folded caller;callee pairs
+
+Every profile carries the request's SQL (statement, time, call site) from
+services/sql_instrumentation.py. Profiles are spooled as JSON files to
+PROFILE_DIR (default backend/instance/profiles), shared by every worker on
+the host, so the id in a profiled response's `X-Profile-Id` can be fetched
+from any of them. The newest PROFILE_RING_SIZE are kept and listed under
+/api/metrics/profiles.
+
+A streamed response (SSE, exports) is produced after the view returns; its
+profiler keeps running until the server closes the response, and only then
+is the profile written.
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from flask import request
+from flask_login import current_user
+
+from services.sql_instrumentation import PROJECT_DIR, recording_to, request_stats
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(BACKEND_DIR, "instance", "profiles"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+PROFILE_RING_SIZE = int(os.getenv("PROFILE_RING_SIZE", "50"))
+MAX_STACK_DEPTH = 128
+TOP_FUNCTIONS = 50
+MODES = ("sample", "cprofile")
+
+
+# -------- Profilers --------
+def _frame_label(filename, name, line):
+    if filename.startswith(PROJECT_DIR):
+        filename = os.path.relpath(filename, PROJECT_DIR)
+    else:
+        # "flask/app.py" rather than a bare "app.py"
+        filename = "/".join(filename.replace(os.sep, "/").split("/")[-2:])
+    return f"{name} ({filename}:{line})"
+
+
+_switch_lock = threading.Lock()
+_active_samplers = 0
+_saved_switch_interval = None
+
+
+def _sampler_started(interval):
+    """
+    The request thread only yields the GIL every sys.getswitchinterval() (5 ms
+    by default), which would cap the sampling rate; lower it while sampling.
+    """
+    global _active_samplers, _saved_switch_interval
+    with _switch_lock:
+        if _active_samplers == 0:
+            _saved_switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(min(_saved_switch_interval, interval / 2))
+        _active_samplers += 1
+
+
+def _sampler_stopped():
+    global _active_samplers
+    with _switch_lock:
+        _active_samplers -= 1
+        if _active_samplers == 0:
+            sys.setswitchinterval(_saved_switch_interval)
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a helper thread."""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL_MS / 1000):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        _sampler_started(self.interval)
+        self._thread.start()
+
+    def stop(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+        _sampler_stopped()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None and len(labels) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                labels.append(_frame_label(code.co_filename, code.co_name, code.co_firstlineno))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+
+    def result(self):
+        return {"samples": self.samples, "interval_ms": self.interval * 1000, "folded": dict(self.stacks)}
+
+
+class DeterministicProfiler:
+    """cProfile around the rest of the request."""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def result(self):
+        stats = pstats.Stats(self.profile)
+        functions, folded = [], {}
+        for (filename, line, name), (calls, _, own, cumulative, callers) in stats.stats.items():
+            label = _frame_label(filename, name, line)
+            functions.append({
+                "function": label,
+                "calls": calls,
+                "own_ms": round(own * 1000, 3),
+                "cumulative_ms": round(cumulative * 1000, 3),
+            })
+            for (c_file, c_line, c_name), caller_stats in callers.items():
+                caller = _frame_label(c_file, c_name, c_line)
+                # Own time of the callee attributed to this caller, in microseconds
+                folded[f"{caller};{label}"] = max(1, int(caller_stats[2] * 1e6))
+        functions.sort(key=lambda item: item["cumulative_ms"], reverse=True)
+        return {"functions": functions[:TOP_FUNCTIONS], "folded": folded, "folded_unit": "us"}
+
+
+# -------- Spool directory --------
+class ProfileStore:
+    """
+    One `<created_ns>-<id>.json` file per profile; the sortable prefix makes
+    the newest `size` files the ring, older ones are deleted on add.
+    """
+
+    SUMMARY_KEYS = ("id", "created_at", "method", "path", "endpoint", "status", "user", "mode", "duration_ms")
+
+    def __init__(self, directory=PROFILE_DIR, size=PROFILE_RING_SIZE):
+        self.directory = directory
+        self.size = size
+
+    def _files(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name for name in names if name.endswith(".json"))
+
+    def add(self, profile):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{time.time_ns():020d}-{profile['id']}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(profile, f, separators=(",", ":"))
+        os.replace(tmp, path)
+        for name in self._files()[:-self.size]:
+            self._remove(name)
+
+    def _remove(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass  # rotated out by another worker
+
+    def _load(self, name):
+        try:
+            with open(os.path.join(self.directory, name)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def get(self, profile_id):
+        suffix = f"-{profile_id}.json"
+        name = next((name for name in self._files() if name.endswith(suffix)), None)
+        return self._load(name) if name else None
+
+    def summaries(self):
+        profiles = (self._load(name) for name in reversed(self._files()))
+        return [
+            {key: p[key] for key in self.SUMMARY_KEYS} | {"sql_count": p["sql"]["count"], "sql_ms": p["sql"]["db_ms"]}
+            for p in profiles if p is not None
+        ]
+
+    def clear(self):
+        for name in self._files():
+            self._remove(name)
+
+
+profile_store = ProfileStore()
+
+
+# -------- Request hooks --------
+def requested_mode():
+    """Profiler asked for by the request ("sample" / "cprofile"), or None."""
+    flag = request.args.get("_profile") or request.headers.get("X-Profile")
+    if not flag or flag.lower() in ("0", "false", "no"):
+        return None
+    return flag.lower() if flag.lower() in MODES else "sample"
+
+
+def _sql_section(stats):
+    if stats is None:
+        return {"count": 0, "db_ms": 0, "statements": [], "repeated": []}
+    return {
+        "count": stats.count,
+        "db_ms": round(stats.db_time * 1000, 3),
+        "statements": [
+            {"statement": statement[:2000], "ms": round(duration * 1000, 3), "call_site": site}
+            for statement, duration, site in stats.queries
+        ],
+        "repeated": stats.repeated(),
+    }
+
+
+def _record_sql(stats, body):
+    with recording_to(stats):
+        yield from body
+
+
+def register_request_profiling(app):
+    """Run super-admin requests flagged with ?_profile=1 under a profiler (after the SQL hooks)."""
+
+    @app.before_request
+    def _start_profile():
+        mode = requested_mode()
+        if mode is None:
+            return None
+        if not (current_user.is_authenticated and current_user.is_super_admin()):
+            return None
+        # Only now: walking the stack per statement is not free. The session
+        # user load that ran above is listed without a call site.
+        stats = request_stats()
+        if stats is not None:
+            stats.trace_call_sites = True
+        if mode == "cprofile":
+            profiler = DeterministicProfiler()
+            try:
+                profiler.start()
+            except ValueError:
+                # Only one cProfile may run per process at a time; sample this one
+                mode = "sample"
+        if mode == "sample":
+            profiler = StackSampler(threading.get_ident())
+            profiler.start()
+        request.environ["profile"] = (mode, profiler, time.perf_counter())
+        return None
+
+    @app.after_request
+    def _finish_profile(response):
+        entry = request.environ.pop("profile", None)
+        if entry is None:
+            return response
+        mode, profiler, started = entry
+        profile = {
+            "id": uuid.uuid4().hex[:12],
+            "created_at": datetime.utcnow().isoformat(),
+            "method": request.method,
+            "path": request.full_path.rstrip("?"),
+            "endpoint": request.endpoint,
+            "status": response.status_code,
+            "user": current_user.username,
+            "mode": mode,
+        }
+        stats = request_stats()
+
+        def finish():
+            profiler.stop()
+            profile["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            profile_store.add(profile | {"sql": _sql_section(stats), **profiler.result()})
+
+        if response.is_streamed:
+            # The body has not been produced yet: profile it and its SQL too
+            response.response = _record_sql(stats, response.response)
+            response.call_on_close(finish)
+        else:
+            finish()
+        response.headers["X-Profile-Id"] = profile["id"]
+        return response
+
+    @app.teardown_request
+    def _drop_profile(exc):
+        # Failed requests skip after_request: stop the profiler anyway
+        entry = request.environ.pop("profile", None)
+        if entry is not None:
+            entry[1].stop()
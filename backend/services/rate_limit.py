@@ -0,0 +1,195 @@
+"""
+Token-bucket rate limiting for hardware traffic.
+
+Two buckets are checked for each signed device request:
+- "device": keyed by hardware_id, so one looping firmware cannot flood the DB
+- "company": keyed by the kit's company, capping a whole tenant's ingest
+
+Unsigned requests (HARDWARE_AUTH=optional) name a hardware_id the client
+controls, so their "device" bucket is keyed by client address: per kit and
+address for a hardware_id of an existing kit, per address otherwise. Random
+ids cannot mint buckets, and a spoofer cannot drain a real kit's bucket.
+
+Bucket state is a (tokens, updated_at) pair per key. Two stores are available:
+- In-process LRU dict (default): fastest, but each worker has its own budget
+- SQLite file (RATE_LIMIT_STORE=/path/to/buckets.db): one budget shared by
+  every worker on the host, one short write transaction per check
+
+Settings (tokens per second / bucket size):
+    RATE_LIMIT_DEVICE_RATE=1   RATE_LIMIT_DEVICE_BURST=10
+    RATE_LIMIT_COMPANY_RATE=50 RATE_LIMIT_COMPANY_BURST=200
+    RATE_LIMIT_ENABLED=false disables limiting entirely
+
+If the shared store fails (locked, unreadable...) requests are let through
+and counted as `store_errors`.
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() != "false"
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")
+
+DEFAULT_LIMITS = {
+    "device": (
+        float(os.getenv("RATE_LIMIT_DEVICE_RATE", "1")),
+        float(os.getenv("RATE_LIMIT_DEVICE_BURST", "10")),
+    ),
+    "company": (
+        float(os.getenv("RATE_LIMIT_COMPANY_RATE", "50")),
+        float(os.getenv("RATE_LIMIT_COMPANY_BURST", "200")),
+    ),
+}
+
+# Per-key throttle counts kept for metrics (the noisiest offenders)
+MAX_TRACKED_KEYS = 1000
+
+
+def _refill(state, rate, burst, now):
+    """
+    Apply one request to a bucket.
+    Returns (tokens_left, updated_at, retry_after); retry_after is 0 when allowed.
+    """
+    tokens, updated = state if state else (burst, now)
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, now, 0.0
+    return tokens, now, (1 - tokens) / rate
+
+
+class MemoryBucketStore:
+    """
+    key -> (tokens, updated_at) in an LRU-ordered dict of at most `max_keys`
+    buckets; the least recently used one is evicted (a forgotten bucket
+    simply starts full again).
+    """
+
+    def __init__(self, max_keys=50000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now):
+        with self._lock:
+            tokens, updated, retry_after = _refill(self._buckets.get(key), rate, burst, now)
+            self._buckets[key] = (tokens, updated)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBucketStore:
+    """
+    Buckets in a small SQLite file shared by all workers of a host.
+    Each check is one `BEGIN IMMEDIATE` read-modify-write.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, rate, burst, now):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated, retry_after = _refill(row, rate, burst, now)
+            conn.execute(
+                "INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, tokens, updated),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return retry_after
+
+    def clear(self):
+        self._conn().execute("DELETE FROM buckets")
+
+
+class RateLimiter:
+    """Checks named scopes against a bucket store and keeps throttle metrics."""
+
+    def __init__(self, store, limits=None):
+        self.store = store
+        self.limits = dict(limits or DEFAULT_LIMITS)
+        self._lock = threading.Lock()
+        self.allowed = Counter()
+        self.throttled = Counter()
+        self.throttled_keys = Counter()
+        self.store_errors = 0
+
+    def check(self, scope, key, now=None):
+        """
+        Consume one token from `scope`'s bucket for `key`.
+        Returns None when allowed, else the seconds to wait before retrying.
+        """
+        rate, burst = self.limits[scope]
+        now = now if now is not None else time.time()
+        try:
+            retry_after = self.store.take(f"{scope}:{key}", rate, burst, now)
+        except sqlite3.Error:
+            with self._lock:
+                self.store_errors += 1
+            return None
+
+        with self._lock:
+            if not retry_after:
+                self.allowed[scope] += 1
+                return None
+            self.throttled[scope] += 1
+            label = f"{scope}:{key}"
+            if label in self.throttled_keys or len(self.throttled_keys) < MAX_TRACKED_KEYS:
+                self.throttled_keys[label] += 1
+        return retry_after
+
+    def stats(self, top=20):
+        with self._lock:
+            return {
+                "store": type(self.store).__name__,
+                "limits": {scope: {"rate": r, "burst": b} for scope, (r, b) in self.limits.items()},
+                "allowed": dict(self.allowed),
+                "throttled": dict(self.throttled),
+                "store_errors": self.store_errors,
+                "top_throttled": dict(self.throttled_keys.most_common(top)),
+            }
+
+
+def _build_store(setting):
+    if setting == "memory":
+        return MemoryBucketStore()
+    return SQLiteBucketStore(setting)
+
+
+limiter = RateLimiter(_build_store(RATE_LIMIT_STORE))
+
+
+def retry_after_header(seconds):
+    """Retry-After takes whole seconds; never advertise 0."""
+    return str(max(1, math.ceil(seconds)))
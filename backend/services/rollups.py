@@ -0,0 +1,375 @@
+"""
+Maintenance of the botiquin_rollups / company_rollups tables.
+
+- A session listener records which kits were touched (medicines added,
+  edited, moved or deleted; kits synced, reassigned or deactivated)
+- Right before commit, only those kits are recomputed, inside the same
+  transaction as the change itself. Their change is added to the company row
+  as `SET x = x + :delta`, so concurrent writers on sibling kits never
+  overwrite each other; kits added, moved, (de)activated or resized
+  invalidate the company row instead
+- Rows computed on an earlier day are refreshed lazily on read, because
+  expiry-based statuses move with the calendar; a company row is recomputed
+  by its reader (upserted, after its kits' stale rows were refreshed)
+- `rebuild_all()` recomputes everything (exposed as `flask rollups-rebuild`)
+"""
+
+from datetime import date, datetime
+
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from db import db
+from services.db_routing import reads_from
+from models.models import Botiquin, BotiquinRollup, CompanyRollup, Medicine
+
+STATUS_FIELDS = {
+    "EXPIRED": "expired",
+    "EXPIRES_SOON": "expires_soon",
+    "EXPIRES_30": "expires_30",
+    "OUT_OF_STOCK": "out_of_stock",
+    "LOW_STOCK": "low_stock",
+    "OK": "ok",
+}
+
+COUNTER_FIELDS = list(STATUS_FIELDS.values()) + ["medicine_count", "compartments_used", "items_in_stock"]
+
+# Kits recomputed per statement during a full rebuild
+REBUILD_CHUNK = 500
+
+# computed_on of an invalidated company row: stale on any day
+INVALIDATED_ON = date(1970, 1, 1)
+
+# Botiquin columns that change its company's kit count or compartments
+STRUCTURAL_ATTRS = ("company_id", "active", "total_compartments")
+
+_PENDING_KITS = "rollup_pending_kits"
+_PENDING_COMPANIES = "rollup_pending_companies"
+_NEW_OBJECTS = "rollup_new_objects"
+
+
+# -------- Recompute --------
+def refresh_botiquines(botiquin_ids, today=None, deltas=None):
+    """
+    Recompute the rollup rows for the given kits.
+    Returns the set of company ids whose totals must follow.
+
+    With a `deltas` dict, an active kit whose previous row is from today and
+    the same company adds its change to deltas[company_id] instead of
+    returning the company (see apply_company_deltas).
+    """
+    ids = {i for i in botiquin_ids if i is not None}
+    if not ids:
+        return set()
+    today = today or date.today()
+    status_col = Medicine.status_expression(today)
+
+    counts = {bot_id: {f: 0 for f in COUNTER_FIELDS} for bot_id in ids}
+    grouped = (
+        db.session.query(
+            Medicine.botiquin_id,
+            status_col,
+            db.func.count(Medicine.id),
+            db.func.count(Medicine.compartment_number),
+            db.func.coalesce(db.func.sum(Medicine.quantity), 0),
+        )
+        .filter(Medicine.botiquin_id.in_(ids))
+        .group_by(Medicine.botiquin_id, status_col)
+    )
+    for bot_id, status, total, used, items in grouped:
+        row = counts[bot_id]
+        row[STATUS_FIELDS[status]] += total
+        row["medicine_count"] += total
+        row["compartments_used"] += used
+        row["items_in_stock"] += int(items)
+
+    kits = {
+        bot_id: (company_id, active, last_sync_at)
+        for bot_id, company_id, active, last_sync_at in db.session.query(
+            Botiquin.id, Botiquin.company_id, Botiquin.active, Botiquin.last_sync_at
+        ).filter(Botiquin.id.in_(ids))
+    }
+    existing = {r.botiquin_id: r for r in BotiquinRollup.query.filter(BotiquinRollup.botiquin_id.in_(ids))}
+
+    companies = set()
+    for bot_id in ids:
+        rollup = existing.get(bot_id)
+        if bot_id not in kits:
+            # Kit is gone; its rollup goes with it through the relationship cascade
+            if rollup is not None:
+                companies.add(rollup.company_id)
+            continue
+
+        company_id, active, last_sync_at = kits[bot_id]
+        if rollup is None:
+            rollup = BotiquinRollup(botiquin_id=bot_id)
+            db.session.add(rollup)
+            companies.add(company_id)
+        elif deltas is not None and rollup.computed_on == today and rollup.company_id == company_id:
+            if active:
+                delta = deltas.setdefault(company_id, {})
+                for field, value in counts[bot_id].items():
+                    delta[field] = delta.get(field, 0) + value - getattr(rollup, field)
+                if last_sync_at is not None:
+                    delta["last_sync_at"] = max(delta.get("last_sync_at") or last_sync_at, last_sync_at)
+        else:
+            companies.update((rollup.company_id, company_id))
+
+        for field, value in counts[bot_id].items():
+            setattr(rollup, field, value)
+        rollup.company_id = company_id
+        rollup.last_sync_at = last_sync_at
+        rollup.computed_on = today
+        rollup.version = (rollup.version or 0) + 1
+
+    companies.discard(None)
+    return companies
+
+
+def apply_company_deltas(deltas, today=None):
+    """
+    Add {company_id: {field: change}} to company rows computed today, as
+    `SET field = field + :change`: concurrent writers on sibling kits add up
+    instead of overwriting each other, and no company row is read first.
+    Rows from another day are left stale for the next reader to recompute.
+    """
+    today = today or date.today()
+    for company_id in sorted(deltas):
+        delta = deltas[company_id]
+        values = {f: getattr(CompanyRollup, f) + delta[f] for f in COUNTER_FIELDS if delta.get(f)}
+        last_sync_at = delta.get("last_sync_at")
+        if last_sync_at is not None:
+            values["last_sync_at"] = db.case(
+                (db.or_(CompanyRollup.last_sync_at.is_(None), CompanyRollup.last_sync_at < last_sync_at),
+                 last_sync_at),
+                else_=CompanyRollup.last_sync_at,
+            )
+        if not values:
+            continue
+        values["updated_at"] = datetime.utcnow()
+        CompanyRollup.query.filter(
+            CompanyRollup.company_id == company_id, CompanyRollup.computed_on == today
+        ).update(values, synchronize_session=False)
+
+
+def invalidate_companies(company_ids):
+    """Mark company rows stale (kits added, moved, (de)activated or resized); readers recompute them."""
+    ids = sorted(i for i in company_ids if i is not None)
+    if ids:
+        CompanyRollup.query.filter(CompanyRollup.company_id.in_(ids)).update(
+            {"computed_on": INVALIDATED_ON}, synchronize_session=False
+        )
+
+
+def propagate_botiquines(botiquin_ids, company_ids=(), today=None):
+    """
+    Write path: recompute the kits' rollups and carry the change into their
+    companies, as deltas where possible and by invalidation otherwise.
+    """
+    today = today or date.today()
+    deltas = {}
+    stale = set(company_ids) | refresh_botiquines(botiquin_ids, today, deltas)
+    stale.discard(None)
+    apply_company_deltas({cid: d for cid, d in deltas.items() if cid not in stale}, today)
+    invalidate_companies(stale)
+
+
+def _company_totals(company_ids):
+    """{company_id: (kit count, compartments, last sync, *COUNTER_FIELDS sums)} over active kits."""
+    sums = [db.func.coalesce(db.func.sum(getattr(BotiquinRollup, f)), 0) for f in COUNTER_FIELDS]
+    return {
+        company_id: tuple(values)
+        for company_id, *values in db.session.query(
+            Botiquin.company_id,
+            db.func.count(Botiquin.id),
+            db.func.coalesce(db.func.sum(Botiquin.total_compartments), 0),
+            db.func.max(Botiquin.last_sync_at),
+            *sums,
+        )
+        .outerjoin(BotiquinRollup, BotiquinRollup.botiquin_id == Botiquin.id)
+        .filter(Botiquin.company_id.in_(company_ids), Botiquin.active.is_(True))
+        .group_by(Botiquin.company_id)
+    }
+
+
+def _refresh_stale_kits(company_ids, today):
+    """Recompute the active kits of these companies whose rollup is missing or from another day."""
+    stale = [
+        bot_id for (bot_id,) in db.session.query(Botiquin.id)
+        .outerjoin(BotiquinRollup, BotiquinRollup.botiquin_id == Botiquin.id)
+        .filter(
+            Botiquin.company_id.in_(company_ids),
+            Botiquin.active.is_(True),
+            db.or_(BotiquinRollup.botiquin_id.is_(None), BotiquinRollup.computed_on != today),
+        )
+    ]
+    for start in range(0, len(stale), REBUILD_CHUNK):
+        refresh_botiquines(stale[start:start + REBUILD_CHUNK], today)
+    db.session.flush()
+
+
+def _upsert_company_rollups(rows):
+    """INSERT the rows, or UPDATE them when the company already has one (two first readers may race)."""
+    table = CompanyRollup.__table__
+    columns = [c for c in rows[0] if c != "company_id"]
+    if db.engine.dialect.name == "mysql":
+        stmt = mysql_insert(table)
+        stmt = stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in columns})
+    else:
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=["company_id"],
+                                          set_={c: stmt.excluded[c] for c in columns})
+    db.session.execute(stmt, rows)
+
+
+def refresh_companies(company_ids, today=None):
+    """
+    Recompute company rollups by summing their active kits' rollups, and commit.
+
+    Kit rows from an earlier day are refreshed and committed first. The company
+    rows are then locked before summing, so a writer's delta lands either
+    before the sums (and is counted) or after the new row (and adds on top).
+    """
+    ids = sorted(i for i in company_ids if i is not None)
+    if not ids:
+        return
+    today = today or date.today()
+
+    _refresh_stale_kits(ids, today)
+    db.session.commit()
+
+    db.session.query(CompanyRollup.company_id).filter(CompanyRollup.company_id.in_(ids)).with_for_update().all()
+    totals = _company_totals(ids)
+    now = datetime.utcnow()
+    rows = []
+    for company_id in ids:
+        kit_count, compartments, last_sync_at, *counters = totals.get(
+            company_id, (0, 0, None) + (0,) * len(COUNTER_FIELDS)
+        )
+        row = {
+            "company_id": company_id,
+            "botiquin_count": kit_count,
+            "total_compartments": int(compartments),
+            "last_sync_at": last_sync_at,
+            "computed_on": today,
+            "updated_at": now,
+        }
+        row.update((field, int(value)) for field, value in zip(COUNTER_FIELDS, counters))
+        rows.append(row)
+    _upsert_company_rollups(rows)
+    db.session.commit()
+
+
+def rebuild_all():
+    """Recompute every kit and company rollup from scratch (repair path)."""
+    today = date.today()
+    kit_ids = [bot_id for (bot_id,) in db.session.query(Botiquin.id).order_by(Botiquin.id)]
+    companies = set()
+    for start in range(0, len(kit_ids), REBUILD_CHUNK):
+        companies |= refresh_botiquines(kit_ids[start:start + REBUILD_CHUNK], today)
+        db.session.flush()
+
+    # Drop orphans left by kits removed outside the ORM
+    BotiquinRollup.query.filter(~BotiquinRollup.botiquin_id.in_(db.session.query(Botiquin.id))).delete(
+        synchronize_session=False
+    )
+    companies |= {cid for (cid,) in db.session.query(CompanyRollup.company_id)}
+    db.session.commit()
+    refresh_companies(companies, today)
+    return len(kit_ids), len(companies)
+
+
+# -------- Readers --------
+def botiquin_rollups(botiquin_ids):
+    """
+    Return {botiquin_id: BotiquinRollup} for the given kits,
+    recomputing any row that is missing or from a previous day.
+    """
+    ids = set(botiquin_ids)
+    if not ids:
+        return {}
+    today = date.today()
+    rollups = {r.botiquin_id: r for r in BotiquinRollup.query.filter(BotiquinRollup.botiquin_id.in_(ids))}
+
+    stale = {i for i in ids if i not in rollups or rollups[i].is_stale(today)}
+    if stale:
+        # Recompute from the primary, where the rows will be written
+        with reads_from("primary"):
+            propagate_botiquines(stale, today=today)
+            db.session.commit()
+            rollups = {r.botiquin_id: r for r in BotiquinRollup.query.filter(BotiquinRollup.botiquin_id.in_(ids))}
+    return rollups
+
+
+def company_rollup(company_id):
+    """Return the CompanyRollup for one company, recomputing it if stale or invalidated."""
+    today = date.today()
+    rollup = CompanyRollup.query.get(company_id)
+    if rollup is None or rollup.is_stale(today):
+        with reads_from("primary"):
+            # Refreshes the company's stale kit rollups too
+            refresh_companies({company_id}, today)
+            rollup = CompanyRollup.query.get(company_id)
+    return rollup
+
+
+# -------- Session hooks --------
+def _pending(session, key):
+    return session.info.setdefault(key, set())
+
+
+def _track_changes(session, flush_context, instances):
+    kits = _pending(session, _PENDING_KITS)
+    companies = _pending(session, _PENDING_COMPANIES)
+
+    for obj in session.new:
+        if isinstance(obj, (Medicine, Botiquin)):
+            # Ids (and relationship-assigned FKs) are only known after the flush
+            session.info.setdefault(_NEW_OBJECTS, []).append(obj)
+
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Medicine):
+            kits.add(obj.botiquin_id)
+            kits.update(inspect(obj).attrs.botiquin_id.history.deleted or ())
+        elif isinstance(obj, Botiquin):
+            kits.add(obj.id)
+            state = inspect(obj)
+            if obj in session.deleted or any(
+                state.attrs[attr].history.has_changes() for attr in STRUCTURAL_ATTRS
+            ):
+                companies.add(obj.company_id)
+            companies.update(state.attrs.company_id.history.deleted or ())
+
+
+def _collect_new_objects(session, flush_context):
+    kits = _pending(session, _PENDING_KITS)
+    for obj in session.info.pop(_NEW_OBJECTS, ()):
+        kits.add(obj.id if isinstance(obj, Botiquin) else obj.botiquin_id)
+
+
+def _apply_pending(session):
+    # Flush first so changes still sitting in session.dirty are tracked too
+    session.flush()
+    kits = session.info.pop(_PENDING_KITS, set())
+    companies = session.info.pop(_PENDING_COMPANIES, set())
+    kits.discard(None)
+    if not kits and not companies:
+        return
+
+    propagate_botiquines(kits, companies)
+
+
+def _discard_pending(session):
+    for key in (_PENDING_KITS, _PENDING_COMPANIES, _NEW_OBJECTS):
+        session.info.pop(key, None)
+
+
+def register_rollup_events():
+    """Attach the rollup listeners to the shared session (idempotent)."""
+    if event.contains(db.session, "before_flush", _track_changes):
+        return
+    event.listen(db.session, "before_flush", _track_changes)
+    event.listen(db.session, "after_flush", _collect_new_objects)
+    event.listen(db.session, "before_commit", _apply_pending)
+    event.listen(db.session, "after_rollback", _discard_pending)
@@ -0,0 +1,135 @@
+"""
+Short-lived cache of session principals for Flask-Login.
+
+`load_user` runs on every authenticated request (including API polling).
+Instead of SELECTing the user (and lazily its company) each time, we keep a
+small per-process cache of the fields requests actually need:
+id, username, user_type, company_id, active and company name.
+
+- Entries expire after SESSION_CACHE_TTL seconds (default 30)
+- Routes that change a user or a company invalidate the affected entries
+- Other worker processes converge within the TTL
+- Anything not cached (to_dict, set_password, ...) transparently loads the
+  real User row once for that request
+"""
+
+import os
+import threading
+import time
+
+from flask_login import UserMixin
+
+from db import db
+from models.models import Company, User
+
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "30"))
+
+_lock = threading.Lock()
+_entries = {}  # user_id -> (expires_at, fields dict)
+_counts = {"hits": 0, "misses": 0}
+
+
+class SessionPrincipal(UserMixin):
+    """
+    Lightweight stand-in for `User` used as `current_user`.
+    Built fresh for each request from cached plain data.
+    """
+
+    def __init__(self, fields):
+        self.id = fields["id"]
+        self.username = fields["username"]
+        self.user_type = fields["user_type"]
+        self.company_id = fields["company_id"]
+        self.company_name = fields["company_name"]
+        self.active = fields["active"]
+        self._model = None
+
+    @property
+    def is_active(self) -> bool:  # Flask-Login compatibility
+        return bool(self.active)
+
+    def is_super_admin(self) -> bool:
+        return self.user_type == "super_admin"
+
+    def get_model(self):
+        """The real User row (loaded on first use within this request)."""
+        if self._model is None:
+            self._model = db.session.get(User, self.id)
+        return self._model
+
+    def __getattr__(self, name):
+        # Only reached for attributes not set above (email, to_dict, check_password, ...)
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.get_model(), name)
+
+
+def _load_fields(user_id):
+    row = (
+        db.session.query(
+            User.id, User.username, User.user_type, User.company_id, User.active, Company.name
+        )
+        .outerjoin(Company, User.company_id == Company.id)
+        .filter(User.id == user_id)
+        .first()
+    )
+    if row is None:
+        return None
+    return {
+        "id": row[0],
+        "username": row[1],
+        "user_type": row[2],
+        "company_id": row[3],
+        "active": bool(row[4]),
+        "company_name": row[5],
+    }
+
+
+def load_principal(user_id):
+    """Return a SessionPrincipal for `user_id`, or None if the user does not exist."""
+    now = time.monotonic()
+    with _lock:
+        cached = _entries.get(user_id)
+        hit = cached is not None and cached[0] > now
+        _counts["hits" if hit else "misses"] += 1
+    if hit:
+        return SessionPrincipal(cached[1])
+
+    fields = _load_fields(user_id)
+    if fields is None:
+        invalidate_user(user_id)
+        return None
+    with _lock:
+        _entries[user_id] = (now + SESSION_CACHE_TTL, fields)
+    return SessionPrincipal(fields)
+
+
+def invalidate_user(user_id):
+    """Forget one user (profile update, deactivation, password change...)."""
+    with _lock:
+        _entries.pop(user_id, None)
+
+
+def invalidate_company(company_id):
+    """Forget every cached user of a company (rename, deactivation...)."""
+    with _lock:
+        for user_id in [uid for uid, (_, f) in _entries.items() if f["company_id"] == company_id]:
+            del _entries[user_id]
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+
+def stats():
+    with _lock:
+        hits, misses = _counts["hits"], _counts["misses"]
+        entries = len(_entries)
+    total = hits + misses
+    return {
+        "entries": entries,
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / total, 4) if total else None,
+    }
@@ -0,0 +1,230 @@
+"""
+Per-request SQL instrumentation.
+
+Built on SQLAlchemy `before/after_cursor_execute` engine events:
+- Counts statements and DB time for each request (`request_stats()`)
+- In debug mode (or SQL_DEBUG_HEADERS=true) adds `X-SQL-Count` and
+  `Server-Timing: db;dur=...` headers to every response
+- Flags likely N+1 patterns: the same statement shape run SQL_N_PLUS_ONE_THRESHOLD
+  times in one request, logged on "sql.n_plus_one" with the Python call site
+  (call sites are only collected in debug mode or with SQL_TRACE_CALL_SITES=true)
+- Logs statements slower than SQL_SLOW_QUERY_MS as JSON on "sql.slow"
+
+`capture_queries()` records the statements of a block outside a request
+(CLI commands, tests).
+"""
+
+import json
+import logging
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import current_app, has_request_context, request
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "200"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "5"))
+DEBUG_HEADERS = os.getenv("SQL_DEBUG_HEADERS", "false").lower() in ("1", "true", "yes")
+TRACE_CALL_SITES = os.getenv("SQL_TRACE_CALL_SITES", "false").lower() in ("1", "true", "yes")
+
+slow_log = logging.getLogger("sql.slow")
+n_plus_one_log = logging.getLogger("sql.n_plus_one")
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_THIS_FILE = os.path.abspath(__file__)
+
+_current = ContextVar("sql_request_stats", default=None)
+_instrumented = set()
+
+
+# -------- Helpers --------
+_IN_LIST = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))+\s*\)")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r"\s+")
+
+
+def statement_shape(statement):
+    """Statement text with literals and expanded IN lists collapsed."""
+    shape = _IN_LIST.sub("(?...)", statement)
+    shape = _LITERALS.sub("?", shape)
+    return _SPACES.sub(" ", shape).strip()
+
+
+def call_site():
+    """First frame in project code (routes, services, templates) below this module."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (filename != _THIS_FILE and filename.startswith(PROJECT_DIR)
+                and "site-packages" not in filename):
+            return f"{os.path.relpath(filename, PROJECT_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+class QueryStats:
+    """
+    Statements seen during one request (or one capture_queries block).
+    A request inside a capture_queries block also reports to that block (`parent`).
+    """
+
+    def __init__(self, trace_call_sites=False, parent=None):
+        self.parent = parent
+        self.trace_call_sites = trace_call_sites or (parent is not None and parent.trace_call_sites)
+        self.count = 0
+        self.db_time = 0.0
+        self.started = time.perf_counter()
+        self.queries = []      # (statement, duration, call_site)
+        self.shapes = {}       # shape -> {"count", "time", "call_sites"}
+
+    def record(self, statement, duration, site):
+        self.count += 1
+        self.db_time += duration
+        self.queries.append((statement, duration, site))
+        shape = statement_shape(statement)
+        entry = self.shapes.get(shape)
+        if entry is None:
+            entry = self.shapes[shape] = {"count": 0, "time": 0.0, "call_sites": {}}
+        entry["count"] += 1
+        entry["time"] += duration
+        if site:
+            entry["call_sites"][site] = entry["call_sites"].get(site, 0) + 1
+        if self.parent is not None:
+            self.parent.record(statement, duration, site)
+
+    def repeated(self, threshold=N_PLUS_ONE_THRESHOLD):
+        """SELECT shapes run at least `threshold` times, most frequent first."""
+        found = [
+            {
+                "shape": shape,
+                "count": entry["count"],
+                "time_ms": round(entry["time"] * 1000, 2),
+                "call_sites": sorted(entry["call_sites"], key=entry["call_sites"].get, reverse=True),
+            }
+            for shape, entry in self.shapes.items()
+            if entry["count"] >= threshold and shape.upper().startswith(("SELECT", "WITH"))
+        ]
+        return sorted(found, key=lambda item: item["count"], reverse=True)
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "db_ms": round(self.db_time * 1000, 2),
+            "repeated": self.repeated(),
+        }
+
+
+def request_stats():
+    """QueryStats of the current request / capture block, or None."""
+    return _current.get()
+
+
+@contextmanager
+def capture_queries(trace_call_sites=True):
+    """Record every statement run inside the block; yields the QueryStats."""
+    stats = QueryStats(trace_call_sites=trace_call_sites, parent=_current.get())
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def recording_to(stats):
+    """Record statements inside the block on an existing QueryStats (e.g. a streamed body)."""
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def _log_slow(statement, duration, site):
+    endpoint = request.endpoint if has_request_context() else None
+    slow_log.warning(json.dumps({
+        "event": "slow_query",
+        "duration_ms": round(duration * 1000, 2),
+        "endpoint": endpoint,
+        "call_site": site,
+        "statement": _SPACES.sub(" ", statement)[:2000],
+    }))
+
+
+# -------- Engine events --------
+def instrument_sql(engine):
+    """Time every statement `engine` runs and record it on the active QueryStats."""
+    if id(engine) in _instrumented:
+        return
+    _instrumented.add(id(engine))
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_sql_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("_sql_started")
+        if not started:
+            return
+        duration = time.perf_counter() - started.pop()
+        stats = _current.get()
+        slow = duration * 1000 >= SLOW_QUERY_MS
+        if stats is None and not slow:
+            return
+        site = call_site() if slow or (stats is not None and stats.trace_call_sites) else None
+        if stats is not None:
+            stats.record(statement, duration, site)
+        if slow:
+            _log_slow(statement, duration, site)
+
+    @event.listens_for(engine, "handle_error")
+    def _on_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("_sql_started"):
+            connection.info["_sql_started"].pop()
+
+
+# -------- Request hooks --------
+def register_sql_instrumentation(app):
+    """Open a QueryStats per request, report N+1 shapes and add debug headers."""
+
+    @app.before_request
+    def _start_sql_stats():
+        stats = QueryStats(trace_call_sites=app.debug or TRACE_CALL_SITES, parent=_current.get())
+        request.environ["sql_stats_token"] = _current.set(stats)
+
+    @app.after_request
+    def _report_sql_stats(response):
+        stats = _current.get()
+        if stats is None:
+            return response
+        for item in stats.repeated():
+            n_plus_one_log.warning(json.dumps({
+                "event": "n_plus_one",
+                "endpoint": request.endpoint,
+                **item,
+            }))
+        if current_app.debug or DEBUG_HEADERS:
+            total_ms = (time.perf_counter() - stats.started) * 1000
+            db_ms = stats.db_time * 1000
+            response.headers["X-SQL-Count"] = str(stats.count)
+            response.headers.add(
+                "Server-Timing",
+                f'db;dur={db_ms:.2f};desc="{stats.count} queries", app;dur={total_ms - db_ms:.2f}',
+            )
+        return response
+
+    @app.teardown_request
+    def _end_sql_stats(exc):
+        token = request.environ.pop("sql_stats_token", None)
+        if token is not None:
+            try:
+                _current.reset(token)
+            except ValueError:
+                # Reset from a different context (streamed responses); just clear it
+                _current.set(None)
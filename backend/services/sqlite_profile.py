@@ -0,0 +1,55 @@
+"""
+SQLite profile for single-box sites and tests.
+
+Applied to every new SQLite connection through a `connect` event:
+- journal_mode=WAL        readers never block the writer (file databases only)
+- synchronous=NORMAL      fsync at checkpoints instead of every commit; safe with WAL
+- mmap_size               read pages through the OS page cache (SQLITE_MMAP_SIZE)
+- busy_timeout            wait for the write lock instead of failing (SQLITE_BUSY_TIMEOUT_MS)
+- foreign_keys=ON         enforce foreign keys like MySQL/InnoDB does
+"""
+
+import os
+
+from sqlalchemy import event
+
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+def is_sqlite(url) -> bool:
+    return url.get_backend_name() == "sqlite"
+
+
+def is_memory(url) -> bool:
+    return url.database in (None, "", ":memory:")
+
+
+def sqlite_pragmas(url):
+    pragmas = [
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+        "PRAGMA foreign_keys=ON",
+        "PRAGMA synchronous=NORMAL",
+    ]
+    if not is_memory(url):
+        pragmas += [
+            "PRAGMA journal_mode=WAL",
+            f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        ]
+    return pragmas
+
+
+def apply_sqlite_profile(engine):
+    """Run the profile PRAGMAs on each new connection of a SQLite engine."""
+    if not is_sqlite(engine.url):
+        return
+    pragmas = sqlite_pragmas(engine.url)
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
@@ -0,0 +1,171 @@
+"""
+Startup timing and pre-fork warm-up.
+
+With a pre-fork server (gunicorn --preload, see wsgi.py and gunicorn.conf.py)
+the app is built once in the master and every worker inherits it:
+
+- `prepare_for_fork(app)` configures the SQLAlchemy mappers, compiles every
+  Jinja template, imports lazily loaded modules and checks that each database
+  answers, so workers do not pay for that on their first requests. Pool
+  connections are then closed (sockets must not be shared across processes)
+  and the surviving objects are moved out of the GC's reach (`gc.freeze()`),
+  so collections in the workers do not touch, and un-share, those pages
+- `after_fork(app)` runs in each worker: it drops the inherited pool state and
+  opens WARMUP_POOL_CONNECTIONS connections (default: DB_POOL_SIZE) up front
+
+`StartupTimer` records named phases (create_app and the warm-up above);
+`import_costs()` measures module import times in a fresh interpreter
+(`python -X importtime`). `flask startup-report` prints both.
+"""
+
+import gc
+import importlib
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from sqlalchemy.orm import configure_mappers
+
+from db import db
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WARMUP_POOL_CONNECTIONS = os.getenv("WARMUP_POOL_CONNECTIONS")
+# Imported on first use inside request handlers
+LAZY_MODULES = ["services.group_commit"]
+PROJECT_PACKAGES = ("app", "db", "commands", "seed", "wsgi", "models", "routes", "services")
+
+log = logging.getLogger("startup")
+
+
+class StartupTimer:
+    """Named phases with their wall time, in the order they ran."""
+
+    def __init__(self):
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    def total(self):
+        return sum(seconds for _, seconds in self.phases)
+
+    def lines(self):
+        return [f"{seconds * 1000:9.1f} ms  {name}" for name, seconds in self.phases]
+
+
+def app_timer(app):
+    return app.extensions.setdefault("startup_timer", StartupTimer())
+
+
+# -------- Warm-up --------
+def _compile_templates(app):
+    env = app.jinja_env
+    names = env.list_templates()
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+def _engines(app):
+    with app.app_context():
+        return list(db.engines.values())
+
+
+def warm_up(app, timer=None):
+    """Configure mappers, compile templates and check every database (no pooled connection is kept)."""
+    timer = timer or app_timer(app)
+    with timer.phase("warmup: configure mappers"):
+        configure_mappers()
+    with timer.phase("warmup: compile templates"):
+        _compile_templates(app)
+    with timer.phase("warmup: lazy imports"):
+        for module in LAZY_MODULES:
+            importlib.import_module(module)
+    with timer.phase("warmup: database check"):
+        for engine in _engines(app):
+            with engine.connect() as conn:
+                conn.exec_driver_sql("SELECT 1")
+    return timer
+
+
+def prepare_for_fork(app):
+    """Warm the app in the master process and freeze the GC before workers fork."""
+    timer = warm_up(app)
+    with timer.phase("prefork: close pools"):
+        for engine in _engines(app):
+            engine.dispose()
+    with timer.phase("prefork: gc.freeze"):
+        gc.collect()
+        gc.freeze()
+    log.info("Startup finished in %.1f ms\n%s", timer.total() * 1000, "\n".join(timer.lines()))
+    return timer
+
+
+def warm_pool(app, connections=None):
+    """Check out `connections` connections per engine at once, then return them to the pool."""
+    for engine in _engines(app):
+        size = connections
+        if size is None:
+            size = int(WARMUP_POOL_CONNECTIONS) if WARMUP_POOL_CONNECTIONS else getattr(engine.pool, "size", lambda: 1)()
+        opened = []
+        try:
+            for _ in range(size):
+                opened.append(engine.connect())
+        finally:
+            for conn in opened:
+                conn.close()
+
+
+def after_fork(app):
+    """Worker-side half of the pre-fork setup (gunicorn post_fork hook)."""
+    for engine in _engines(app):
+        # Forget the parent's pool without touching its sockets
+        engine.dispose(close=False)
+    warm_pool(app)
+
+
+# -------- Import costs --------
+_IMPORT_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)")
+
+
+def _group(module):
+    top = module.split(".")[0]
+    if top in PROJECT_PACKAGES:
+        return module
+    return top
+
+
+def import_costs(module="app"):
+    """
+    Import `module` in a fresh interpreter with -X importtime.
+    Returns [(name, self_seconds, cumulative_seconds)], biggest self time first;
+    project modules are listed one by one, third-party ones per top-level package.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, env=os.environ.copy(),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed")
+
+    totals = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, name = match.groups()
+        entry = totals.setdefault(_group(name), [0, 0])
+        entry[0] += int(self_us)
+        # A package's outermost import has the largest cumulative time
+        entry[1] = max(entry[1], int(cumulative_us))
+    rows = [(name, self_us / 1e6, cumulative_us / 1e6) for name, (self_us, cumulative_us) in totals.items()]
+    return sorted(rows, key=lambda row: row[1], reverse=True)
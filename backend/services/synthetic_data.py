@@ -0,0 +1,345 @@
+"""
+Synthetic datasets for performance testing (`flask generate-data`).
+
+seed.py builds a handful of demo rows; this generates companies, company
+admins, botiquines, medicines and hardware log history at any scale, from
+PROFILES (up to 10k companies / 100k kits / 1M medicines / 100M log rows)
+with per-option overrides:
+
+- Deterministic: every kit draws from its own `random.Random(f"{seed}:{n}")`, so
+  the same seed and options give the same rows, whatever the chunk size
+- Rows are plain tuples; companies and kits get their ids up front
+  (continuing after the current max id), so no insert waits for its parent's
+- Inserts go out in chunks of `chunk_size` rows through the DBAPI's
+  executemany on the INSERT built from the Core table (PyMySQL turns it into
+  multi-row INSERTs), one transaction per chunk; SQLAlchemy's per-row bind
+  processing would otherwise cost more than the database itself
+- While a chunk is written, MySQL skips unique / foreign key checks and
+  SQLite runs with synchronous=OFF and foreign_keys=OFF (parents are always
+  written first); the connection's settings are restored afterwards
+- Medicine statuses follow `status_mix` (share of EXPIRED, EXPIRES_SOON,
+  EXPIRES_30, OUT_OF_STOCK, LOW_STOCK; the rest is OK), with quantities and
+  expiry dates picked so Medicine.status() lands on the drawn status
+- Each kit gets `logs_per_kit` per-compartment readings spread over the last
+  `log_days` days; readings of empty compartments and an `error_rate` share
+  of the others carry the same error messages as services/ingest.py
+
+Rollups are rebuilt at the end (services/rollups.py) unless skipped.
+"""
+
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from db import db
+from models.models import Botiquin, Company, HardwareLog, Medicine, User
+from services.passwords import hash_password
+from services.rollups import rebuild_all
+
+PROFILES = {
+    "tiny": {"companies": 5, "kits_per_company": 4, "compartments": 8, "logs_per_kit": 20},
+    "small": {"companies": 100, "kits_per_company": 10, "compartments": 10, "logs_per_kit": 100},
+    "medium": {"companies": 1000, "kits_per_company": 10, "compartments": 10, "logs_per_kit": 200},
+    "large": {"companies": 10000, "kits_per_company": 10, "compartments": 10, "logs_per_kit": 1000},
+}
+DEFAULTS = {
+    "users_per_company": 1,
+    "fill": 1.0,
+    "log_days": 90,
+    "error_rate": 0.01,
+    "password": "password123",
+}
+STATUSES = ("EXPIRED", "EXPIRES_SOON", "EXPIRES_30", "OUT_OF_STOCK", "LOW_STOCK")
+DEFAULT_STATUS_MIX = {"EXPIRED": 0.04, "EXPIRES_SOON": 0.03, "EXPIRES_30": 0.08, "OUT_OF_STOCK": 0.05,
+                      "LOW_STOCK": 0.15}
+CHUNK_SIZE = 20000
+
+# (generic name, [(trade name, brand)], strength, unit weight in grams)
+CATALOG = [
+    ("Paracetamol", [("Tempra", "Reckitt"), ("Tylenol", "Kenvue"), ("Panadol", "Haleon")], "500 mg", 0.65),
+    ("Ibuprofeno", [("Advil", "Haleon"), ("Motrin", "Kenvue")], "400 mg", 0.55),
+    ("Naproxeno", [("Flanax", "Bayer")], "250 mg", 0.45),
+    ("Loratadina", [("Clarityne", "Bayer")], "10 mg", 0.2),
+    ("Omeprazol", [("Losec", "AstraZeneca")], "20 mg", 0.3),
+    ("Metamizol", [("Neo-Melubrina", "Sanofi")], "500 mg", 0.7),
+    ("Butilhioscina", [("Buscapina", "Sanofi")], "10 mg", 0.25),
+    ("Ácido acetilsalicílico", [("Aspirina", "Bayer")], "500 mg", 0.6),
+    ("Loperamida", [("Imodium", "Kenvue")], "2 mg", 0.2),
+    ("Diclofenaco", [("Voltaren", "Haleon")], "50 mg", 0.35),
+    ("Cetirizina", [("Zyrtec", "Kenvue")], "10 mg", 0.2),
+    ("Subsalicilato de bismuto", [("Pepto-Bismol", "P&G")], "262 mg", 1.1),
+]
+LOCATIONS = ["Recepción", "Planta baja", "Piso 1", "Piso 2", "Almacén", "Cocina", "Taller", "Estacionamiento"]
+SENSOR_TYPES = ("weight",) * 9 + ("infrared",)
+
+
+def resolve_options(profile="small", **overrides):
+    """PROFILES[profile] and DEFAULTS, with every override that is not None applied."""
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown profile '{profile}' (choose from {', '.join(PROFILES)})")
+    options = {**DEFAULTS, **PROFILES[profile], "status_mix": dict(DEFAULT_STATUS_MIX)}
+    options.update({key: value for key, value in overrides.items() if value is not None})
+    unknown = set(options["status_mix"]) - set(STATUSES)
+    if unknown:
+        raise ValueError(f"Unknown statuses in the mix: {', '.join(sorted(unknown))}")
+    if sum(options["status_mix"].values()) > 1:
+        raise ValueError("Status shares add up to more than 1")
+    if not 0 <= options["fill"] <= 1 or not 0 <= options["error_rate"] <= 1:
+        raise ValueError("fill and error_rate must be between 0 and 1")
+    return options
+
+
+def parse_status_mix(text):
+    """"expired=0.05,low_stock=0.2" -> {"EXPIRED": 0.05, "LOW_STOCK": 0.2}."""
+    mix = {}
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        name, sep, share = part.partition("=")
+        if not sep:
+            raise ValueError(f"Expected STATUS=SHARE, got '{part}'")
+        mix[name.strip().upper()] = float(share)
+    return mix
+
+
+def estimate_rows(options):
+    """Rows per table the options will produce (medicines: expected value for fill < 1)."""
+    kits = options["companies"] * options["kits_per_company"]
+    return {
+        "companies": options["companies"],
+        "users": options["companies"] * options["users_per_company"],
+        "botiquines": kits,
+        "medicines": int(kits * options["compartments"] * options["fill"]),
+        "hardware_logs": kits * options["logs_per_kit"],
+    }
+
+
+# -------- Bulk insert --------
+_PLACEHOLDERS = {"qmark": "?", "format": "%s", "pyformat": "%s"}
+
+
+class BulkWriter:
+    """Chunked executemany of tuples into one table, a transaction per chunk."""
+
+    def __init__(self, engine, table, columns, chunk_size=CHUNK_SIZE, progress=None):
+        self.engine = engine
+        self.table = table
+        self.columns = columns
+        self.chunk_size = max(1, chunk_size)
+        self.progress = progress
+        self.rows = 0
+        self.started = time.perf_counter()
+        self._buffer = []
+        placeholder = _PLACEHOLDERS.get(engine.dialect.paramstyle)
+        if placeholder:
+            self.sql = (f"INSERT INTO {table.name} ({', '.join(columns)}) "
+                        f"VALUES ({', '.join([placeholder] * len(columns))})")
+        else:
+            # Any other DBAPI: regular Core executemany with dicts
+            self.sql = None
+            self.stmt = insert(table)
+
+    def add(self, row):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def extend(self, rows):
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        with self.engine.connect() as conn:
+            _relax_checks(conn, True)
+            try:
+                if self.sql:
+                    conn.exec_driver_sql(self.sql, self._buffer)
+                else:
+                    conn.execute(self.stmt, [dict(zip(self.columns, row)) for row in self._buffer])
+                conn.commit()
+            finally:
+                # The connection goes back to the pool: restore its settings
+                conn.rollback()
+                _relax_checks(conn, False)
+                conn.commit()
+        self.rows += len(self._buffer)
+        self._buffer = []
+        if self.progress:
+            self.progress(self.table.name, self.rows, time.perf_counter() - self.started)
+
+
+def _relax_checks(conn, relaxed):
+    if conn.dialect.name == "mysql":
+        flag = 0 if relaxed else 1
+        conn.exec_driver_sql(f"SET unique_checks = {flag}, foreign_key_checks = {flag}")
+    elif conn.dialect.name == "sqlite":
+        conn.exec_driver_sql(f"PRAGMA synchronous = {'OFF' if relaxed else 'NORMAL'}")
+        conn.exec_driver_sql(f"PRAGMA foreign_keys = {'OFF' if relaxed else 'ON'}")
+
+
+def _next_id(conn, model):
+    return (conn.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+# -------- Row builders --------
+def _ts(moment):
+    # The text form SQLAlchemy stores for SQLite and MySQL accepts
+    return moment.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _medicine_row(rng, kit_id, compartment, status, today, now):
+    generic, brands, strength, unit_weight = CATALOG[rng.randrange(len(CATALOG))]
+    trade, brand = brands[rng.randrange(len(brands))]
+    reorder = rng.randint(3, 10)
+    capacity = rng.choice((30, 50, 100))
+    quantity = rng.randint(reorder + 1, capacity)
+    expires_in = rng.randint(31, 720)
+    if status == "EXPIRED":
+        expires_in = -rng.randint(1, 365)
+    elif status == "EXPIRES_SOON":
+        expires_in = rng.randint(0, 7)
+    elif status == "EXPIRES_30":
+        expires_in = rng.randint(8, 30)
+    elif status == "OUT_OF_STOCK":
+        quantity = 0
+    elif status == "LOW_STOCK":
+        quantity = rng.randint(1, reorder)
+    created = now - timedelta(days=rng.randint(30, 400))
+    return (
+        kit_id, compartment, trade, generic, brand, strength, unit_weight,
+        round(quantity * unit_weight, 2), quantity, reorder, capacity,
+        (today + timedelta(days=expires_in)).isoformat(), f"L{rng.randrange(10 ** 6):06d}",
+        _ts(now - timedelta(minutes=rng.randint(1, 1440))), _ts(created), _ts(created), 1,
+    )
+
+
+class _Timeline:
+    """Text timestamps for second offsets from `start`, without a datetime per row."""
+
+    def __init__(self, start, days):
+        self.days = [(start + timedelta(days=d)).strftime("%Y-%m-%d ") for d in range(days + 1)]
+        self.clock = [f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in range(86400)]
+
+    def at(self, seconds):
+        day, second = divmod(int(seconds), 86400)
+        return self.days[day] + self.clock[second]
+
+
+def _kit_logs(rng, kit_id, compartments, weights, options, timeline):
+    """`logs_per_kit` readings, oldest first, cycling over the compartments."""
+    count = options["logs_per_kit"]
+    rows = []
+    if not count:
+        return rows
+    step = options["log_days"] * 86400 / count
+    error_rate = options["error_rate"]
+    draw = rng.random
+    for i in range(count):
+        compartment = i % compartments + 1
+        created = timeline.at((i + draw()) * step)
+        sensor = SENSOR_TYPES[int(draw() * len(SENSOR_TYPES))]
+        weight = weights.get(compartment)
+        if weight is None:
+            reading = int(draw() * 200) / 100
+            rows.append((kit_id, compartment, reading, sensor, f'{{"compartment": {compartment}, "weight": {reading}}}',
+                         0, f"No medicine found in compartment {compartment}", created))
+        elif draw() < error_rate:
+            rows.append((kit_id, compartment, None, sensor, f'{{"compartment": {compartment}}}',
+                         0, "Missing compartment or weight data", created))
+        else:
+            reading = int(weight * (80 + draw() * 40)) / 100
+            rows.append((kit_id, compartment, reading, sensor, f'{{"compartment": {compartment}, "weight": {reading}}}',
+                         1, None, created))
+    return rows
+
+
+# -------- Generator --------
+MEDICINE_COLUMNS = ("botiquin_id", "compartment_number", "trade_name", "generic_name", "brand", "strength",
+                    "unit_weight", "current_weight", "quantity", "reorder_level", "max_capacity", "expiry_date",
+                    "batch_number", "last_scan_at", "created_at", "updated_at", "version")
+LOG_COLUMNS = ("botiquin_id", "compartment_number", "weight_reading", "sensor_type", "raw_data", "processed",
+               "error_message", "created_at")
+
+
+def generate(options, seed=42, chunk_size=CHUNK_SIZE, rollups=True, progress=None):
+    """
+    Insert the dataset described by `options` (see resolve_options) next to
+    whatever is already in the database. Returns {table: rows} plus "seconds".
+    """
+    started = time.perf_counter()
+    engine = db.engine
+    today = date.today()
+    now = datetime.utcnow().replace(microsecond=0)
+    with engine.connect() as conn:
+        first_company = _next_id(conn, Company)
+        first_kit = _next_id(conn, Botiquin)
+    tag = f"s{seed}c{first_company}"  # keeps names unique across runs
+    password_hash = hash_password(options["password"])
+
+    def writer(model, columns):
+        return BulkWriter(engine, model.__table__, columns, chunk_size, progress)
+
+    companies = writer(Company, ("id", "name", "contact_email", "contact_phone", "active", "created_at",
+                                 "updated_at"))
+    users = writer(User, ("username", "email", "password_hash", "user_type", "company_id", "active",
+                          "created_at", "updated_at"))
+    created = _ts(now)
+    for n in range(options["companies"]):
+        company_id = first_company + n
+        companies.add((company_id, f"Empresa {tag}-{n:05d}", f"contacto{n}.{tag}@example.com",
+                       f"+52 55 {company_id % 10 ** 8:08d}", 1, created, created))
+        for u in range(options["users_per_company"]):
+            users.add((f"admin_{tag}_{n}_{u}", f"admin{u}.{n}.{tag}@example.com", password_hash,
+                       "company_admin", company_id, 1, created, created))
+    companies.flush()
+    users.flush()
+
+    kits = writer(Botiquin, ("id", "hardware_id", "name", "location", "company_id", "total_compartments",
+                             "active", "last_sync_at", "created_at", "updated_at"))
+    medicines = writer(Medicine, MEDICINE_COLUMNS)
+    logs = writer(HardwareLog, LOG_COLUMNS)
+    mix = options["status_mix"]
+    statuses = list(mix) + ["OK"]
+    weights_by_status = list(mix.values()) + [max(0.0, 1 - sum(mix.values()))]
+    compartments = options["compartments"]
+    # Log history runs from midnight `log_days` ago up to today
+    timeline = _Timeline(datetime.combine(today - timedelta(days=options["log_days"]), datetime.min.time()),
+                         options["log_days"])
+    kits_per_company = options["kits_per_company"]
+
+    kit_count = options["companies"] * kits_per_company
+    rng = random.Random(seed)
+    for n in range(kit_count):
+        kits.add((first_kit + n, f"SYN-{tag}-{n:07d}", f"Botiquín {n % kits_per_company + 1}",
+                  LOCATIONS[n % len(LOCATIONS)], first_company + n // kits_per_company, compartments, 1,
+                  _ts(now - timedelta(minutes=rng.randint(1, 1440))), created, created))
+    # All kits exist before any medicine or log that references them
+    kits.flush()
+
+    for n in range(kit_count):
+        kit_id = first_kit + n
+        rng = random.Random(f"{seed}:{n}")
+        drawn = rng.choices(statuses, weights_by_status, k=compartments)
+        weights = {}
+        for compartment in range(1, compartments + 1):
+            if rng.random() >= options["fill"]:
+                continue
+            row = _medicine_row(rng, kit_id, compartment, drawn[compartment - 1], today, now)
+            weights[compartment] = row[7]
+            medicines.add(row)
+        logs.extend(_kit_logs(rng, kit_id, compartments, weights, options, timeline))
+    medicines.flush()
+    logs.flush()
+
+    counts = {"companies": companies.rows, "users": users.rows, "botiquines": kits.rows,
+              "medicines": medicines.rows, "hardware_logs": logs.rows}
+    if rollups:
+        rollup_started = time.perf_counter()
+        rebuild_all()
+        if progress:
+            progress("rollups", kits.rows, time.perf_counter() - rollup_started)
+    counts["seconds"] = round(time.perf_counter() - started, 2)
+    return counts
@@ -0,0 +1,69 @@
+"""
+Tenant scoping for queries.
+
+Authorization is expressed as SQL filters instead of "load, then compare
+company_id": a company admin's query only ever returns rows of their own
+company, and a row they may not see simply is not found.
+
+- Super admins are unrestricted
+- Company admins are limited to `user.company_id`
+- Company admins without a company see nothing
+- Medicines and hardware logs are scoped through their botiquin
+"""
+
+from flask import jsonify
+from flask_login import current_user
+
+from db import db
+from models.models import Botiquin, Company, HardwareLog, Medicine, User
+
+
+def api_auth_error():
+    """
+    Standard JSON auth check for API blueprints.
+    Returns an error response, or None when the current user may proceed.
+    """
+    if not current_user.is_authenticated:
+        return jsonify({"error": "Not authenticated"}), 401
+    if not getattr(current_user, "active", False):
+        return jsonify({"error": "User not found"}), 404
+    return None
+
+
+def _tenant_filter(model, company_id):
+    if company_id is None:
+        return db.false()
+    if model is Company:
+        return Company.id == company_id
+    if model in (Botiquin, User):
+        return model.company_id == company_id
+    if model in (Medicine, HardwareLog):
+        tenant_kits = db.select(Botiquin.id).where(Botiquin.company_id == company_id)
+        return model.botiquin_id.in_(tenant_kits)
+    raise ValueError(f"No tenant scope defined for {model.__name__}")
+
+
+def scope_query(query, model, user=None):
+    """Restrict `query` over `model` to the rows `user` may see."""
+    user = user or current_user
+    if user.is_super_admin():
+        return query
+    return query.filter(_tenant_filter(model, user.company_id))
+
+
+def scoped(model, user=None):
+    """Shortcut for `scope_query(model.query, model, user)`."""
+    return scope_query(model.query, model, user)
+
+
+def scoped_get(model, pk, user=None):
+    """Fetch one row by primary key, or None if it does not exist for this user."""
+    if pk is None:
+        return None
+    return scoped(model, user).filter(model.id == pk).first()
+
+
+def can_use_company(company_id, user=None):
+    """Whether `user` may attach data to `company_id` (no query needed)."""
+    user = user or current_user
+    return user.is_super_admin() or (user.company_id is not None and user.company_id == company_id)
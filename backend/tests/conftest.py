@@ -0,0 +1,125 @@
+"""
+Shared fixtures for the backend test suite.
+
+The app runs on a throwaway SQLite file (DB_PROFILE=sqlite) seeded with
+seed.py plus a realistic dataset: several dozen kits per company, a medicine
+in every compartment, hardware logs and extra users. Device signing and rate
+limiting are off so tests can call the hardware endpoints directly.
+
+Run from backend/:
+
+    python -m pytest -q tests
+"""
+
+import os
+import random
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+os.environ["DB_PROFILE"] = "sqlite"
+TEST_DIR = tempfile.mkdtemp(prefix="botiquines-tests-")
+os.environ["SQLITE_PATH"] = os.path.join(TEST_DIR, "test.db")
+os.environ["PROFILE_DIR"] = os.path.join(TEST_DIR, "profiles")
+os.environ.pop("DATABASE_URL", None)
+os.environ.pop("DATABASE_READ_URL", None)
+os.environ["HARDWARE_AUTH"] = "off"
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ["PASSWORD_POOL_WORKERS"] = "0"
+
+import pytest  # noqa: E402
+
+KITS_PER_COMPANY = 30
+COMPARTMENTS = 8
+LOGS_PER_KIT = 10
+USERS_PER_COMPANY = 6
+
+PASSWORDS = {
+    "admin": "admin123",
+    "demo_admin": "password123",
+    "health_admin": "healthpass456",
+}
+
+
+def _seed_dataset(db):
+    from models.models import Botiquin, Company, HardwareLog, Medicine, User
+
+    rng = random.Random(42)
+    today = date.today()
+    now = datetime.utcnow()
+
+    for company in Company.query.order_by(Company.id).all():
+        for i in range(USERS_PER_COMPANY):
+            user = User(username=f"{company.id}_user_{i}", email=f"user{i}@company{company.id}.test",
+                        user_type="company_admin", company_id=company.id)
+            user.password_hash = "not-a-login-account"
+            db.session.add(user)
+
+        for k in range(KITS_PER_COMPANY):
+            kit = Botiquin(hardware_id=f"TEST_{company.id}_{k:03d}", name=f"Kit {k}", location=f"Floor {k % 5}",
+                           company_id=company.id, total_compartments=COMPARTMENTS, last_sync_at=now)
+            db.session.add(kit)
+            db.session.flush()
+            for compartment in range(1, COMPARTMENTS + 1):
+                unit_weight = rng.choice([0.02, 0.4, 0.55, 60.0])
+                quantity = rng.randint(0, 30)
+                db.session.add(Medicine(
+                    botiquin_id=kit.id, compartment_number=compartment,
+                    trade_name=f"Med {compartment}", generic_name=f"Generic {compartment}", brand="Lab",
+                    strength="500 mg", unit_weight=unit_weight, current_weight=unit_weight * quantity,
+                    quantity=quantity, reorder_level=5, max_capacity=30,
+                    expiry_date=today + timedelta(days=rng.randint(-30, 400)),
+                    batch_number=f"L{rng.randint(1000, 9999)}", last_scan_at=now,
+                ))
+            for n in range(LOGS_PER_KIT):
+                db.session.add(HardwareLog(
+                    botiquin_id=kit.id, compartment_number=n % COMPARTMENTS + 1,
+                    weight_reading=round(rng.uniform(0, 20), 2), sensor_type="weight",
+                    raw_data="{}", processed=True, created_at=now - timedelta(minutes=n),
+                ))
+        db.session.commit()
+
+    # Unassigned kits for the assignment pages
+    for k in range(3):
+        db.session.add(Botiquin(hardware_id=f"TEST_FREE_{k}", name=f"Free {k}", total_compartments=4))
+    db.session.commit()
+
+
+@pytest.fixture(scope="session")
+def app():
+    import seed
+    from app import app as flask_app
+    from db import db
+    from services.rollups import rebuild_all
+
+    seed.init_db()
+    with flask_app.app_context():
+        _seed_dataset(db)
+        rebuild_all()
+    flask_app.config["TESTING"] = True
+    return flask_app
+
+
+@pytest.fixture(scope="session")
+def login(app):
+    """
+    login("demo_admin") -> a test client with that user's session (shared).
+    login("demo_admin", fresh=True) -> a new client, e.g. for a logout.
+    """
+    clients = {}
+
+    def _login(username, fresh=False):
+        if fresh or username not in clients:
+            client = app.test_client()
+            if username is not None:
+                response = client.post("/login", json={"username": username, "password": PASSWORDS[username]})
+                assert response.status_code == 200, response.get_data(as_text=True)
+            if fresh:
+                return client
+            clients[username] = client
+        return clients[username]
+
+    return _login
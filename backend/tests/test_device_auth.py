@@ -0,0 +1,109 @@
+"""
+HMAC device authentication of the hardware endpoints (services/device_auth.py).
+conftest.py turns HARDWARE_AUTH off for the other tests; here it is set per test.
+"""
+
+import json
+import time
+
+import pytest
+
+SENSOR_PATH = "/api/hardware/sensor_data"
+
+
+@pytest.fixture(scope="module")
+def kits(app):
+    """{hardware_id: (key_id, secret)} for two seeded kits."""
+    from db import db
+    from models.models import Botiquin
+    from services.device_auth import issue_device_key
+
+    keys = {}
+    with app.app_context():
+        for hardware_id in ("BOT_DEMO_COMP", "BOT_HEALTH_CORP"):
+            key, secret = issue_device_key(Botiquin.query.filter_by(hardware_id=hardware_id).first())
+            db.session.commit()
+            keys[hardware_id] = (key.key_id, secret)
+    return keys
+
+
+@pytest.fixture(params=["optional", "required"])
+def mode(request, monkeypatch):
+    import services.ingest
+
+    monkeypatch.setattr(services.ingest, "HARDWARE_AUTH", request.param)
+    return request.param
+
+
+def _body(hardware_id):
+    # An empty compartment: the reading is only logged, the seeded stock stays as it is
+    return json.dumps({"hardware_id": hardware_id, "compartments": [{"compartment": 99, "weight": 5.0}]}).encode()
+
+
+def _post(app, body, headers=None):
+    return app.test_client().post(SENSOR_PATH, data=body, content_type="application/json", headers=headers or {})
+
+
+def _signed(kits, hardware_id, body, **kwargs):
+    from services.device_auth import sign_request
+
+    key_id, secret = kits[hardware_id]
+    return sign_request(key_id, secret, "POST", SENSOR_PATH, body, **kwargs)
+
+
+def test_valid_signature_is_accepted(app, kits, mode):
+    body = _body("BOT_DEMO_COMP")
+    assert _post(app, body, _signed(kits, "BOT_DEMO_COMP", body)).status_code == 200
+
+
+def test_unsigned_request_depends_on_mode(app, kits, mode):
+    expected = 200 if mode == "optional" else 401
+    assert _post(app, _body("BOT_DEMO_COMP")).status_code == expected
+
+
+def test_tampered_body_is_rejected(app, kits, mode):
+    headers = _signed(kits, "BOT_DEMO_COMP", _body("BOT_DEMO_COMP"))
+    tampered = _body("BOT_DEMO_COMP").replace(b"5.0", b"0.0")
+    response = _post(app, tampered, headers)
+    assert response.status_code == 401
+    assert "Invalid signature" in response.get_json()["error"]
+
+
+def test_wrong_secret_is_rejected(app, kits, mode):
+    from services.device_auth import sign_request
+
+    body = _body("BOT_DEMO_COMP")
+    key_id, _ = kits["BOT_DEMO_COMP"]
+    assert _post(app, body, sign_request(key_id, "0" * 64, "POST", SENSOR_PATH, body)).status_code == 401
+
+
+def test_timestamp_outside_the_window_is_rejected(app, kits, mode):
+    from services.device_auth import DEVICE_AUTH_MAX_SKEW
+
+    body = _body("BOT_DEMO_COMP")
+    for skew in (-DEVICE_AUTH_MAX_SKEW - 60, DEVICE_AUTH_MAX_SKEW + 60):
+        headers = _signed(kits, "BOT_DEMO_COMP", body, timestamp=time.time() + skew)
+        response = _post(app, body, headers)
+        assert response.status_code == 401
+        assert "window" in response.get_json()["error"]
+
+
+def test_replayed_nonce_is_rejected(app, kits, mode):
+    body = _body("BOT_DEMO_COMP")
+    headers = _signed(kits, "BOT_DEMO_COMP", body)
+    assert _post(app, body, headers).status_code == 200
+    response = _post(app, body, headers)
+    assert response.status_code == 401
+    assert "Replayed" in response.get_json()["error"]
+
+
+def test_key_of_another_kit_is_forbidden(app, kits, mode):
+    body = _body("BOT_HEALTH_CORP")
+    assert _post(app, body, _signed(kits, "BOT_DEMO_COMP", body)).status_code == 403
+
+
+def test_incomplete_credentials_are_rejected(app, kits, mode):
+    body = _body("BOT_DEMO_COMP")
+    headers = _signed(kits, "BOT_DEMO_COMP", body)
+    del headers["X-Device-Nonce"]
+    assert _post(app, body, headers).status_code == 401
@@ -0,0 +1,51 @@
+"""
+Live update events across processes: two broadcasters sharing one SQLite
+relay stand in for a gunicorn worker and the `ingest-serve` process.
+"""
+
+import queue
+
+
+def test_relay_delivers_events_published_by_another_process(tmp_path):
+    from services.events import Broadcaster, SQLiteEventRelay
+
+    path = str(tmp_path / "events.db")
+    worker = Broadcaster(SQLiteEventRelay(path, poll_interval=0.01))
+    ingest_process = Broadcaster(SQLiteEventRelay(path, poll_interval=0.01))
+
+    own_company = worker.subscribe(company_id=1)
+    other_company = worker.subscribe(company_id=2)
+    ingest_process.publish("kit", {"botiquin_id": 7, "company_id": 1, "critical": 2})
+
+    name, payload = own_company.queue.get(timeout=5)
+    assert name == "kit"
+    assert '"critical":2' in payload
+    try:
+        other_company.queue.get(timeout=0.2)
+        raise AssertionError("event leaked to another company's channel")
+    except queue.Empty:
+        pass
+
+
+def test_ingest_serve_requires_shared_stores(app):
+    result = app.test_cli_runner().invoke(args=["ingest-serve", "--port", "0"])
+
+    assert result.exit_code != 0
+    assert "EVENTS_STORE" in result.output
+
+
+def test_stream_route_caps_open_streams(app, login, monkeypatch):
+    from routes import events as events_route
+    from services.events import broadcaster
+
+    client = login("demo_admin")
+    before = broadcaster.subscriber_count()
+
+    # A response that is never iterated holds no subscription
+    client.get("/api/events/stream").close()
+    assert broadcaster.subscriber_count() == before
+
+    monkeypatch.setattr(events_route, "EVENTS_MAX_STREAMS", before)
+    response = client.get("/api/events/stream")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "30"
@@ -0,0 +1,24 @@
+"""
+Per-kit inventory page (GET /botiquin/<id>/inventory) of a deactivated kit.
+"""
+
+
+def test_inactive_kit_still_lists_its_medicines(app, login):
+    from db import db
+    from models.models import Botiquin, Medicine
+
+    with app.app_context():
+        kit = Botiquin.query.filter(Botiquin.hardware_id.like("TEST_%_002")).first()
+        medicine = Medicine.query.filter_by(botiquin_id=kit.id).order_by(Medicine.compartment_number).first()
+        kit_id, trade_name = kit.id, medicine.trade_name
+        kit.active = False
+        db.session.commit()
+
+    try:
+        response = login("admin").get(f"/botiquin/{kit_id}/inventory")
+        assert response.status_code == 200
+        assert trade_name in response.get_data(as_text=True)
+    finally:
+        with app.app_context():
+            db.session.get(Botiquin, kit_id).active = True
+            db.session.commit()
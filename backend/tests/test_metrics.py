@@ -0,0 +1,68 @@
+"""
+Prometheus exposition across processes (METRICS_MULTIPROC_DIR), scrape
+access without METRICS_TOKEN, and the ingest-serve /metrics route.
+"""
+
+import asyncio
+import os
+
+from werkzeug.datastructures import Headers
+
+
+def _other_process_snapshot(pid, payloads):
+    from services.metrics import _Writer
+
+    out = _Writer()
+    out.sample("ingest_payloads_total", "counter", "Sensor payloads handled, by HTTP status.", payloads,
+               (("status", "200"),))
+    out.sample("db_pool_checked_out", "gauge", "Connections currently in use.", 3, (("pool", "primary"),))
+    return {"pid": pid, "live": True, "families": out.snapshot()}
+
+
+def test_scrape_sums_every_process_and_keeps_exited_workers(app, tmp_path, monkeypatch):
+    from services import metrics
+
+    monkeypatch.setattr(metrics, "METRICS_MULTIPROC_DIR", str(tmp_path))
+    metrics.clear_multiproc_dir()
+    metrics.incr("ingest_payloads_total", (("status", "200"),), 5)
+    own = metrics._merged()[1][("ingest_payloads_total", (("status", "200"),))]
+    metrics._write_json(metrics._snapshot_path(999001), _other_process_snapshot(999001, 7))
+    metrics._write_json(metrics._snapshot_path(999002), _other_process_snapshot(999002, 11))
+    metrics.mark_process_dead(999002)
+
+    text = metrics.render_metrics()
+
+    # Counters of the exited worker stay in the sum, its gauges go
+    assert f'ingest_payloads_total{{status="200"}} {own + 7 + 11}' in text
+    assert 'db_pool_checked_out{pool="primary",pid="999001"} 3' in text
+    assert 'pid="999002"' not in text
+    assert f'pid="{os.getpid()}"' in text
+    assert text.count("# TYPE ingest_payloads_total counter") == 1
+
+
+def test_scrape_without_token_needs_debug_for_local_requests(app, login):
+    app.testing = False
+    try:
+        assert app.test_client().get("/metrics").status_code == 403
+        assert login("admin").get("/metrics").status_code == 200
+    finally:
+        app.testing = True
+
+
+def test_ingest_server_serves_metrics_with_the_token(app, monkeypatch):
+    from services import async_ingest, metrics
+    from services.async_ingest import DeviceRequest, IngestServer
+
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "scrape-secret")
+    monkeypatch.setattr(async_ingest, "METRICS_TOKEN", "scrape-secret")
+    server = IngestServer(app, workers=1)
+
+    def get(authorization=None):
+        headers = Headers({"Authorization": authorization} if authorization else {})
+        return asyncio.run(server.dispatch(DeviceRequest("GET", "/metrics", headers, b"", "10.0.0.5")))
+
+    assert get().status == 401
+    outcome = get("Bearer scrape-secret")
+    assert outcome.status == 200
+    assert outcome.headers["Content-Type"].startswith("text/plain")
+    assert "# TYPE db_pool_size gauge" in outcome.body
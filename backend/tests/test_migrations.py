@@ -0,0 +1,62 @@
+"""
+Migration chain: a database created by the old `db.create_all()` is stamped
+at the baseline revision and upgraded to head.
+
+Runs in a subprocess with its own SQLite file, so the session app and its
+engines are left alone.
+"""
+
+import os
+import subprocess
+import sys
+import textwrap
+
+from conftest import BACKEND_DIR
+
+UPGRADE_FROM_BASELINE = textwrap.dedent("""
+    from flask_migrate import stamp, upgrade
+    from sqlalchemy import inspect
+
+    from app import app, db
+    from db import MIGRATIONS_DIR
+    from models.models import Botiquin, BotiquinRollup, Company, Medicine
+    from services.device_auth import issue_device_key
+    from services.rollups import company_rollup
+
+    with app.app_context():
+        # The five tables create_all() used to build, then `db stamp 0001`
+        upgrade(directory=MIGRATIONS_DIR, revision="0001")
+        assert set(inspect(db.engine).get_table_names()) == {
+            "alembic_version", "companies", "users", "botiquines", "medicines", "hardware_logs"}
+        stamp(directory=MIGRATIONS_DIR, revision="0001")
+
+        upgrade(directory=MIGRATIONS_DIR)
+
+        tables = set(inspect(db.engine).get_table_names())
+        assert {"botiquin_rollups", "company_rollups", "device_keys"} <= tables, tables
+
+        # The rollup before_commit hook and device keys work on the upgraded schema
+        company = Company(name="Migrated")
+        db.session.add(company)
+        db.session.flush()
+        kit = Botiquin(hardware_id="MIGRATED_1", name="Kit", company_id=company.id, total_compartments=2)
+        db.session.add(kit)
+        db.session.flush()
+        db.session.add(Medicine(botiquin_id=kit.id, compartment_number=1, trade_name="A", generic_name="A",
+                                quantity=3))
+        issue_device_key(kit)
+        db.session.commit()
+
+        assert db.session.get(BotiquinRollup, kit.id).medicine_count == 1
+        assert company_rollup(company.id).medicine_count == 1
+    print("ok")
+""")
+
+
+def test_stamped_baseline_upgrades_to_head(tmp_path):
+    env = dict(os.environ, SQLITE_PATH=str(tmp_path / "baseline.db"))
+    result = subprocess.run([sys.executable, "-c", UPGRADE_FROM_BASELINE], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, timeout=120)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().endswith("ok")
@@ -0,0 +1,136 @@
+"""
+Medicine version conflicts (optimistic locking).
+
+A concurrent writer is simulated by bumping the medicines' version from
+another connection right before the session's first flush, i.e. between
+the read and the write of the request under test.
+"""
+
+from contextlib import contextmanager
+
+from sqlalchemy import event, text
+
+
+@contextmanager
+def concurrent_write(db, botiquin_id, times=1):
+    """Bump every medicine of the kit from another connection before the next `times` flushes."""
+    bumps = []
+
+    def bump(session, flush_context, instances):
+        if len(bumps) < times:
+            with db.engine.begin() as conn:
+                conn.execute(text("UPDATE medicines SET version = version + 1 WHERE botiquin_id = :id"),
+                             {"id": botiquin_id})
+            bumps.append(botiquin_id)
+
+    event.listen(db.session, "before_flush", bump)
+    try:
+        yield bumps
+    finally:
+        event.remove(db.session, "before_flush", bump)
+
+
+def _kit(app):
+    from models.models import Botiquin, Medicine
+
+    kit = Botiquin.query.filter(Botiquin.hardware_id.like("TEST_%_001")).first()
+    medicines = Medicine.query.filter_by(botiquin_id=kit.id).order_by(Medicine.compartment_number).all()
+    return kit, medicines
+
+
+def test_sensor_payload_is_replayed_after_version_conflict(app):
+    from db import db
+    from models.models import Medicine
+
+    client = app.test_client()
+    with app.app_context():
+        kit, medicines = _kit(app)
+        kit_id, hardware_id = kit.id, kit.hardware_id
+        first_id, versions = medicines[0].id, {m.id: m.version for m in medicines[:2]}
+        unit_weight = medicines[0].unit_weight
+
+    payload = {"hardware_id": hardware_id, "compartments": [
+        {"compartment": 1, "weight": unit_weight * 7},
+        {"compartment": 2, "weight": 0},
+    ]}
+    with app.app_context(), concurrent_write(db, kit_id) as bumps:
+        # The bump lands before compartment 2's query autoflushes compartment 1
+        response = client.post("/api/hardware/sensor_data", json=payload)
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert bumps == [kit_id]
+    with app.app_context():
+        medicine = db.session.get(Medicine, first_id)
+        # Concurrent bump + the replayed sensor update
+        assert medicine.version == versions[first_id] + 2
+        assert medicine.quantity == 7
+
+
+def test_sensor_payload_gives_up_with_409(app):
+    from db import db
+
+    client = app.test_client()
+    with app.app_context():
+        kit, _ = _kit(app)
+        kit_id, hardware_id = kit.id, kit.hardware_id
+
+    payload = {"hardware_id": hardware_id, "compartments": [{"compartment": 1, "weight": 1.0}]}
+    with app.app_context(), concurrent_write(db, kit_id, times=100):
+        response = client.post("/api/hardware/sensor_data", json=payload)
+
+    assert response.status_code == 409
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_update_medicine_returns_409_with_current_state(app, login):
+    from db import db
+    from models.models import Medicine
+
+    client = login("admin")
+    with app.app_context():
+        kit, medicines = _kit(app)
+        kit_id, med_id, version = kit.id, medicines[2].id, medicines[2].version
+
+    with app.app_context(), concurrent_write(db, kit_id):
+        response = client.put(f"/api/medicines/{med_id}", json={"brand": "Concurrent", "version": version})
+
+    assert response.status_code == 409
+    current = response.get_json()["current"]
+    assert current["id"] == med_id
+    assert current["version"] == version + 1
+    with app.app_context():
+        assert db.session.get(Medicine, med_id).brand != "Concurrent"
+
+
+def test_update_medicine_rejects_stale_version(app, login):
+    client = login("admin")
+    with app.app_context():
+        _, medicines = _kit(app)
+        med_id, version = medicines[3].id, medicines[3].version
+
+    response = client.put(f"/api/medicines/{med_id}", json={"brand": "Stale", "version": version - 1})
+
+    assert response.status_code == 409
+    assert response.get_json()["current"]["version"] == version
+
+
+def test_import_tells_version_conflicts_from_constraint_errors(app):
+    from sqlalchemy import update
+
+    from db import db
+    from models.models import Medicine
+    from services.medicine_import import _write_chunks
+
+    with app.app_context():
+        _, medicines = _kit(app)
+        stale, invalid = medicines[0], medicines[1]
+        items = [
+            (0, {"id": stale.id, "version": stale.version - 1, "quantity": 1}),
+            (1, {"id": invalid.id, "version": invalid.version, "trade_name": None}),
+        ]
+        results = [{}, {}]
+        _write_chunks(update(Medicine).execution_options(synchronize_session=False), items, results, "updated")
+        db.session.rollback()
+
+    assert results[0]["errors"] == ["Medicine was modified while importing, retry the row"]
+    assert results[1]["errors"] == ["Row violates a database constraint"]
@@ -0,0 +1,66 @@
+"""
+A saturated password pool (services/passwords.py) must turn into 503 + Retry-After
+on every route that hashes, not a 500.
+"""
+
+import pytest
+
+
+@pytest.fixture
+def busy_pool(monkeypatch):
+    import models.models
+    from services.passwords import PasswordPoolBusy
+
+    def busy(password):
+        raise PasswordPoolBusy()
+
+    monkeypatch.setattr(models.models, "hash_password", busy)
+
+
+def _assert_busy(response):
+    assert response.status_code == 503, response.get_data(as_text=True)
+    assert response.headers["Retry-After"] == "2"
+
+
+def test_create_user_while_pool_busy(login, busy_pool):
+    _assert_busy(login("admin").post("/api/users", json={
+        "username": "pool_busy_user", "password": "secret123", "user_type": "super_admin",
+    }))
+
+
+def test_update_user_password_while_pool_busy(app, login, busy_pool):
+    from models.models import User
+
+    with app.app_context():
+        user = User.query.filter_by(username="health_admin").first()
+        user_id, email = user.id, user.email
+    _assert_busy(login("admin").put(f"/api/users/{user_id}", json={"email": "changed@example.com",
+                                                                    "password": "newpass789"}))
+    with app.app_context():
+        # Nothing of the update was kept
+        assert User.query.get(user_id).email == email
+
+
+def test_change_password_while_pool_busy(login, busy_pool):
+    _assert_busy(login("admin").put("/api/profile/password", json={
+        "current_password": "admin123", "new_password": "admin456",
+    }))
+
+
+def test_login_with_outdated_hash_while_pool_busy(app, busy_pool):
+    from werkzeug.security import generate_password_hash
+
+    from db import db
+    from models.models import User
+
+    with app.app_context():
+        old_hash = generate_password_hash("oldhash123", "pbkdf2:sha256:1000")
+        db.session.add(User(username="outdated_hash_user", email="outdated@example.com", password_hash=old_hash,
+                            user_type="super_admin"))
+        db.session.commit()
+
+    response = app.test_client().post("/login", json={"username": "outdated_hash_user", "password": "oldhash123"})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    with app.app_context():
+        # Upgraded by a later login
+        assert User.query.filter_by(username="outdated_hash_user").one().password_hash == old_hash
@@ -0,0 +1,25 @@
+"""
+Pool counters must survive engine.dispose(), which replaces the pool
+(the pre-fork setup in services/startup.py disposes every engine).
+"""
+
+import pytest
+
+
+@pytest.mark.parametrize("close", [True, False])
+def test_counters_follow_the_engine_across_dispose(app, close):
+    from db import db
+    from services.pool_metrics import pool_stats
+
+    with app.app_context():
+        engine = db.engine
+        before = pool_stats()["primary"]
+        engine.dispose(close=close)
+        for _ in range(5):
+            with engine.connect() as conn:
+                conn.exec_driver_sql("SELECT 1")
+        after = pool_stats()["primary"]
+
+    assert after["connects"] >= before["connects"] + 1
+    assert after["checkouts"] >= before["checkouts"] + 5
+    assert after["wait_seconds"]["count"] >= before["wait_seconds"]["count"] + 5
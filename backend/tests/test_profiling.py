@@ -0,0 +1,62 @@
+"""
+?_profile=1 is a super-admin tool: for anyone else it must cost nothing,
+in particular no stack walk per SQL statement.
+"""
+
+import pytest
+
+
+@pytest.fixture
+def call_sites(monkeypatch):
+    import services.sql_instrumentation as sql
+
+    walks = []
+    original = sql.call_site
+
+    def counting_call_site():
+        walks.append(1)
+        return original()
+
+    monkeypatch.setattr(sql, "call_site", counting_call_site)
+    return walks
+
+
+@pytest.mark.parametrize("username", [None, "demo_admin"])
+def test_profile_flag_is_ignored_for_other_users(login, call_sites, username):
+    response = login(username).get("/api/botiquines/?_profile=1")
+    assert "X-Profile-Id" not in response.headers
+    assert call_sites == []
+
+
+def test_super_admin_request_is_profiled(login, call_sites):
+    response = login("admin").get("/api/users?_profile=1")
+    assert response.status_code == 200
+    assert response.headers["X-Profile-Id"]
+    assert call_sites
+
+
+def test_profiles_are_shared_through_the_spool_directory(tmp_path):
+    from services.profiling import ProfileStore
+
+    worker_a, worker_b = ProfileStore(str(tmp_path), size=2), ProfileStore(str(tmp_path), size=2)
+    for n in range(3):
+        worker_a.add({"id": f"p{n}", "created_at": "", "method": "GET", "path": "/", "endpoint": None,
+                      "status": 200, "user": "admin", "mode": "sample", "duration_ms": 1,
+                      "sql": {"count": 0, "db_ms": 0}})
+
+    assert worker_b.get("p2")["id"] == "p2"
+    assert worker_b.get("p0") is None
+    assert [p["id"] for p in worker_b.summaries()] == ["p2", "p1"]
+
+
+def test_streamed_response_is_profiled_until_closed(login):
+    from services.profiling import profile_store
+
+    response = login("admin").get("/api/export/botiquines?format=csv&_profile=1")
+    profile_id = response.headers["X-Profile-Id"]
+    assert profile_store.get(profile_id) is None
+
+    response.get_data()
+    response.close()
+    profile = profile_store.get(profile_id)
+    assert profile["sql"]["count"] >= 1
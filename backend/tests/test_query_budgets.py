@@ -0,0 +1,316 @@
+"""
+Query budgets: every route runs against the seeded dataset and must stay
+within its declared number of SQL statements and its serialization time
+(request wall time minus DB time).
+
+Statements are counted with services/sql_instrumentation.py. On failure the
+test prints every statement with its call site, plus the shapes that
+repeated (likely N+1). Caches are cleared before each request so the cold
+path is measured.
+
+- QUERY_BUDGET_TIME_FACTOR=2   scales every time budget (slow CI machines)
+- QUERY_BUDGET_REPORT=1        prints actual vs budget for every route (-s)
+"""
+
+import os
+import time
+import uuid
+from collections import namedtuple
+
+import pytest
+
+TIME_FACTOR = float(os.getenv("QUERY_BUDGET_TIME_FACTOR", "1"))
+REPORT = os.getenv("QUERY_BUDGET_REPORT", "").lower() in ("1", "true", "yes")
+
+Budget = namedtuple(
+    "Budget",
+    "endpoint method path user max_queries max_ms json data setup fresh stream",
+    defaults=(None, None, None, False, False),
+)
+
+
+# -------- Setup helpers (run before the measured request) --------
+def _unique(prefix):
+    return f"{prefix}_{uuid.uuid4().hex[:8]}"
+
+
+def _new_kit(db, company_id=1, medicines=0):
+    from models.models import Botiquin, Medicine
+
+    kit = Botiquin(hardware_id=_unique("KIT"), name="Budget kit", company_id=company_id, total_compartments=4)
+    db.session.add(kit)
+    db.session.flush()
+    for compartment in range(1, medicines + 1):
+        db.session.add(Medicine(botiquin_id=kit.id, compartment_number=compartment, trade_name="Budget",
+                                generic_name="Budget", quantity=5, reorder_level=2))
+    db.session.commit()
+    return kit
+
+
+def _kit_with_medicines(db):
+    return {"id": _new_kit(db, medicines=4).id}
+
+
+def _empty_kit(db):
+    return {"id": _new_kit(db).id}
+
+
+def _unassigned_kit(db):
+    return {"id": _new_kit(db, company_id=None).id}
+
+
+def _loose_medicine(db):
+    from models.models import Medicine
+
+    medicine = Medicine(botiquin_id=1, trade_name="Loose", generic_name="Loose", quantity=1, reorder_level=1)
+    db.session.add(medicine)
+    db.session.commit()
+    return {"id": medicine.id}
+
+
+def _company(db):
+    from models.models import Company
+
+    company = Company(name=_unique("Budget Co"))
+    db.session.add(company)
+    db.session.commit()
+    return {"id": company.id}
+
+
+def _current_company_rollup(db):
+    from services.rollups import company_rollup
+
+    company_rollup(1)
+    return {}
+
+
+def _invalidated_company_rollup(db):
+    from services.rollups import invalidate_companies
+
+    _current_company_rollup(db)
+    invalidate_companies({1})
+    db.session.commit()
+    return {}
+
+
+def _user(db):
+    from models.models import User
+
+    user = User(username=_unique("budget_user"), user_type="company_admin", company_id=1)
+    user.password_hash = "not-a-login-account"
+    db.session.add(user)
+    db.session.commit()
+    return {"id": user.id}
+
+
+def _names(db):
+    return {"name": _unique("budget")}
+
+
+def _profile(db):
+    from flask import current_app
+
+    client = current_app.test_client()
+    client.post("/login", json={"username": "admin", "password": "admin123"})
+    response = client.get("/api/users?_profile=1")
+    return {"id": response.headers["X-Profile-Id"]}
+
+
+# -------- Budgets --------
+# Counts include the session user load (cold principal cache). Time budgets of
+# the login/password routes include scrypt hashing.
+BUDGETS = [
+    Budget("health", "GET", "/health", None, 0, 20),
+
+    # users
+    Budget("users.login", "GET", "/login", None, 0, 100),
+    Budget("users.login", "POST", "/login", None, 4, 500,
+           json={"username": "demo_admin", "password": "password123"}, fresh=True),
+    Budget("users.logout", "GET", "/logout", "demo_admin", 1, 50, fresh=True),
+    Budget("users.list_users", "GET", "/api/users", "admin", 2, 100),
+    Budget("users.create_user", "POST", "/api/users", "admin", 6, 500, setup=_names,
+           json={"username": "{name}", "password": "pw123456", "email": "{name}@example.com",
+                 "user_type": "company_admin", "company_id": 1}),
+    Budget("users.get_user", "GET", "/api/users/2", "admin", 3, 50),
+    Budget("users.update_user", "PUT", "/api/users/{id}", "admin", 5, 100, setup=_user,
+           json={"email": "updated_{id}@example.com"}),
+    Budget("users.delete_user", "DELETE", "/api/users/{id}", "admin", 4, 50, setup=_user),
+    Budget("users.get_profile", "GET", "/api/profile", "demo_admin", 3, 50),
+    Budget("users.change_password", "PUT", "/api/profile/password", "health_admin", 3, 750,
+           json={"current_password": "healthpass456", "new_password": "healthpass456"}),
+    Budget("users.check_auth", "GET", "/api/auth/check", "demo_admin", 1, 50),
+
+    # pages
+    Budget("pages.index", "GET", "/", "demo_admin", 1, 50),
+    Budget("pages.dashboard", "GET", "/dashboard", "demo_admin", 3, 250),
+    Budget("pages.dashboard", "GET", "/dashboard", "admin", 4, 250),
+    Budget("pages.botiquin_detail", "GET", "/botiquin/1", "demo_admin", 4, 150),
+    Budget("pages.botiquin_inventory", "GET", "/botiquin/1/inventory", "demo_admin", 9, 150),
+    Budget("pages.inventory", "GET", "/inventory", "demo_admin", 8, 250),
+    Budget("pages.inventory", "GET", "/inventory?status=EXPIRED", "admin", 8, 250),
+    Budget("pages.companies", "GET", "/companies", "admin", 2, 150),
+    Budget("pages.assign_botiquines", "GET", "/botiquines/assign", "admin", 2, 150),
+    Budget("pages.assign_single_botiquin", "GET", "/botiquin/{id}/assign", "admin", 3, 100, setup=_unassigned_kit),
+    Budget("pages.assign_single_botiquin", "POST", "/botiquin/{id}/assign", "admin", 9, 100, setup=_unassigned_kit,
+           data={"company_id": "1"}),
+
+    # botiquines
+    Budget("botiquines.list_botiquines", "GET", "/api/botiquines/", "admin", 3, 150),
+    Budget("botiquines.create_botiquin", "POST", "/api/botiquines/", "admin", 12, 100, setup=_names,
+           json={"hardware_id": "{name}", "name": "Budget", "total_compartments": 4, "company_id": 1}),
+    Budget("botiquines.get_botiquin", "GET", "/api/botiquines/1", "demo_admin", 4, 50),
+    Budget("botiquines.get_compartments", "GET", "/api/botiquines/1/compartments", "demo_admin", 3, 50),
+    Budget("botiquines.update_botiquin", "PUT", "/api/botiquines/{id}", "admin", 10, 100, setup=_empty_kit,
+           json={"location": "Sala"}),
+    Budget("botiquines.delete_botiquin", "DELETE", "/api/botiquines/{id}", "admin", 12, 100,
+           setup=_kit_with_medicines),
+    Budget("botiquines.sync_botiquin", "POST", "/api/botiquines/1/sync", "demo_admin", 9, 100),
+    Budget("botiquines.get_botiquin_stats", "GET", "/api/botiquines/1/stats", "demo_admin", 3, 50),
+
+    # companies
+    Budget("companies.list_companies", "GET", "/api/comapnies/", "admin", 2, 100),
+    Budget("companies.create_company", "POST", "/api/comapnies/", "admin", 5, 100, setup=_names,
+           json={"name": "{name}", "contact_email": "{name}@example.com"}),
+    Budget("companies.get_company", "GET", "/api/comapnies/1", "demo_admin", 3, 50),
+    Budget("companies.update_company", "PUT", "/api/comapnies/{id}", "admin", 5, 100, setup=_company,
+           json={"contact_phone": "555-0100"}),
+    Budget("companies.delete_company", "DELETE", "/api/comapnies/{id}", "admin", 6, 100, setup=_company),
+    Budget("companies.get_company_stats", "GET", "/api/comapnies/1/stats", "demo_admin", 6, 100,
+           setup=_current_company_rollup),
+    # Earlier writes (kits added, moved) invalidated the row: summed and upserted on read
+    Budget("companies.get_company_stats", "GET", "/api/comapnies/1/stats", "demo_admin", 12, 100,
+           setup=_invalidated_company_rollup),
+    Budget("companies.get_company_botiquines", "GET", "/api/comapnies/1/botiquines", "demo_admin", 3, 100),
+    Budget("companies.get_company_users", "GET", "/api/comapnies/1/users", "demo_admin", 3, 50),
+    Budget("companies.get_company_alerts", "GET", "/api/comapnies/1/alerts", "demo_admin", 4, 150),
+
+    # medicines
+    Budget("medicines.list_medicines", "GET", "/api/medicines/", "demo_admin", 2, 250),
+    Budget("medicines.list_medicines_by_botiquin", "GET", "/api/medicines/botiquin/1", "demo_admin", 5, 50),
+    Budget("medicines.filter_medicines", "GET", "/api/medicines/filter?status=EXPIRED", "demo_admin", 2, 150),
+    Budget("medicines.get_alerts", "GET", "/api/medicines/alerts", "demo_admin", 2, 150),
+    Budget("medicines.create_medicine", "POST", "/api/medicines/", "demo_admin", 10, 100, setup=_empty_kit,
+           json={"botiquin_id": "{id}", "compartment_number": 1, "trade_name": "Budget", "generic_name": "Budget",
+                 "strength": "1 mg", "expiry_date": "2030-01-01", "quantity": 3, "reorder_level": 1}),
+    Budget("medicines.bulk_import_medicines", "POST", "/api/medicines/bulk", "demo_admin", 18, 150,
+           setup=_kit_with_medicines,
+           json=[{"botiquin_id": "{id}", "compartment_number": c, "quantity": 9} for c in range(1, 5)]
+           + [{"botiquin_id": 1, "trade_name": "Bulk", "generic_name": "Bulk", "strength": "1 mg",
+               "expiry_date": "2030-01-01", "quantity": 2, "reorder_level": 1} for _ in range(20)]),
+    Budget("medicines.get_medicine", "GET", "/api/medicines/1", "demo_admin", 3, 50),
+    Budget("medicines.update_medicine", "PUT", "/api/medicines/{id}", "demo_admin", 10, 100, setup=_loose_medicine,
+           json={"quantity": 3}),
+    Budget("medicines.delete_medicine", "DELETE", "/api/medicines/{id}", "demo_admin", 8, 100,
+           setup=_loose_medicine),
+    Budget("medicines.update_medicine_weight", "POST", "/api/medicines/1/update_weight", "demo_admin", 10, 100,
+           json={"weight": 9.9}),
+
+    # hardware
+    Budget("hardware.receive_sensor_data", "POST", "/api/hardware/sensor_data", None, 21, 100,
+           json={"hardware_id": "BOT_DEMO_COMP",
+                 "compartments": [{"compartment": c, "weight": 5.0} for c in range(1, 5)]}),
+    Budget("hardware.get_hardware_logs", "GET", "/api/hardware/logs", "demo_admin", 2, 100),
+    Budget("hardware.get_rate_limit_stats", "GET", "/api/hardware/rate_limits", "admin", 1, 50),
+    Budget("hardware.test_hardware_connection", "POST", "/api/hardware/test_connection", None, 1, 50,
+           json={"hardware_id": "BOT_DEMO_COMP"}),
+    Budget("hardware.register_hardware", "POST", "/api/hardware/register_hardware", "admin", 11, 100, setup=_names,
+           json={"hardware_id": "{name}", "name": "Budget", "compartments": 4}),
+
+    # exports (streamed; the whole body is consumed)
+    Budget("exports.export_medicines", "GET", "/api/export/medicines", "demo_admin", 2, 500),
+    Budget("exports.export_botiquines", "GET", "/api/export/botiquines?format=csv", "admin", 2, 250),
+    Budget("exports.export_hardware_logs", "GET", "/api/export/hardware_logs", "demo_admin", 2, 500),
+
+    # events (only the work before the stream starts)
+    Budget("events.stream", "GET", "/api/events/stream?botiquin_id=1", "demo_admin", 2, 50, stream=True),
+
+    # metrics
+    Budget("metrics.get_pool_metrics", "GET", "/api/metrics/pool", "admin", 1, 50),
+    Budget("metrics.list_profiles", "GET", "/api/metrics/profiles", "admin", 1, 50, setup=_profile),
+    Budget("metrics.get_profile", "GET", "/api/metrics/profiles/{id}", "admin", 1, 50, setup=_profile),
+    Budget("metrics.get_profile_folded", "GET", "/api/metrics/profiles/{id}/folded", "admin", 1, 50,
+           setup=_profile),
+    Budget("prometheus.scrape", "GET", "/metrics", None, 0, 50),
+]
+
+
+# -------- Helpers --------
+def _fill(value, params):
+    if isinstance(value, str):
+        filled = value.format(**params)
+        return int(filled) if value.startswith("{") and filled.isdigit() else filled
+    if isinstance(value, dict):
+        return {key: _fill(item, params) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_fill(item, params) for item in value]
+    return value
+
+
+def _report(budget, stats, app_ms):
+    lines = [
+        f"{budget.method} {budget.path}: {stats.count} statements (budget {budget.max_queries}), "
+        f"{app_ms:.1f} ms serialization (budget {budget.max_ms * TIME_FACTOR:.0f} ms), "
+        f"{stats.db_time * 1000:.1f} ms in the database",
+        "",
+    ]
+    for n, (statement, duration, site) in enumerate(stats.queries, 1):
+        lines.append(f"  {n:>3}. {duration * 1000:7.2f} ms  {site or '?'}")
+        lines.append(f"       {' '.join(statement.split())[:400]}")
+    for item in stats.repeated(threshold=2):
+        lines.append(f"  repeated x{item['count']} from {', '.join(item['call_sites']) or '?'}:")
+        lines.append(f"       {item['shape'][:400]}")
+    return "\n".join(lines)
+
+
+def _budget_id(budget):
+    return f"{budget.method} {budget.path}"
+
+
+# -------- Tests --------
+def test_every_route_has_a_budget(app):
+    declared = {(b.endpoint, b.method) for b in BUDGETS}
+    missing = sorted(
+        f"{rule.endpoint} {method} {rule.rule}"
+        for rule in app.url_map.iter_rules()
+        if rule.endpoint != "static"
+        for method in rule.methods - {"HEAD", "OPTIONS"}
+        if (rule.endpoint, method) not in declared
+    )
+    assert not missing, "Routes without a query budget:\n" + "\n".join(missing)
+
+
+@pytest.mark.parametrize("budget", BUDGETS, ids=_budget_id)
+def test_query_budget(app, login, budget):
+    from db import db
+    from services import session_cache
+    from services.fragment_cache import fragment_cache
+    from services.sql_instrumentation import capture_queries
+
+    params = {}
+    if budget.setup is not None:
+        with app.app_context():
+            params = budget.setup(db)
+
+    client = login(budget.user, fresh=budget.fresh)
+
+    fragment_cache.clear()
+    session_cache.clear()
+
+    with capture_queries() as stats:
+        start = time.perf_counter()
+        response = client.open(_fill(budget.path, params), method=budget.method,
+                               json=_fill(budget.json, params), data=_fill(budget.data, params))
+        if budget.stream:
+            response.close()
+        else:
+            response.get_data()
+        elapsed = time.perf_counter() - start
+
+    app_ms = (elapsed - stats.db_time) * 1000
+    if REPORT:
+        print(f"\n{budget.method:<6} {budget.path:<45} {response.status_code} "
+              f"queries {stats.count:>3}/{budget.max_queries:<3} app {app_ms:7.1f}/{budget.max_ms} ms")
+
+    assert response.status_code < 400, f"{response.status_code}: {response.get_data(as_text=True)[:500]}"
+    assert stats.count <= budget.max_queries, _report(budget, stats, app_ms)
+    assert app_ms <= budget.max_ms * TIME_FACTOR, _report(budget, stats, app_ms)
@@ -0,0 +1,58 @@
+"""
+Device rate limiting: bounded in-process buckets, and unsigned requests
+(HARDWARE_AUTH=optional) keyed by client address rather than payload.
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+
+def _unsigned(hardware_id, remote_addr):
+    payload = {"hardware_id": hardware_id}
+    return SimpleNamespace(get_json=lambda silent=False: payload, remote_addr=remote_addr)
+
+
+@pytest.fixture
+def device_limiter(monkeypatch):
+    from services import ingest
+    from services.rate_limit import MemoryBucketStore, RateLimiter
+
+    limiter = RateLimiter(MemoryBucketStore(), {"device": (0.001, 3), "company": (0.001, 100)})
+    monkeypatch.setattr(ingest, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ingest, "limiter", limiter)
+    return limiter
+
+
+def test_memory_store_evicts_least_recently_used():
+    from services.rate_limit import MemoryBucketStore
+
+    store = MemoryBucketStore(max_keys=3)
+    for key in ("a", "b", "c"):
+        store.take(key, 0.001, 1, now=0)
+    store.take("a", 0.001, 1, now=1)   # "a" is now the most recent, and empty
+    store.take("d", 0.001, 1, now=2)
+
+    assert len(store) == 3
+    assert "b" not in store._buckets
+    assert store.take("a", 0.001, 1, now=3) is not None
+
+
+def test_random_hardware_ids_share_the_address_bucket(app, device_limiter):
+    from services.ingest import rate_limit_device_request
+
+    with app.app_context():
+        outcomes = [rate_limit_device_request(_unsigned(f"FAKE_{n}", "10.0.0.9"), None) for n in range(5)]
+
+    assert [o.status if o else None for o in outcomes] == [None, None, None, 429, 429]
+    assert len(device_limiter.store) == 1
+
+
+def test_spoofed_hardware_id_does_not_drain_the_real_kit(app, device_limiter):
+    from services.ingest import rate_limit_device_request
+
+    with app.app_context():
+        for _ in range(5):
+            rate_limit_device_request(_unsigned("TEST_FREE_0", "10.0.0.66"), None)
+        assert rate_limit_device_request(_unsigned("TEST_FREE_0", "10.0.0.66"), None).status == 429
+        assert rate_limit_device_request(_unsigned("TEST_FREE_0", "10.0.0.10"), None) is None
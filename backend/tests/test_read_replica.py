@@ -0,0 +1,76 @@
+"""
+Read-replica routing (services/db_routing.py) against two SQLite files: the
+replica is a copy of the primary whose rows are then left behind, so every
+read shows which database answered it.
+
+Runs in a subprocess, like test_migrations.py: the replica bind is registered
+when the app is created, and the session app has none.
+"""
+
+import os
+import subprocess
+import sys
+import textwrap
+
+from conftest import BACKEND_DIR
+
+ROUTE_READS_AND_WRITES = textwrap.dedent("""
+    import os
+    import sqlite3
+
+    import seed
+    from app import app, db
+    from models.models import Company
+    from services.db_routing import reads_from
+
+    def company_name(path, company_id):
+        with sqlite3.connect(path) as conn:
+            return conn.execute("SELECT name FROM companies WHERE id = ?", (company_id,)).fetchone()[0]
+
+    primary_path, replica_path = os.environ["SQLITE_PATH"], os.environ["REPLICA_PATH"]
+    seed.init_db()
+    with app.app_context():
+        company_id = Company.query.filter_by(name="Demo Company").one().id
+        db.session.remove()
+        db.engine.dispose()
+    with sqlite3.connect(primary_path) as src, sqlite3.connect(replica_path) as dst:
+        src.backup(dst)
+        src.execute("UPDATE companies SET name = 'Demo Company (primary)' WHERE id = ?", (company_id,))
+
+    client = app.test_client()
+    assert client.post("/login", json={"username": "admin", "password": "admin123"}).status_code == 200
+    with client.session_transaction() as flask_session:
+        flask_session.pop("_db_primary_until", None)   # the login wrote last_login
+
+    # GET routes read from the replica
+    url = f"/api/comapnies/{company_id}"
+    assert client.get(url).get_json()["name"] == "Demo Company"
+
+    # Writes go to the primary only
+    assert client.put(url, json={"name": "Renamed"}).status_code == 200
+    assert company_name(primary_path, company_id) == "Renamed"
+    assert company_name(replica_path, company_id) == "Demo Company"
+
+    # The writer's next GET sticks to the primary
+    assert client.get(url).get_json()["name"] == "Renamed"
+
+    # reads_from() overrides routing inside a GET request
+    with app.test_request_context(url, method="GET"):
+        assert db.session.get(Company, company_id).name == "Demo Company"
+        db.session.expunge_all()
+        with reads_from("primary"):
+            assert db.session.get(Company, company_id).name == "Renamed"
+        db.session.remove()
+    print("ok")
+""")
+
+
+def test_reads_use_the_replica_and_writes_the_primary(tmp_path):
+    replica_path = str(tmp_path / "replica.db")
+    env = dict(os.environ, SQLITE_PATH=str(tmp_path / "primary.db"), REPLICA_PATH=replica_path,
+               DATABASE_READ_URL=f"sqlite:///{replica_path}")
+    result = subprocess.run([sys.executable, "-c", ROUTE_READS_AND_WRITES], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, timeout=120)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().endswith("ok")
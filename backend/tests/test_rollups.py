@@ -0,0 +1,119 @@
+"""
+Rollup freshness across days: expiry-based counts move with the calendar,
+so a company total must never be summed from kit rows of an earlier day.
+"""
+
+from datetime import date, timedelta
+
+
+def _expected_expired(company_id):
+    from models.models import Botiquin, Medicine
+
+    medicines = Medicine.query.join(Botiquin).filter(Botiquin.company_id == company_id, Botiquin.active.is_(True))
+    return sum(1 for m in medicines if m.status() == "EXPIRED")
+
+
+def _age_rollups(db, company_id):
+    """Make the company's rollups look computed yesterday, with yesterday's (here: wrong) expiry counts."""
+    from models.models import BotiquinRollup, CompanyRollup
+
+    yesterday = date.today() - timedelta(days=1)
+    BotiquinRollup.query.filter_by(company_id=company_id).update({"computed_on": yesterday, "expired": 0})
+    CompanyRollup.query.filter_by(company_id=company_id).update({"computed_on": yesterday, "expired": 0})
+    db.session.commit()
+
+
+def test_first_write_of_the_day_leaves_the_company_to_its_reader(app):
+    from db import db
+    from models.models import Botiquin, CompanyRollup, Medicine
+    from services.rollups import company_rollup
+
+    with app.app_context():
+        kit = Botiquin.query.filter(Botiquin.hardware_id.like("TEST_%_002")).first()
+        company_id = kit.company_id
+        _age_rollups(db, company_id)
+
+        # One kit changes: the before-commit hook refreshes it, but no delta is
+        # added to a company row summed from yesterday's kit rows
+        medicine = Medicine.query.filter_by(botiquin_id=kit.id).first()
+        medicine.brand = "First write today"
+        db.session.commit()
+        assert db.session.get(CompanyRollup, company_id).is_stale()
+
+        assert company_rollup(company_id).expired == _expected_expired(company_id) > 0
+
+
+def test_concurrent_writers_on_sibling_kits_add_up(app):
+    from sqlalchemy import event, text
+
+    from db import db
+    from models.models import Botiquin, Medicine
+    from services.rollups import company_rollup
+
+    with app.app_context():
+        kit = Botiquin.query.filter(Botiquin.hardware_id.like("TEST_%_004")).first()
+        company_id = kit.company_id
+        items = company_rollup(company_id).items_in_stock
+
+        def sibling_writer(session, flush_context, instances):
+            # Another kit's writer commits its +7 delta after this session read its state
+            with db.engine.begin() as conn:
+                conn.execute(text("UPDATE company_rollups SET items_in_stock = items_in_stock + 7 "
+                                  "WHERE company_id = :id"), {"id": company_id})
+
+        medicine = Medicine.query.filter_by(botiquin_id=kit.id).first()
+        medicine.quantity += 3
+        event.listen(db.session, "before_flush", sibling_writer, once=True)
+        db.session.commit()
+
+        assert company_rollup(company_id).items_in_stock == items + 7 + 3
+
+
+def test_kit_moves_invalidate_both_companies(app):
+    from db import db
+    from models.models import Botiquin, Company, CompanyRollup
+    from services.rollups import company_rollup
+
+    with app.app_context():
+        kit = Botiquin.query.filter(Botiquin.hardware_id.like("TEST_%_005")).first()
+        source = kit.company_id
+        target = Company.query.filter(Company.id != source).first().id
+        counts = {cid: company_rollup(cid).botiquin_count for cid in (source, target)}
+
+        kit.company_id = target
+        db.session.commit()
+        assert db.session.get(CompanyRollup, source).is_stale()
+        assert db.session.get(CompanyRollup, target).is_stale()
+        assert company_rollup(source).botiquin_count == counts[source] - 1
+        assert company_rollup(target).botiquin_count == counts[target] + 1
+
+        kit.company_id = source
+        db.session.commit()
+
+
+def test_missing_company_rollup_is_upserted(app):
+    from db import db
+    from models.models import Botiquin, CompanyRollup
+    from services.rollups import company_rollup, refresh_companies
+
+    with app.app_context():
+        company_id = Botiquin.query.filter(Botiquin.hardware_id.like("TEST_%_006")).first().company_id
+        CompanyRollup.query.filter_by(company_id=company_id).delete()
+        db.session.commit()
+
+        # Two first readers: the second one updates the row the first inserted
+        refresh_companies({company_id})
+        refresh_companies({company_id})
+        assert company_rollup(company_id).expired == _expected_expired(company_id)
+
+
+def test_stale_company_rollup_is_recomputed_on_read(app):
+    from db import db
+    from models.models import Botiquin
+    from services.rollups import company_rollup
+
+    with app.app_context():
+        company_id = Botiquin.query.filter(Botiquin.hardware_id.like("TEST_%_003")).first().company_id
+        _age_rollups(db, company_id)
+
+        assert company_rollup(company_id).expired == _expected_expired(company_id) > 0
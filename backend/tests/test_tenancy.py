@@ -0,0 +1,64 @@
+"""
+Tenant boundaries of the medicine weight hook (POST /api/medicines/<id>/update_weight):
+a logged-in user within their company, or a signed device for its own kit.
+"""
+
+import json
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def kits(app):
+    """(kit id, medicine id, key_id, secret) for one kit of each seeded company."""
+    from db import db
+    from models.models import Botiquin, Company, Medicine
+    from services.device_auth import issue_device_key
+
+    result = {}
+    with app.app_context():
+        for name in ("Demo Company", "Health Corp"):
+            company = Company.query.filter_by(name=name).first()
+            # A kit from conftest's dataset (budget setups add kits without medicines)
+            kit = (Botiquin.query.filter(Botiquin.company_id == company.id, Botiquin.hardware_id.like("TEST_%"))
+                   .order_by(Botiquin.id.desc()).first())
+            medicine = Medicine.query.filter_by(botiquin_id=kit.id).first()
+            key, secret = issue_device_key(kit)
+            db.session.commit()
+            result[name] = (kit.id, medicine.id, key.key_id, secret)
+    return result
+
+
+def _signed_post(app, key_id, secret, med_id, weight):
+    from services.device_auth import sign_request
+
+    path = f"/api/medicines/{med_id}/update_weight"
+    body = json.dumps({"weight": weight}).encode()
+    headers = sign_request(key_id, secret, "POST", path, body)
+    return app.test_client().post(path, data=body, content_type="application/json", headers=headers)
+
+
+def test_weight_hook_requires_authentication(app, kits):
+    _, med_id, _, _ = kits["Demo Company"]
+    response = app.test_client().post(f"/api/medicines/{med_id}/update_weight", json={"weight": 1.0})
+    assert response.status_code == 401
+
+
+def test_weight_hook_is_scoped_to_the_users_company(login, kits):
+    _, own_id, _, _ = kits["Demo Company"]
+    _, other_id, _, _ = kits["Health Corp"]
+    client = login("demo_admin")
+    assert client.post(f"/api/medicines/{other_id}/update_weight", json={"weight": 1.0}).status_code == 404
+    assert client.post(f"/api/medicines/{own_id}/update_weight", json={"weight": 1.0}).status_code == 200
+
+
+def test_signed_device_updates_only_its_own_kit(app, kits):
+    _, own_id, key_id, secret = kits["Demo Company"]
+    _, other_id, _, _ = kits["Health Corp"]
+    assert _signed_post(app, key_id, secret, own_id, 2.0).status_code == 200
+    assert _signed_post(app, key_id, secret, other_id, 2.0).status_code == 404
+
+
+def test_bad_device_signature_is_rejected(app, kits):
+    _, med_id, key_id, _ = kits["Demo Company"]
+    assert _signed_post(app, key_id, "not-the-secret", med_id, 2.0).status_code == 401
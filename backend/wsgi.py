@@ -0,0 +1,14 @@
+"""
+Production WSGI entry point for pre-fork servers.
+
+Builds the app, then warms it once in the master process (mappers, templates,
+database check) and freezes the GC before the workers fork; see
+services/startup.py. Used by gunicorn.conf.py:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from app import app
+from services.startup import prepare_for_fork
+
+prepare_for_fork(app)